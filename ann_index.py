@@ -0,0 +1,398 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+
+from embedding_store import open_embeddings
+from search_papers import EMBEDDINGS_FILE, PAPERS_FILE, load_metadata, normalize_rows, top_k, print_results
+
+# 默认的索引目录
+INDEX_DIR = "paper_embeddings.ivfpq"
+INDEX_VERSION = 1
+# 每个子空间的码本大小，编码用 uint8
+KSUB = 256
+# 训练聚类时最多采样的向量数
+TRAIN_SIZE = 65536
+BLOCK_SIZE = 65536
+
+
+def nearest(data, centroids, block_size=BLOCK_SIZE):
+    """每个向量最近的中心（欧氏距离），按块计算避免生成 N x K 的大矩阵"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assign = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), block_size):
+        block = np.asarray(data[start:start + block_size], dtype=np.float32)
+        # ||x - c||^2 = ||x||^2 - 2x·c + ||c||^2，||x||^2 与 c 无关可以省掉
+        assign[start:start + len(block)] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return assign
+
+
+def kmeans(data, k, iters=20, seed=0):
+    """朴素的 Lloyd k-means，空簇重新随机取点"""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = nearest(data, centroids)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=k)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+def default_subspaces(dim):
+    """默认每个子空间 8 维（384 维的模型即 48 个子空间，每条向量 48 字节）"""
+    for dsub in (8, 4, 2, 1):
+        if dim % dsub == 0:
+            return dim // dsub
+
+
+class IVFPQIndex:
+    """
+    IVF-PQ 近似最近邻索引：先用 nlist 个粗聚类中心把向量分桶（倒排表），
+    桶内存储残差的乘积量化编码（每个子空间 1 字节）。检索时只扫描最近的 nprobe 个桶，
+    用查表法估计内积，再用原始向量对前 rerank 个候选精确重排。
+    索引只保存嵌入存储的行号，重排和结果展示都回到嵌入存储读取。
+    """
+
+    def __init__(self, path, embeddings_file=EMBEDDINGS_FILE):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(f"不支持的索引版本: {self.meta['version']}")
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.codebooks = np.load(os.path.join(path, "codebooks.npy"))
+        # 每段一组按桶排序的 (编码, 行号, 桶偏移)；update 追加的行写成新段
+        self.segments = [(np.load(segment_file(path, 'codes', i), mmap_mode='r'),
+                          np.load(segment_file(path, 'ids', i), mmap_mode='r'),
+                          np.load(segment_file(path, 'offsets', i)))
+                         for i in range(self.meta.get('segments', 1))]
+
+        self.store = open_embeddings(embeddings_file)
+        if self.store.model_name != self.meta['model'] or self.store.dim != self.meta['dim']:
+            raise ValueError(f"索引属于模型 {self.meta['model']}（{self.meta['dim']} 维），与 {embeddings_file} 不一致")
+        # 同一主键写入多次时只有最后一行有效，其余行在检索时跳过
+        self.live = np.zeros(len(self.store), dtype=bool)
+        self.live[list(self.store.index.values())] = True
+
+    def __len__(self):
+        return self.meta['count']
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def _vectors(self, rows):
+        vectors = self.store.vectors(rows)
+        return vectors if self.store.normalized else normalize_rows(vectors)
+
+    def search(self, queries, k=10, nprobe=16, rerank=100):
+        """
+        近似 top-k，queries 为已归一化的 (查询数, 维度) 矩阵。
+        nprobe 越大召回越高、越慢；rerank 为用原始向量精确重排的候选数（0 表示不重排）。
+        返回与 search_papers.top_k 相同形状的 (分数, 行号)，不足 k 条时用 -inf / -1 补齐。
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        m, ksub, dsub = self.codebooks.shape
+        nprobe = min(nprobe, self.nlist)
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        # 展平查表时每个子空间的起始位置
+        table_offsets = np.arange(m) * ksub
+
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for qi, query in enumerate(queries):
+            # 内积可以按子空间拆开：q·(c + y) = q·c + Σ q_j·y_j，查表只依赖查询本身
+            table = np.einsum('md,mkd->mk', query.reshape(m, dsub), self.codebooks).ravel()
+            lists = probes[qi]
+            code_parts, row_parts, coarse_parts = [], [], []
+            for codes, ids, offsets in self.segments:
+                starts, ends = offsets[lists], offsets[lists + 1]
+                if not (ends - starts).sum():
+                    continue
+                code_parts.append(np.concatenate([codes[s:e] for s, e in zip(starts, ends)]))
+                row_parts.append(np.concatenate([ids[s:e] for s, e in zip(starts, ends)]))
+                coarse_parts.append(np.repeat(coarse[qi, lists], ends - starts))
+            if not row_parts:
+                continue
+            codes = np.concatenate(code_parts)
+            rows = np.concatenate(row_parts)
+            scores = np.concatenate(coarse_parts) + table[codes + table_offsets].sum(axis=1)
+
+            valid = self.live[rows]
+            scores, rows = scores[valid], rows[valid]
+            keep = max(k, rerank)
+            if len(scores) > keep:
+                part = np.argpartition(-scores, keep - 1)[:keep]
+                scores, rows = scores[part], rows[part]
+            if rerank:
+                order = np.argsort(rows)
+                rows = rows[order]
+                scores = self._vectors(rows) @ query
+            order = np.argsort(-scores, kind='stable')[:k]
+            out_scores[qi, :len(order)] = scores[order]
+            out_rows[qi, :len(order)] = rows[order]
+        return out_scores, out_rows
+
+    def search_keys(self, keys, k=10, nprobe=16, rerank=100):
+        """"与论文 X 相似的论文"：用已存储的向量做查询，结果中去掉论文自身"""
+        rows = [self.store.index[key] for key in keys]
+        scores, hits = self.search(self._vectors(rows), k + 1, nprobe, rerank)
+        results = []
+        for row, query_scores, query_rows in zip(rows, scores, hits):
+            keep = query_rows != row
+            results.append((query_scores[keep][:k], query_rows[keep][:k]))
+        return results
+
+
+def encode_pq(residuals, codebooks):
+    """残差向量 -> 每个子空间最近码字的编号"""
+    m, _, dsub = codebooks.shape
+    codes = np.empty((len(residuals), m), dtype=np.uint8)
+    for j in range(m):
+        codes[:, j] = nearest(residuals[:, j * dsub:(j + 1) * dsub], codebooks[j])
+    return codes
+
+
+def encode_rows(store, rows, centroids, codebooks, block_size=BLOCK_SIZE):
+    """按块把嵌入存储中的若干行编码成 (所属桶, PQ编码)"""
+    lists = np.empty(len(rows), dtype=np.int64)
+    codes = np.empty((len(rows), codebooks.shape[0]), dtype=np.uint8)
+    for start in range(0, len(rows), block_size):
+        block = store.vectors(rows[start:start + block_size])
+        if not store.normalized:
+            block = normalize_rows(block)
+        block_lists = nearest(block, centroids)
+        lists[start:start + len(block)] = block_lists
+        codes[start:start + len(block)] = encode_pq(block - centroids[block_lists], codebooks)
+    return lists, codes
+
+
+def segment_file(path, name, segment):
+    """第 0 段沿用 codes.npy 等文件名，追加的段为 codes.<段号>.npy"""
+    return os.path.join(path, f"{name}.npy" if segment == 0 else f"{name}.{segment}.npy")
+
+
+def keys_digest(keys):
+    """已索引行的主键摘要：追加前用它确认嵌入存储的前 count 行没有变化"""
+    sha = hashlib.sha256()
+    for key in keys:
+        sha.update(key.encode('utf-8') + b'\n')
+    return sha.hexdigest()
+
+
+def _save_segment(path, segment, nlist, lists, codes, ids):
+    """把一批编码按桶排序后写成一段"""
+    order = np.argsort(lists, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=nlist))]).astype(np.int64)
+    np.save(segment_file(path, 'codes', segment), codes[order])
+    np.save(segment_file(path, 'ids', segment), ids[order])
+    np.save(segment_file(path, 'offsets', segment), offsets)
+
+
+def _write_meta(path, meta):
+    tmp_file = os.path.join(path, "meta.json.part")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, os.path.join(path, "meta.json"))
+
+
+def _save_index(path, meta, centroids, codebooks, lists, codes, ids):
+    """写入只有一段的索引；先写到临时目录，完成后整体替换"""
+    tmp_path = path.rstrip('/\\') + '.part'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "centroids.npy"), centroids)
+    np.save(os.path.join(tmp_path, "codebooks.npy"), codebooks)
+    _save_segment(tmp_path, 0, len(centroids), lists, codes, ids)
+    _write_meta(tmp_path, dict(meta, segments=1))
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+def build_index(embeddings_file=EMBEDDINGS_FILE, path=INDEX_DIR, nlist=None, m=None,
+                train_size=TRAIN_SIZE, iters=20, seed=0):
+    """在采样的向量上训练粗聚类和PQ码本，然后编码嵌入存储中的全部行"""
+    store = open_embeddings(embeddings_file)
+    count = len(store)
+    if count == 0:
+        raise ValueError(f"嵌入存储为空: {embeddings_file}")
+    dim = store.dim
+    m = m or default_subspaces(dim)
+    if dim % m:
+        raise ValueError(f"维度 {dim} 不能被子空间数 {m} 整除")
+    nlist = min(nlist or max(1, int(4 * np.sqrt(count))), count)
+
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(count, min(train_size, count), replace=False))
+    train = store.vectors(sample)
+    if not store.normalized:
+        train = normalize_rows(train)
+
+    print(f"训练粗聚类: {nlist} 个桶，样本 {len(train)} 条")
+    centroids = kmeans(train, nlist, iters, seed)
+    residuals = train - centroids[nearest(train, centroids)]
+    ksub = min(KSUB, len(train))
+    dsub = dim // m
+    print(f"训练PQ码本: {m} 个子空间 x {ksub} 个码字")
+    codebooks = np.stack([kmeans(residuals[:, j * dsub:(j + 1) * dsub], ksub, iters, seed + j + 1)
+                          for j in range(m)])
+
+    print(f"编码 {count} 条向量")
+    ids = np.arange(count, dtype=np.int64)
+    lists, codes = encode_rows(store, ids, centroids, codebooks)
+    meta = {
+        'version': INDEX_VERSION,
+        'model': store.model_name,
+        'dim': dim,
+        'nlist': nlist,
+        'm': m,
+        'ksub': ksub,
+        'count': count,
+        'keys_sha256': keys_digest(store.keys),
+    }
+    _save_index(path, meta, centroids, codebooks, lists, codes, ids)
+    return count
+
+
+def update_index(embeddings_file=EMBEDDINGS_FILE, path=INDEX_DIR):
+    """
+    把嵌入存储中新追加的行（如新的年份）加入索引，沿用已训练的聚类中心和码本，不重新训练。
+    新行编码后写成一个新段，已有的段不改写。
+    嵌入存储按 papers.jsonl 的顺序整体重写时，新年份可能插在中间，之后的行号全部变化：
+    此时前 count 行的主键摘要对不上，改为用已有的码本重新编码全部行。
+    返回 (编码的条数, 是否重新编码了全部行)。
+    """
+    index = IVFPQIndex(path, embeddings_file)
+    store = index.store
+    start = len(index)
+    keys = store.keys
+    if start <= len(store) and index.meta.get('keys_sha256') == keys_digest(keys[:start]):
+        if start == len(store):
+            return 0, False
+        new_ids = np.arange(start, len(store), dtype=np.int64)
+        new_lists, new_codes = encode_rows(store, new_ids, index.centroids, index.codebooks)
+        segment = len(index.segments)
+        # 先写新段，最后替换 meta.json；中途失败时旧索引仍然完整
+        _save_segment(path, segment, index.nlist, new_lists, new_codes, new_ids)
+        _write_meta(path, dict(index.meta, count=len(store), segments=segment + 1, keys_sha256=keys_digest(keys)))
+        return len(new_ids), False
+
+    ids = np.arange(len(store), dtype=np.int64)
+    lists, codes = encode_rows(store, ids, index.centroids, index.codebooks)
+    meta = dict(index.meta, count=len(store), keys_sha256=keys_digest(keys))
+    _save_index(path, meta, index.centroids, index.codebooks, lists, codes, ids)
+    return len(ids), True
+
+
+def evaluate(index, queries=1000, k=10, nprobes=(1, 4, 16, 64), rerank=100, seed=0):
+    """
+    recall@k 评测：随机抽取已存储的向量作为查询，与精确检索（search_papers.top_k）的前 k 比较，
+    同时统计每条查询的延迟。
+    """
+    live_rows = np.flatnonzero(index.live)
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(live_rows, min(queries, len(live_rows)), replace=False))
+    vectors = index._vectors(rows)
+
+    start = time.perf_counter()
+    _, expected = top_k(index.store.matrix, vectors, k, None if index.live.all() else live_rows,
+                        normalized=index.store.normalized, scale=index.store.scale, offset=index.store.offset)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(rows)
+    print(f"{len(rows)} 条查询，精确检索 {exact_ms:.3f} ms/条")
+
+    print(f"{'nprobe':>8}{'rerank':>8}{f'recall@{k}':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for nprobe in nprobes:
+        latencies = []
+        found = 0
+        for vector, truth in zip(vectors, expected):
+            start = time.perf_counter()
+            _, hits = index.search(vector[None, :], k, nprobe, rerank)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found += len(np.intersect1d(hits[0], truth))
+        recall = found / expected.size
+        print(f"{nprobe:>8}{rerank:>8}{recall:>12.4f}{np.percentile(latencies, 50):>10.3f}"
+              f"{np.percentile(latencies, 99):>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF-PQ 近似最近邻索引：构建、追加、评测与查询")
+    parser.add_argument('--embeddings', default=EMBEDDINGS_FILE, help="嵌入存储文件")
+    parser.add_argument('--index', default=INDEX_DIR, help="索引目录")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="训练并构建索引")
+    build.add_argument('--nlist', type=int, help="倒排桶数，默认约 4*sqrt(N)")
+    build.add_argument('--m', type=int, help="PQ子空间数（必须整除维度），默认每个子空间 8 维")
+    build.add_argument('--train-size', type=int, default=TRAIN_SIZE)
+    build.add_argument('--iters', type=int, default=20)
+
+    subparsers.add_parser('update', help="把嵌入存储中新追加的行加入索引，不重新训练")
+
+    evaluate_parser = subparsers.add_parser('eval', help="与精确检索对比 recall@k 和延迟")
+    evaluate_parser.add_argument('--queries', type=int, default=1000)
+    evaluate_parser.add_argument('-k', type=int, default=10)
+    evaluate_parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64])
+    evaluate_parser.add_argument('--rerank', type=int, default=100)
+
+    for name, help_text in (('similar', "与给定论文（DOI或URL）相似的论文"), ('search', "文本查询")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('query')
+        sub.add_argument('--input', default=PAPERS_FILE, help="papers.jsonl 或列式存储目录，用于展示元数据")
+        sub.add_argument('-k', type=int, default=10)
+        sub.add_argument('--nprobe', type=int, default=16)
+        sub.add_argument('--rerank', type=int, default=100)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_index(args.embeddings, args.index, args.nlist, args.m, args.train_size, args.iters)
+        print(f"索引已保存到: {args.index}（{count} 条）")
+        return
+    if args.command == 'update':
+        added, reencoded = update_index(args.embeddings, args.index)
+        if reencoded:
+            print(f"嵌入存储的行号已变化，用已有码本重新编码了全部 {added} 条: {args.index}")
+        else:
+            print(f"追加了 {added} 条到: {args.index}")
+        return
+
+    index = IVFPQIndex(args.index, args.embeddings)
+    if args.command == 'eval':
+        evaluate(index, args.queries, args.k, args.nprobe, args.rerank)
+        return
+
+    if args.command == 'similar':
+        if args.query not in index.store.index:
+            print(f"嵌入存储中没有: {args.query}")
+            return
+        scores, rows = index.search_keys([args.query], args.k, args.nprobe, args.rerank)[0]
+    else:
+        from generate_embeddings import load_model
+        model = load_model(index.store.model_name)
+        query = model.encode([args.query], convert_to_numpy=True, normalize_embeddings=True)
+        scores, rows = index.search(query, args.k, args.nprobe, args.rerank)
+        scores, rows = scores[0], rows[0]
+
+    papers = load_metadata(args.input)
+    keys = index.store.keys
+    print_results(args.query, [(float(score), keys[row], papers.get(keys[row]))
+                               for score, row in zip(scores, rows) if row >= 0])
+
+
+if __name__ == "__main__":
+    main()
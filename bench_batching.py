@@ -0,0 +1,59 @@
+import time
+import argparse
+from itertools import islice
+
+import numpy as np
+
+from generate_embeddings import (iter_paper_texts, load_model, token_lengths, fixed_batches,
+                                 token_batches, padding_ratio, encode_batches)
+
+
+def run(model, texts, batches, normalize, repeat):
+    """重复 repeat 轮，取最快一轮的每秒论文数，同时返回最后一轮的结果矩阵"""
+    best = None
+    matrix = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matrix = encode_batches(model, texts, batches, normalize)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(texts) / best, matrix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入分批基准：固定条数分批与按 token 预算的长度分桶对比")
+    parser.add_argument('--input', default="papers.jsonl", help="papers.jsonl 或列式存储目录")
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--limit', type=int, default=4096, help="参与测试的论文条数")
+    parser.add_argument('--batch-size', type=int, default=32, help="对照组的固定批大小")
+    parser.add_argument('--max-tokens', type=int, nargs='+', default=[2048, 4096, 8192],
+                        help="要测试的 token 预算")
+    parser.add_argument('--normalize', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3, help="每种分批重复的轮数")
+    args = parser.parse_args()
+
+    texts = [text for _, text in islice(iter_paper_texts(args.input), args.limit)]
+    model = load_model(args.model)
+    lengths = token_lengths(model, texts)
+    print(f"{len(texts)} 条文本，token 长度 最短 {lengths.min()} / 中位 {int(np.median(lengths))} / 最长 {lengths.max()}")
+
+    # 预热一轮，避免首批的初始化开销算进对照组
+    encode_batches(model, texts[:args.batch_size], fixed_batches(min(len(texts), args.batch_size), args.batch_size))
+
+    print(f"{'分批方式':<20}{'批数':>8}{'补齐比例':>10}{'papers/s':>12}{'加速比':>8}{'最大误差':>12}")
+    batches = fixed_batches(len(texts), args.batch_size)
+    baseline, expected = run(model, texts, batches, args.normalize, args.repeat)
+    print(f"{f'固定 {args.batch_size} 条':<20}{len(batches):>8}{padding_ratio(lengths, batches):>10.1%}"
+          f"{baseline:>12,.1f}{1:>8.2f}x{0:>12.2e}")
+
+    for max_tokens in args.max_tokens:
+        batches = token_batches(lengths, max_tokens)
+        speed, matrix = run(model, texts, batches, args.normalize, args.repeat)
+        # 结果已按原始顺序写回，只允许补齐带来的浮点误差
+        error = float(np.abs(matrix - expected).max()) if len(texts) else 0.0
+        print(f"{f'预算 {max_tokens} tokens':<20}{len(batches):>8}{padding_ratio(lengths, batches):>10.1%}"
+              f"{speed:>12,.1f}{speed / baseline:>8.2f}x{error:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import time
+import argparse
+import xml.etree.ElementTree as ET
+from glob import glob
+
+from parse_papers import parse_filename, parse_paper, parse_author
+
+
+def parse_paper_findall(entry, conference, year, volume=None):
+    """改写前的 parse_paper：每个字段最多两次 info.find()，作为对照组"""
+    info = entry.find('.//info')
+    if info is None:
+        return None
+
+    paper = {
+        'conference': conference,
+        'year': year,
+        'volume': volume,
+        'title': info.find('title').text if info.find('title') is not None else '',
+        'authors': [parse_author(author) for author in info.findall('.//author')],
+        'doi': info.find('doi').text if info.find('doi') is not None else '',
+        'url': info.find('url').text if info.find('url') is not None else '',
+        'pages': info.find('pages').text if info.find('pages') is not None else '',
+        'type': info.find('type').text if info.find('type') is not None else '',
+        'key': info.find('key').text if info.find('key') is not None else '',
+        'venue': info.find('venue').text if info.find('venue') is not None else '',
+    }
+
+    if info.find('year') is not None:
+        paper['published_year'] = info.find('year').text
+    if info.find('access') is not None:
+        paper['access'] = info.find('access').text
+    if info.find('ee') is not None:
+        paper['ee'] = info.find('ee').text
+
+    return paper
+
+
+def load_hits(directory):
+    """预先把目录下所有条目解析成元素树，只测 parse_paper 本身的耗时"""
+    hits = []
+    for xml_file in sorted(glob(os.path.join(directory, "*.xml"))):
+        source = parse_filename(os.path.basename(xml_file))
+        if source is None:
+            continue
+        root = ET.parse(xml_file).getroot()
+        hits.extend((hit, source) for hit in root.iter('hit'))
+    return hits
+
+
+def run(func, hits, repeat):
+    """重复 repeat 轮，取最快一轮的每秒条目数"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for hit, (conference, year, volume) in hits:
+            func(hit, conference, year, volume)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(hits) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parse_paper 微基准：逐字段 find() 与单遍扫描对比")
+    parser.add_argument('--dirs', nargs='+', default=["ICDE_PAPER", "SIGMOD_PAPER", "VLDB_PAPER"])
+    parser.add_argument('--repeat', type=int, default=5, help="每种实现重复的轮数")
+    args = parser.parse_args()
+
+    print(f"{'目录':<14}{'条目数':>8}{'改写前 hits/s':>16}{'改写后 hits/s':>16}{'加速比':>8}")
+    all_hits = []
+    for directory in args.dirs:
+        hits = load_hits(directory)
+        all_hits.extend(hits)
+
+        # 两种实现的结果必须完全一致
+        for hit, source in hits:
+            assert parse_paper(hit, *source) == parse_paper_findall(hit, *source)
+
+        before = run(parse_paper_findall, hits, args.repeat)
+        after = run(parse_paper, hits, args.repeat)
+        print(f"{directory:<14}{len(hits):>8}{before:>16,.0f}{after:>16,.0f}{after / before:>8.2f}x")
+
+    before = run(parse_paper_findall, all_hits, args.repeat)
+    after = run(parse_paper, all_hits, args.repeat)
+    print(f"{'合计':<14}{len(all_hits):>8}{before:>16,.0f}{after:>16,.0f}{after / before:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
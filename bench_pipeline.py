@@ -0,0 +1,366 @@
+import gc
+import os
+import re
+import sys
+import json
+import zlib
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from glob import glob
+from datetime import datetime
+
+import numpy as np
+
+from parse_papers import process_xml_file, iter_paper_records
+from generate_embeddings import load_papers, create_paper_text, fixed_batches, make_batches, encode_batches
+from embedding_store import write_embeddings, open_embeddings
+from search_papers import top_k, normalize_rows
+from ann_index import IVFPQIndex, build_index as build_ann_index
+from bm25_index import INDEX_COLUMNS, BM25Index, build_index as build_bm25_index
+from synthetic_corpus import CorpusGenerator
+
+# 默认的基线文件
+BASELINE_FILE = "bench_baseline.json"
+# 速度下降超过这个比例视为回退
+TOLERANCE = 0.10
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class StubModel:
+    """
+    离线基准用的小模型，接口与 SentenceTransformer 中用到的部分一致（tokenizer、max_seq_length、encode）。
+    每批按最长文本补齐后做 词向量查表 + 一层稠密变换 + 平均池化，计算量与补齐后的 token 数成正比，
+    分批方式对它的影响与真实模型相同。
+    """
+
+    def __init__(self, dim=128, vocab=30522, max_seq_length=256, seed=0):
+        rng = np.random.default_rng(seed)
+        self.dim = dim
+        self.vocab = vocab
+        self.max_seq_length = max_seq_length
+        self.table = rng.standard_normal((vocab, dim)).astype(np.float32)
+        self.weight = (rng.standard_normal((dim, dim)) / np.sqrt(dim)).astype(np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def _ids(self, text, max_length):
+        # 长词按4个字符切成多个子词，近似 WordPiece 的切分长度
+        ids = [101]
+        for word in TOKEN_RE.findall(text.lower()):
+            for i in range(0, len(word), 4):
+                ids.append(zlib.crc32(word[i:i + 4].encode('utf-8')) % self.vocab)
+        ids = ids[:max_length - 1] if max_length else ids
+        return ids + [102]
+
+    def tokenizer(self, texts, truncation=True, max_length=None):
+        return {'input_ids': [self._ids(text, max_length if truncation else None) for text in texts]}
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=False):
+        ids = self.tokenizer(texts, max_length=self.max_seq_length)['input_ids']
+        output = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            width = max(len(row) for row in batch)
+            padded = np.zeros((len(batch), width), dtype=np.int64)
+            mask = np.zeros((len(batch), width), dtype=np.float32)
+            for i, row in enumerate(batch):
+                padded[i, :len(row)] = row
+                mask[i, :len(row)] = 1
+            hidden = np.tanh(self.table[padded] @ self.weight)
+            output[start:start + len(batch)] = (hidden * mask[..., None]).sum(axis=1) / mask.sum(axis=1, keepdims=True)
+        if normalize_embeddings:
+            output /= np.linalg.norm(output, axis=1, keepdims=True)
+        return output
+
+
+class Context:
+    """各基准共用的输入，按需准备一次，不计入计时"""
+
+    def __init__(self, corpus, embed_limit, store_rows, max_tokens, batch_size, queries=100, k=10):
+        self.corpus = corpus
+        self.jsonl = os.path.join(corpus, "papers.jsonl")
+        self.xml_files = sorted(glob(os.path.join(corpus, "*_PAPER", "*.xml")))
+        self.embed_limit = embed_limit
+        self.store_rows = store_rows
+        self.max_tokens = max_tokens
+        self.batch_size = batch_size
+        self.query_count = queries
+        self.k = k
+        self.tmp_dir = tempfile.mkdtemp(prefix="bench_")
+        self.store_path = os.path.join(self.tmp_dir, "embeddings.bin")
+        self._papers = None
+        self._texts = None
+        self._model = None
+        self._matrix = None
+        self._queries = None
+        self._query_titles = None
+        self._ann = None
+        self._bm25 = None
+
+    @property
+    def papers(self):
+        if self._papers is None:
+            self._papers = load_papers(self.jsonl)
+        return self._papers
+
+    @property
+    def texts(self):
+        if self._texts is None:
+            self._texts = [create_paper_text(paper) for _, paper in zip(range(self.embed_limit),
+                                                                        self.papers.values())]
+        return self._texts
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = StubModel()
+        return self._model
+
+    @property
+    def store(self):
+        """存储基准读取的文件：没有先运行保存基准时在这里写一份"""
+        if not os.path.exists(self.store_path):
+            write_embeddings(self.store_path, list(self.papers)[:len(self.matrix)], self.matrix, 'stub')
+        return self.store_path
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            rows = min(self.store_rows, len(self.papers))
+            self._matrix = np.random.default_rng(0).standard_normal((rows, 384), dtype=np.float32)
+        return self._matrix
+
+    @property
+    def queries(self):
+        """检索基准的查询向量：与存储同分布的随机向量，已归一化"""
+        if self._queries is None:
+            rng = np.random.default_rng(1)
+            self._queries = normalize_rows(rng.standard_normal((self.query_count, self.matrix.shape[1]),
+                                                               dtype=np.float32))
+        return self._queries
+
+    @property
+    def query_titles(self):
+        """BM25 基准的查询：随机抽取的论文标题的前三个词"""
+        if self._query_titles is None:
+            papers = list(self.papers.values())
+            rng = np.random.default_rng(1)
+            picks = rng.choice(len(papers), min(self.query_count, len(papers)), replace=False)
+            self._query_titles = [' '.join(papers[i]['title'].split()[:3]) for i in picks]
+        return self._query_titles
+
+    @property
+    def ann(self):
+        """在存储上训练 IVF-PQ 索引（默认参数）"""
+        if self._ann is None:
+            path = os.path.join(self.tmp_dir, "embeddings.ivfpq")
+            build_ann_index(self.store, path)
+            self._ann = IVFPQIndex(path, self.store)
+        return self._ann
+
+    @property
+    def bm25(self):
+        if self._bm25 is None:
+            path = os.path.join(self.tmp_dir, "titles.bm25")
+            build_bm25_index(iter_paper_records(self.jsonl, INDEX_COLUMNS), path)
+            self._bm25 = BM25Index(path)
+        return self._bm25
+
+    def close(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def bench_process_xml_file(ctx):
+    return sum(len(process_xml_file(path)) for path in ctx.xml_files)
+
+
+def bench_load_papers(ctx):
+    return len(load_papers(ctx.jsonl))
+
+
+def bench_create_paper_text(ctx):
+    return len([create_paper_text(paper) for paper in ctx.papers.values()])
+
+
+def bench_batching_fixed(ctx):
+    texts = ctx.texts
+    encode_batches(ctx.model, texts, fixed_batches(len(texts), ctx.batch_size))
+    return len(texts)
+
+
+def bench_batching_tokens(ctx):
+    texts = ctx.texts
+    encode_batches(ctx.model, texts, make_batches(ctx.model, texts, ctx.batch_size, ctx.max_tokens))
+    return len(texts)
+
+
+def bench_embeddings_save(ctx):
+    matrix = ctx.matrix
+    write_embeddings(ctx.store_path, list(ctx.papers)[:len(matrix)], matrix, 'stub')
+    return len(matrix)
+
+
+def bench_embeddings_load(ctx):
+    store = open_embeddings(ctx.store)
+    index = store.index
+    # 按块读完整个矩阵，保证数据真的从文件读入
+    for start in range(0, len(store), 65536):
+        np.asarray(store.matrix[start:start + 65536]).sum()
+    return len(index)
+
+
+def bench_search_top_k(ctx):
+    # 精确检索：整块扫描存储，全部查询一起打分
+    store = open_embeddings(ctx.store)
+    top_k(store.matrix, ctx.queries, ctx.k, normalized=store.normalized)
+    return len(ctx.queries)
+
+
+def bench_search_ann(ctx):
+    ctx.ann.search(ctx.queries, ctx.k)
+    return len(ctx.queries)
+
+
+def bench_search_bm25(ctx):
+    for query in ctx.query_titles:
+        ctx.bm25.search(query, ctx.k)
+    return len(ctx.query_titles)
+
+
+# 名称 -> (函数, 计数单位, 计时前要准备好的输入)，按执行顺序排列
+BENCHMARKS = {
+    'process_xml_file': (bench_process_xml_file, 'papers', ()),
+    'load_papers': (bench_load_papers, 'papers', ()),
+    'create_paper_text': (bench_create_paper_text, 'papers', ('papers',)),
+    'batching_fixed': (bench_batching_fixed, 'texts', ('texts', 'model')),
+    'batching_tokens': (bench_batching_tokens, 'texts', ('texts', 'model')),
+    'embeddings_save': (bench_embeddings_save, 'rows', ('papers', 'matrix')),
+    'embeddings_load': (bench_embeddings_load, 'rows', ('store',)),
+    'search_top_k': (bench_search_top_k, 'queries', ('store', 'queries')),
+    'search_ann': (bench_search_ann, 'queries', ('ann', 'queries')),
+    'search_bm25': (bench_search_bm25, 'queries', ('bm25', 'query_titles')),
+}
+
+
+def run_benchmark(function, ctx, repeat, inputs=()):
+    """重复 repeat 轮取最快一轮；输入在计时前准备好，每轮前做一次垃圾回收，减少上一轮遗留的干扰"""
+    for name in inputs:
+        getattr(ctx, name)
+    best = None
+    items = 0
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = function(ctx)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'items': items, 'seconds': best, 'rate': items / best if best else 0.0}
+
+
+def environment(ctx):
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'corpus': ctx.corpus,
+        'papers': len(ctx.papers),
+        'xml_files': len(ctx.xml_files),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(run, path=BASELINE_FILE):
+    tmp_file = path + '.part'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(run, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """与基线逐项对比每秒处理条数，返回速度下降超过 tolerance 的基准名"""
+    regressions = []
+    print(f"\n{'基准':<20}{'基线/秒':>14}{'本次/秒':>14}{'变化':>10}")
+    for name, result in results.items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f"{name:<20}{'-':>14}{result['rate']:>14,.0f}{'新增':>10}")
+            continue
+        change = result['rate'] / old['rate'] - 1 if old['rate'] else 0.0
+        mark = ''
+        if change < -tolerance:
+            regressions.append(name)
+            mark = '  回退'
+        print(f"{name:<20}{old['rate']:>14,.0f}{result['rate']:>14,.0f}{change:>+10.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在合成语料上对解析、加载、嵌入分批、嵌入存储和检索做可复现的基准测试")
+    parser.add_argument('--corpus', default="bench_corpus", help="合成语料目录，不存在时按 --papers 生成")
+    parser.add_argument('--papers', type=int, default=100000, help="生成语料时的论文数（10000 到 10000000）")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="只运行这些基准")
+    parser.add_argument('--repeat', type=int, default=3, help="每个基准重复的轮数，取最快一轮")
+    parser.add_argument('--embed-limit', type=int, default=20000, help="分批基准使用的文本条数")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-tokens', type=int, default=4096, help="长度分桶基准的 token 预算")
+    parser.add_argument('--store-rows', type=int, default=1000000, help="存储基准写入的最大行数（384维 float32）")
+    parser.add_argument('--queries', type=int, default=100, help="检索基准的查询数")
+    parser.add_argument('-k', type=int, default=10, help="检索基准返回的结果数")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="基线文件")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为新的基线")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help="速度下降超过该比例时判为回退")
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.corpus, "papers.jsonl")):
+        print(f"生成 {args.papers} 篇论文的合成语料到: {args.corpus}")
+        files, papers = CorpusGenerator(args.papers, args.seed).write(args.corpus)
+        print(f"已生成 {files} 个XML文件、{papers} 篇论文")
+
+    ctx = Context(args.corpus, args.embed_limit, args.store_rows, args.max_tokens, args.batch_size, args.queries, args.k)
+    try:
+        env = environment(ctx)
+        print(f"语料: {env['papers']} 篇论文，{env['xml_files']} 个XML文件；Python {env['python']}，"
+              f"numpy {env['numpy']}，{env['cpus']} 核")
+        results = {}
+        print(f"{'基准':<20}{'条数':>12}{'最快一轮(s)':>14}{'每秒':>14}")
+        for name in args.only or BENCHMARKS:
+            function, unit, inputs = BENCHMARKS[name]
+            result = run_benchmark(function, ctx, args.repeat, inputs)
+            results[name] = dict(result, unit=unit)
+            print(f"{name:<20}{result['items']:>12}{result['seconds']:>14.3f}{result['rate']:>14,.0f}")
+    finally:
+        ctx.close()
+
+    run = {'environment': env, 'results': results}
+    baseline = load_baseline(args.baseline)
+    regressions = []
+    if baseline is not None:
+        if baseline['environment']['papers'] != env['papers']:
+            print(f"注意：基线语料为 {baseline['environment']['papers']} 篇，本次为 {env['papers']} 篇")
+        regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline:
+        if baseline is not None and args.only:
+            # 只运行了部分基准时保留基线中其余的结果
+            run['results'] = dict(baseline['results'], **results)
+        save_baseline(run, args.baseline)
+        print(f"基线已保存到: {args.baseline}")
+    if regressions:
+        print(f"\n{len(regressions)} 项基准回退超过 {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+import os
+import re
+import json
+import time
+import heapq
+import shutil
+import argparse
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+from parse_papers import iter_paper_records
+from search_papers import EMBEDDINGS_FILE, PAPERS_FILE, load_metadata, print_results
+
+# 默认的索引目录
+INDEX_DIR = "titles.bm25"
+# 2：切词时去掉重音符号（Müller -> muller），旧索引需要重建
+INDEX_VERSION = 2
+# 每个倒排块的文档数，块上记录最大词频和最短文档长度，用于估计块内得分上界
+BLOCK_SIZE = 128
+# BM25 参数
+K1 = 1.2
+B = 0.75
+# 建索引只需要这几列
+INDEX_COLUMNS = ['title', 'doi', 'url', 'key']
+
+TOKEN_RE = re.compile(r'[0-9a-z]+')
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it its of on or over the their this to towards toward "
+    "under using via with".split())
+
+
+def tokenize(text):
+    """小写、去重音后按字母数字切词，去掉停用词"""
+    text = unicodedata.normalize('NFKD', text or '')
+    # 与 find_duplicates.normalize_title 一样去掉组合重音符号，否则 "Müller" 会被切成 mu + ller
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return [token for token in TOKEN_RE.findall(text) if token not in STOPWORDS]
+
+
+def paper_doc(paper):
+    """(dblp key, 嵌入主键, 标题)；嵌入主键与 generate_embeddings.load_papers 一致，用于混合检索"""
+    return paper['key'], paper.get('doi', '') or paper.get('url', ''), paper.get('title') or ''
+
+
+def write_segment(path, docs):
+    """
+    把一批文档写成一个不可变的段：
+    - 词表按字典序排列，词的倒排表是按文档号升序、差分编码的整数数组（按最大差值选最小的整数类型）；
+    - 倒排表每 BLOCK_SIZE 个文档一块，记录块内最后一个文档号、最大词频和最短文档长度。
+    """
+    term_index = {}
+    doc_ids, term_ids, tfs, lengths = [], [], [], []
+    for doc, (_, _, title) in enumerate(docs):
+        tokens = tokenize(title)
+        lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            doc_ids.append(doc)
+            term_ids.append(term_index.setdefault(term, len(term_index)))
+            tfs.append(tf)
+
+    terms = sorted(term_index)
+    remap = np.empty(len(terms), dtype=np.int64)
+    remap[[term_index[term] for term in terms]] = np.arange(len(terms))
+    term_ids = remap[np.array(term_ids, dtype=np.int64)]
+    doc_ids = np.array(doc_ids, dtype=np.int64)
+    tfs = np.minimum(np.array(tfs, dtype=np.int64), 255).astype(np.uint8)
+    doc_len = np.minimum(np.array(lengths, dtype=np.int64), 65535).astype(np.uint16)
+
+    order = np.lexsort((doc_ids, term_ids))
+    term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+    counts = np.bincount(term_ids, minlength=len(terms))
+    term_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    # 每个词的第一个文档存绝对文档号，之后存与前一个文档号的差
+    gaps = doc_ids.copy()
+    gaps[1:] -= doc_ids[:-1]
+    gaps[term_offsets[:-1][counts > 0]] = doc_ids[term_offsets[:-1][counts > 0]]
+    gaps = gaps.astype(np.min_scalar_type(int(gaps.max()) if len(gaps) else 0))
+
+    block_counts = (counts + BLOCK_SIZE - 1) // BLOCK_SIZE
+    term_blocks = np.concatenate([[0], np.cumsum(block_counts)]).astype(np.int64)
+    positions = np.arange(len(doc_ids)) - term_offsets[term_ids]
+    block_ids = term_blocks[term_ids] + positions // BLOCK_SIZE
+    block_starts = np.flatnonzero(np.diff(block_ids, prepend=-1))
+    block_ends = np.append(block_starts[1:], len(doc_ids)) - 1
+
+    tmp_path = path.rstrip('/\\') + '.part'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    arrays = {
+        'term_offsets': term_offsets,
+        'term_blocks': term_blocks,
+        'gaps': gaps,
+        'tfs': tfs,
+        'block_last': doc_ids[block_ends].astype(np.uint32),
+        'block_max_tf': np.maximum.reduceat(tfs, block_starts) if len(tfs) else tfs,
+        'block_min_len': np.minimum.reduceat(doc_len[doc_ids], block_starts) if len(tfs) else doc_len[:0],
+        'doc_len': doc_len,
+        'deleted': np.zeros(len(docs), dtype=bool),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    with open(os.path.join(tmp_path, "terms.json"), 'w', encoding='utf-8') as f:
+        json.dump(terms, f, ensure_ascii=False)
+    with open(os.path.join(tmp_path, "docs.json"), 'w', encoding='utf-8') as f:
+        json.dump([[key, embedding_key] for key, embedding_key, _ in docs], f, ensure_ascii=False)
+    with open(os.path.join(tmp_path, "titles.json"), 'w', encoding='utf-8') as f:
+        json.dump([title for _, _, title in docs], f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """一个段的只读视图，倒排数组以 mmap 方式打开；只有删除标记会在追加新段时改写"""
+
+    def __init__(self, path):
+        self.path = path
+        for name in ('term_offsets', 'term_blocks', 'gaps', 'tfs', 'block_last', 'block_max_tf',
+                     'block_min_len', 'doc_len'):
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+        self.deleted = np.load(os.path.join(path, "deleted.npy"))
+        with open(os.path.join(path, "terms.json"), 'r', encoding='utf-8') as f:
+            self.terms = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "docs.json"), 'r', encoding='utf-8') as f:
+            self.docs = json.load(f)
+        self._titles = None
+
+    def __len__(self):
+        return len(self.docs)
+
+    @property
+    def titles(self):
+        if self._titles is None:
+            with open(os.path.join(self.path, "titles.json"), 'r', encoding='utf-8') as f:
+                self._titles = json.load(f)
+        return self._titles
+
+    def save_deleted(self):
+        np.save(os.path.join(self.path, "deleted.npy"), self.deleted)
+
+    def df(self, term):
+        term_id = self.terms.get(term)
+        return 0 if term_id is None else int(self.term_offsets[term_id + 1] - self.term_offsets[term_id])
+
+    def blocks(self, term_id):
+        """某个词所有块的 (全局块号, 第一个文档号, 最后一个文档号)"""
+        first_block, end_block = int(self.term_blocks[term_id]), int(self.term_blocks[term_id + 1])
+        blocks = np.arange(first_block, end_block)
+        starts = int(self.term_offsets[term_id]) + (blocks - first_block) * BLOCK_SIZE
+        last = self.block_last[first_block:end_block].astype(np.int64)
+        bases = np.concatenate([[0], last[:-1]])
+        return blocks, bases + self.gaps[starts], last
+
+    def decode(self, term_id, block):
+        """解码一个块：返回 (文档号数组, 词频数组)"""
+        first_block = int(self.term_blocks[term_id])
+        start = int(self.term_offsets[term_id]) + (block - first_block) * BLOCK_SIZE
+        end = min(start + BLOCK_SIZE, int(self.term_offsets[term_id + 1]))
+        base = int(self.block_last[block - 1]) if block > first_block else 0
+        docs = base + np.cumsum(self.gaps[start:end], dtype=np.int64)
+        return docs, self.tfs[start:end]
+
+
+class BM25Index:
+    """
+    标题 BM25 倒排索引：由若干不可变的段组成，新论文以新段追加，
+    已有论文（按 dblp key）被新段覆盖时在旧段中打删除标记。
+    """
+
+    def __init__(self, path=INDEX_DIR):
+        self.path = path
+        with open(os.path.join(path, "index.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != INDEX_VERSION:
+            raise ValueError(f"不支持的索引版本: {self.meta['version']}")
+        self.segments = [Segment(os.path.join(path, name)) for name in self.meta['segments']]
+        live = [(~segment.deleted).sum() for segment in self.segments]
+        self.count = int(sum(live))
+        total_len = sum(int(segment.doc_len[~segment.deleted].sum()) for segment in self.segments)
+        self.avgdl = total_len / self.count if self.count else 1.0
+
+    def idf(self, term):
+        """BM25 idf；df 按各段倒排表长度之和估计（含已删除文档，与 Lucene 的做法一致）"""
+        df = sum(segment.df(term) for segment in self.segments)
+        return float(np.log(1 + (self.count - df + 0.5) / (df + 0.5)))
+
+    def _term_scores(self, idf, tf, doc_len):
+        tf = tf.astype(np.float32)
+        return idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * doc_len.astype(np.float32) / self.avgdl))
+
+    def search(self, query, k=10):
+        """
+        top-k 检索，返回 [(分数, 段号, 段内文档号), ...]。
+        按块边界把文档号空间切成区间，每个区间的得分上界是覆盖它的各词块上界之和（块最大词频 + 块最短长度）；
+        区间按上界从高到低处理，上界不超过当前第 k 名时直接跳过剩下的所有区间。
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        idfs = {term: self.idf(term) for term in terms}
+        heap = []
+        for segment_number, segment in enumerate(self.segments):
+            self._search_segment(segment_number, segment, terms, idfs, k, heap)
+        return sorted(heap, key=lambda item: (-item[0], item[1], item[2]))
+
+    def _search_segment(self, segment_number, segment, terms, idfs, k, heap):
+        postings = []
+        for term in terms:
+            term_id = segment.terms.get(term)
+            if term_id is None:
+                continue
+            blocks, first, last = segment.blocks(term_id)
+            upper = self._term_scores(idfs[term], segment.block_max_tf[blocks], segment.block_min_len[blocks])
+            postings.append((term_id, idfs[term], blocks, first, last, upper))
+        if not postings:
+            return
+
+        bounds = np.unique(np.concatenate([np.concatenate([first, last + 1]) for _, _, _, first, last, _ in postings]))
+        starts, ends = bounds[:-1], bounds[1:]
+        interval_upper = np.zeros(len(starts), dtype=np.float32)
+        covering = []
+        for _, _, blocks, first, last, upper in postings:
+            index = np.searchsorted(first, starts, side='right') - 1
+            covered = (index >= 0) & (last[np.maximum(index, 0)] >= starts)
+            interval_upper += np.where(covered, upper[np.maximum(index, 0)], 0)
+            covering.append(np.where(covered, blocks[np.maximum(index, 0)], -1))
+
+        decoded = {}
+        for interval in np.argsort(-interval_upper, kind='stable'):
+            if interval_upper[interval] <= 0:
+                break
+            if len(heap) >= k and interval_upper[interval] <= heap[0][0]:
+                break
+            start, end = int(starts[interval]), int(ends[interval])
+            scores = np.zeros(end - start, dtype=np.float32)
+            for (term_id, idf, _, _, _, _), blocks in zip(postings, covering):
+                block = int(blocks[interval])
+                if block < 0:
+                    continue
+                if (term_id, block) not in decoded:
+                    docs, tfs = segment.decode(term_id, block)
+                    decoded[(term_id, block)] = (docs, self._term_scores(idf, tfs, segment.doc_len[docs]))
+                docs, term_scores = decoded[(term_id, block)]
+                inside = (docs >= start) & (docs < end)
+                scores[docs[inside] - start] += term_scores[inside]
+
+            candidates = np.flatnonzero(scores > 0)
+            candidates = candidates[~segment.deleted[candidates + start]]
+            threshold = heap[0][0] if len(heap) >= k else 0
+            for doc in candidates[scores[candidates] > threshold].tolist():
+                item = (float(scores[doc]), segment_number, doc + start)
+                if len(heap) < k:
+                    heapq.heappush(heap, item)
+                elif item[0] > heap[0][0]:
+                    heapq.heapreplace(heap, item)
+
+    def doc(self, segment_number, doc):
+        """(dblp key, 嵌入主键)"""
+        return tuple(self.segments[segment_number].docs[doc])
+
+
+def _write_manifest(path, segments):
+    tmp_file = os.path.join(path, "index.json.tmp")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'version': INDEX_VERSION, 'block_size': BLOCK_SIZE, 'segments': segments}, f, indent=2)
+    os.replace(tmp_file, os.path.join(path, "index.json"))
+
+
+def build_index(papers, path=INDEX_DIR):
+    """从论文流（parse_papers 的输出）重建索引：只有一个段，返回文档数"""
+    docs = list({key: (key, embedding_key, title)
+                 for key, embedding_key, title in map(paper_doc, papers) if key}.values())
+    tmp_path = path.rstrip('/\\') + '.build'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    write_segment(os.path.join(tmp_path, "seg_00000"), docs)
+    _write_manifest(tmp_path, ["seg_00000"])
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return len(docs)
+
+
+def append_papers(papers, path=INDEX_DIR):
+    """
+    增量追加：dblp key 不存在或标题变化的论文写成一个新段，旧段中对应的文档打删除标记；
+    papers 应为完整的输入，其中已经没有的论文同样打删除标记。
+    索引不存在或版本不同时整体重建。返回 (新增或更新数, 未变化数, 删除数)。
+    """
+    manifest = os.path.join(path, "index.json")
+    if os.path.exists(manifest):
+        with open(manifest, 'r', encoding='utf-8') as f:
+            version = json.load(f)['version']
+    if not os.path.exists(manifest) or version != INDEX_VERSION:
+        return build_index(papers, path), 0, 0
+    index = BM25Index(path)
+    existing = {}
+    for segment_number, segment in enumerate(index.segments):
+        for doc, (key, _) in enumerate(segment.docs):
+            if not segment.deleted[doc]:
+                existing[key] = (segment_number, doc)
+
+    docs = {}
+    seen = set()
+    unchanged = 0
+    for key, embedding_key, title in map(paper_doc, papers):
+        if not key:
+            continue
+        seen.add(key)
+        if key in existing:
+            segment_number, doc = existing[key]
+            segment = index.segments[segment_number]
+            if segment.titles[doc] == title and segment.docs[doc][1] == embedding_key:
+                unchanged += 1
+                continue
+        docs[key] = (key, embedding_key, title)
+    # 更新的论文和已从输入中删除的论文，旧文档都打删除标记
+    stale = [key for key in existing if key in docs or key not in seen]
+    removed = sum(key not in seen for key in stale)
+    if not docs and not stale:
+        return 0, unchanged, 0
+
+    segments = index.meta['segments']
+    if docs:
+        name = f"seg_{len(segments):05d}"
+        while os.path.exists(os.path.join(path, name)):
+            name += "_"
+        write_segment(os.path.join(path, name), list(docs.values()))
+        segments = segments + [name]
+    touched = set()
+    for key in stale:
+        segment_number, doc = existing[key]
+        index.segments[segment_number].deleted[doc] = True
+        touched.add(segment_number)
+    for segment_number in touched:
+        index.segments[segment_number].save_deleted()
+    _write_manifest(path, segments)
+    return len(docs), unchanged, removed
+
+
+def hybrid_search(index, searcher, query, k=10, alpha=0.5, depth=100):
+    """
+    混合检索：BM25 与嵌入检索各取前 depth 个结果，分数各自做 min-max 归一化后按
+    alpha * BM25 + (1 - alpha) * 余弦 融合，按嵌入主键（DOI/URL）对齐。
+    返回 [(融合分数, 嵌入主键), ...]。
+    """
+    def normalized(scores):
+        if not scores:
+            return {}
+        values = np.array(list(scores.values()), dtype=np.float64)
+        low, high = values.min(), values.max()
+        span = high - low if high > low else 1.0
+        return {key: (score - low) / span if high > low else 1.0 for key, score in scores.items()}
+
+    keyword = {}
+    for score, segment_number, doc in index.search(query, depth):
+        embedding_key = index.doc(segment_number, doc)[1]
+        if embedding_key:
+            keyword[embedding_key] = max(score, keyword.get(embedding_key, 0))
+    semantic = {key: score for score, key, _ in searcher.search([query], depth)[0]}
+
+    keyword, semantic = normalized(keyword), normalized(semantic)
+    fused = {key: alpha * keyword.get(key, 0) + (1 - alpha) * semantic.get(key, 0)
+             for key in keyword.keys() | semantic.keys()}
+    return sorted(((score, key) for key, score in fused.items()), key=lambda item: (-item[0], item[1]))[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="标题 BM25 倒排索引：构建、增量追加、检索与混合检索")
+    parser.add_argument('--index', default=INDEX_DIR, help="索引目录")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('build', "从 papers.jsonl 或列式存储重建索引"),
+                            ('append', "把新增或标题变化的论文追加为一个新段，输入中已没有的论文打删除标记")):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('--input', default=PAPERS_FILE)
+
+    search = subparsers.add_parser('search', help="关键词检索")
+    search.add_argument('query')
+    search.add_argument('-k', type=int, default=10)
+    search.add_argument('--input', default=PAPERS_FILE, help="papers.jsonl 或列式存储目录，用于展示元数据")
+    search.add_argument('--hybrid', action='store_true', help="与嵌入检索融合")
+    search.add_argument('--embeddings', default=EMBEDDINGS_FILE)
+    search.add_argument('--alpha', type=float, default=0.5, help="混合检索中 BM25 的权重")
+    search.add_argument('--depth', type=int, default=100, help="混合检索时两路各取的候选数")
+
+    args = parser.parse_args()
+
+    if args.command in ('build', 'append'):
+        start = time.perf_counter()
+        papers = iter_paper_records(args.input, INDEX_COLUMNS)
+        if args.command == 'build':
+            print(f"索引已重建: {build_index(papers, args.index)} 篇论文", end='')
+        else:
+            added, unchanged, removed = append_papers(papers, args.index)
+            print(f"追加 {added} 篇，未变化 {unchanged} 篇，删除 {removed} 篇", end='')
+        print(f"，用时 {time.perf_counter() - start:.2f} 秒")
+        return
+
+    index = BM25Index(args.index)
+    if args.hybrid:
+        from search_papers import SemanticSearcher
+        searcher = SemanticSearcher(args.embeddings, args.input)
+        results = [(score, key, searcher.papers.get(key))
+                   for score, key in hybrid_search(index, searcher, args.query, args.k, args.alpha, args.depth)]
+    else:
+        papers = load_metadata(args.input)
+        results = []
+        for score, segment_number, doc in index.search(args.query, args.k):
+            _, embedding_key = index.doc(segment_number, doc)
+            results.append((score, embedding_key, papers.get(embedding_key)))
+    print_results(args.query, results)
+
+
+if __name__ == "__main__":
+    main()
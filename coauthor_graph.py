@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import shutil
+import argparse
+from array import array
+
+import numpy as np
+
+from parse_papers import iter_paper_records
+
+# 默认的图目录
+GRAPH_DIR = "coauthor_graph"
+GRAPH_VERSION = 1
+# 建图只需要这几列
+GRAPH_COLUMNS = ['conference', 'year', 'title', 'authors', 'key']
+
+
+def author_id(author):
+    """作者标识：dblp pid，没有 pid 时退回姓名"""
+    return author.get('pid') or author.get('name')
+
+
+def _csr(rows, cols, size):
+    """(行, 列) 对 -> CSR：按行排序后的列数组和 size+1 个偏移"""
+    order = np.argsort(rows, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=size))]).astype(np.int64)
+    return offsets, cols[order]
+
+
+def _components(offsets, neighbors, count):
+    """连通分量：最小标签传播 + 指针跳跃，返回每个节点所属分量中最小的节点号"""
+    labels = np.arange(count, dtype=np.int32)
+    sources = np.repeat(np.arange(count, dtype=np.int32), np.diff(offsets))
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, sources, labels[neighbors])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def build_graph(papers, path=GRAPH_DIR):
+    """
+    一遍流式读取论文，把作者 pid 映射为连续整数编号，生成：
+    - 论文-作者、作者-论文两个方向的 CSR 关联数组；
+    - 合作者邻接表（CSR，权重为合作论文数，每个作者的邻居按编号升序）；
+    - 每个作者所属的连通分量。
+    返回 (作者数, 论文数)。
+    """
+    ids = {}
+    names = []
+    paper_keys = []
+    conferences = {}
+    paper_conference = array('H')
+    paper_year = array('h')
+    paper_offsets = array('q', [0])
+    paper_authors = array('i')
+
+    for paper in papers:
+        paper_keys.append(paper.get('key'))
+        paper_conference.append(conferences.setdefault(paper.get('conference'), len(conferences)))
+        paper_year.append(paper.get('year') or 0)
+        for author in paper.get('authors', []):
+            identifier = author_id(author)
+            if not identifier:
+                continue
+            if identifier not in ids:
+                ids[identifier] = len(ids)
+                names.append(author.get('name'))
+            paper_authors.append(ids[identifier])
+        paper_offsets.append(len(paper_authors))
+
+    author_count, paper_count = len(ids), len(paper_keys)
+    paper_offsets = np.frombuffer(paper_offsets, dtype=np.int64)
+    paper_authors = np.frombuffer(paper_authors, dtype=np.int32)
+    paper_of = np.repeat(np.arange(paper_count, dtype=np.int32), np.diff(paper_offsets))
+    author_offsets, author_papers = _csr(paper_authors, paper_of, author_count)
+
+    # 每篇论文的作者两两成边：n 个作者生成 n*(n-1) 条有向边
+    sizes = np.diff(paper_offsets)
+    pair_counts = sizes * sizes
+    left = np.repeat(paper_authors, np.repeat(sizes, sizes))
+    starts = np.repeat(paper_offsets[:-1], pair_counts)
+    within = np.arange(len(left)) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    right = paper_authors[starts + within % np.repeat(sizes, pair_counts)]
+    keep = left != right
+    edges, weights = np.unique(left[keep].astype(np.int64) * author_count + right[keep], return_counts=True)
+    sources = (edges // author_count).astype(np.int32)
+    neighbor_offsets = np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=author_count))]).astype(np.int64)
+    neighbors = (edges % author_count).astype(np.int32)
+    components = _components(neighbor_offsets, neighbors, author_count)
+
+    tmp_path = path.rstrip('/\\') + '.part'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    arrays = {
+        'paper_offsets': paper_offsets,
+        'paper_authors': paper_authors,
+        'paper_conference': np.frombuffer(paper_conference, dtype=np.uint16),
+        'paper_year': np.frombuffer(paper_year, dtype=np.int16),
+        'author_offsets': author_offsets,
+        'author_papers': author_papers,
+        'neighbor_offsets': neighbor_offsets,
+        'neighbors': neighbors,
+        'weights': weights.astype(np.int32),
+        'components': components,
+    }
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+    with open(os.path.join(tmp_path, "authors.json"), 'w', encoding='utf-8') as f:
+        json.dump({'ids': list(ids), 'names': names}, f, ensure_ascii=False)
+    with open(os.path.join(tmp_path, "papers.json"), 'w', encoding='utf-8') as f:
+        json.dump(paper_keys, f, ensure_ascii=False)
+    with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump({'version': GRAPH_VERSION, 'authors': author_count, 'papers': paper_count,
+                   'edges': len(neighbors), 'conferences': list(conferences)}, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return author_count, paper_count
+
+
+class CoauthorGraph:
+    """合作者图的只读视图：所有数组以 mmap 方式打开"""
+
+    def __init__(self, path=GRAPH_DIR):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != GRAPH_VERSION:
+            raise ValueError(f"不支持的图版本: {self.meta['version']}")
+        for name in ('paper_offsets', 'paper_authors', 'paper_conference', 'paper_year', 'author_offsets',
+                     'author_papers', 'neighbor_offsets', 'neighbors', 'weights', 'components'):
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+        with open(os.path.join(path, "authors.json"), 'r', encoding='utf-8') as f:
+            authors = json.load(f)
+        self.author_ids = authors['ids']
+        self.names = authors['names']
+        self.index = {identifier: i for i, identifier in enumerate(self.author_ids)}
+        self._paper_keys = None
+
+    @property
+    def paper_keys(self):
+        if self._paper_keys is None:
+            with open(os.path.join(self.path, "papers.json"), 'r', encoding='utf-8') as f:
+                self._paper_keys = json.load(f)
+        return self._paper_keys
+
+    def author(self, pid):
+        if pid not in self.index:
+            raise KeyError(f"图中没有作者: {pid}")
+        return self.index[pid]
+
+    def papers(self, pid, conference=None, years=None):
+        """作者的论文编号，可按会议和年份区间过滤"""
+        author = self.author(pid)
+        papers = np.asarray(self.author_papers[self.author_offsets[author]:self.author_offsets[author + 1]])
+        mask = np.ones(len(papers), dtype=bool)
+        if conference is not None:
+            conferences = self.meta['conferences']
+            code = conferences.index(conference) if conference in conferences else -1
+            mask &= self.paper_conference[papers] == code
+        if years is not None:
+            year = self.paper_year[papers]
+            mask &= (year >= years[0]) & (year <= years[1])
+        return papers[mask]
+
+    def papers_by_venue_year(self, pid, conference=None, years=None):
+        """作者在每个 (会议, 年份) 的论文数，按会议、年份排序"""
+        papers = self.papers(pid, conference, years)
+        pairs = np.stack([self.paper_conference[papers], self.paper_year[papers]], axis=1)
+        if not len(pairs):
+            return []
+        values, counts = np.unique(pairs, axis=0, return_counts=True)
+        conferences = self.meta['conferences']
+        return sorted(((conferences[code], int(year), int(count)) for (code, year), count in zip(values, counts)))
+
+    def collaborators(self, pid, top=10):
+        """合作最多的作者：[(pid, 姓名, 合作论文数), ...]"""
+        author = self.author(pid)
+        start, end = self.neighbor_offsets[author], self.neighbor_offsets[author + 1]
+        weights = np.asarray(self.weights[start:end])
+        order = np.argsort(-weights, kind='stable')[:top]
+        neighbors = np.asarray(self.neighbors[start:end])[order]
+        return [(self.author_ids[n], self.names[n], int(w)) for n, w in zip(neighbors, weights[order])]
+
+    def k_hop(self, pid, hops=2):
+        """k 跳邻域：逐层扩展前沿，返回每一层新到达的作者编号数组（第 0 层为作者本人）"""
+        author = self.author(pid)
+        visited = np.zeros(len(self.author_ids), dtype=bool)
+        visited[author] = True
+        frontier = np.array([author], dtype=np.int64)
+        layers = [frontier]
+        for _ in range(hops):
+            starts, ends = self.neighbor_offsets[frontier], self.neighbor_offsets[frontier + 1]
+            if not (ends - starts).sum():
+                break
+            reached = np.unique(np.concatenate([self.neighbors[s:e] for s, e in zip(starts, ends)]))
+            frontier = reached[~visited[reached]]
+            if not len(frontier):
+                break
+            visited[frontier] = True
+            layers.append(frontier)
+        return layers
+
+    def component(self, pid):
+        """作者所在连通分量的全部作者编号"""
+        label = self.components[self.author(pid)]
+        return np.flatnonzero(np.asarray(self.components) == label)
+
+    def component_sizes(self):
+        """各连通分量的大小，降序"""
+        _, counts = np.unique(self.components, return_counts=True)
+        return np.sort(counts)[::-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合作者图：构建与查询（作者以 dblp pid 标识）")
+    parser.add_argument('--graph', default=GRAPH_DIR, help="图目录")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="从 papers.jsonl 或列式存储构建")
+    build.add_argument('--input', default="papers.jsonl")
+
+    papers = subparsers.add_parser('papers', help="作者在各会议/年份的论文")
+    papers.add_argument('pid')
+    papers.add_argument('--conference')
+    papers.add_argument('--years', type=int, nargs=2, metavar=('START', 'END'))
+    papers.add_argument('--list', action='store_true', help="同时列出论文 key")
+
+    collaborators = subparsers.add_parser('collaborators', help="合作最多的作者")
+    collaborators.add_argument('pid')
+    collaborators.add_argument('-n', type=int, default=10)
+
+    hops = subparsers.add_parser('hops', help="k 跳邻域")
+    hops.add_argument('pid')
+    hops.add_argument('-k', type=int, default=2)
+
+    component = subparsers.add_parser('components', help="连通分量统计；给出 pid 时显示其所在分量")
+    component.add_argument('pid', nargs='?')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        authors, papers_count = build_graph(iter_paper_records(args.input, GRAPH_COLUMNS), args.graph)
+        print(f"合作者图已保存到: {args.graph}（{authors} 位作者，{papers_count} 篇论文），"
+              f"用时 {time.perf_counter() - start:.2f} 秒")
+        return
+
+    graph = CoauthorGraph(args.graph)
+    if args.command == 'papers':
+        years = tuple(args.years) if args.years else None
+        for conference, year, count in graph.papers_by_venue_year(args.pid, args.conference, years):
+            print(f"{conference} {year}: {count} 篇")
+        if args.list:
+            for paper in graph.papers(args.pid, args.conference, years):
+                print(f"    {graph.paper_keys[paper]}")
+    elif args.command == 'collaborators':
+        for pid, name, count in graph.collaborators(args.pid, args.n):
+            print(f"{count:>4}  {name} ({pid})")
+    elif args.command == 'hops':
+        for hop, layer in enumerate(graph.k_hop(args.pid, args.k)):
+            print(f"第 {hop} 跳: {len(layer)} 位作者")
+    elif args.command == 'components':
+        sizes = graph.component_sizes()
+        print(f"{len(sizes)} 个连通分量，最大的 5 个: {sizes[:5].tolist()}")
+        if args.pid:
+            print(f"{args.pid} 所在分量: {len(graph.component(args.pid))} 位作者")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import gzip
+import json
+import argparse
+import html.entities
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from dblp_fetcher import VENUE_MODULES, load_venue
+from parse_papers import parse_filename
+
+# 只关心这几个前缀下的记录，其余记录直接丢弃
+KEY_PREFIXES = ('conf/icde/', 'conf/sigmod/', 'journals/pvldb/', 'conf/vldb/')
+
+# dblp.xml 中的顶层记录类型
+RECORD_TAGS = {
+    'article', 'inproceedings', 'proceedings', 'book', 'incollection',
+    'phdthesis', 'mastersthesis', 'www', 'data',
+}
+
+# 记录类型对应检索接口里的 type 字段
+RECORD_TYPES = {
+    'article': 'Journal Articles',
+    'inproceedings': 'Conference and Workshop Papers',
+    'proceedings': 'Editorship',
+    'incollection': 'Parts in Books or Collections',
+    'book': 'Books and Theses',
+}
+
+DOI_PREFIXES = ('https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/', 'http://dx.doi.org/')
+
+
+def build_toc_table(venue_names, last_year=None):
+    """
+    用各会议下载脚本里的查询构建规则，生成 目录名 -> (conference, year, volume) 的映射。
+    这样导入的记录范围与按年查询检索接口得到的完全一致。
+    """
+    last_year = last_year or datetime.now().year + 1
+    table = {}
+    for name in venue_names:
+        venue = load_venue(name)
+        for year in range(venue.first_year, last_year + 1):
+            query = venue.build_query(year)
+            if query is None:
+                continue
+            # toc:db/conf/icde/icde2020.bht: -> db/conf/icde/icde2020
+            source = parse_filename(venue.build_filename(year))
+            if source is None:
+                # parse_papers 不处理的文件（2008年前的VLDB），导入时同样跳过
+                continue
+            toc = query[len('toc:'):].rsplit('.bht', 1)[0]
+            table[toc] = source
+    return table
+
+
+def open_dump(path):
+    """打开 dblp.xml 或 dblp.xml.gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def make_parser():
+    """dblp.xml 依赖 dblp.dtd 里的字符实体（如 &ouml;），这里直接按HTML实体表解析"""
+    parser = ET.XMLParser()
+    parser.entity.update((name, chr(code)) for name, code in html.entities.name2codepoint.items())
+    return parser
+
+
+def element_text(elem):
+    """标题里可能带 <i>、<sub> 等标记，取全部文本"""
+    return ''.join(elem.itertext())
+
+
+def parse_record(record, conference, year, volume):
+    """把一条 dblp.xml 记录转换成与 parse_papers.parse_paper 相同格式的论文信息"""
+    key = record.get('key', '')
+    fields = {}
+    names = []
+    ees = []
+    open_access = False
+    for child in record:
+        tag = child.tag
+        if tag == 'author' or (tag == 'editor' and record.tag == 'proceedings'):
+            # 检索接口把论文集的编者也放在 authors 里；dblp.xml 中的作者不带 pid
+            names.append({'name': child.text, 'pid': child.get('pid', '')})
+        elif tag == 'ee':
+            ees.append(child.text)
+            if 'oa' in child.get('type', '').split():
+                open_access = True
+        elif tag not in fields:
+            fields[tag] = element_text(child) if tag == 'title' else child.text
+
+    doi = ''
+    for ee in ees:
+        if ee and ee.startswith(DOI_PREFIXES):
+            doi = ee.split('.org/', 1)[1]
+            break
+
+    paper = {
+        'conference': conference,
+        'year': year,
+        'volume': volume,
+        'title': fields.get('title', ''),
+        'authors': names,
+        'doi': doi,
+        'url': f"https://dblp.org/rec/{key}",
+        'pages': fields.get('pages', ''),
+        'type': RECORD_TYPES.get(record.tag, ''),
+        'key': key,
+        'venue': fields.get('booktitle') or fields.get('journal') or '',
+    }
+
+    if 'year' in fields:
+        paper['published_year'] = fields['year']
+    if ees:
+        # dblp.xml 只标记开放获取的链接，其余按 closed 处理
+        paper['access'] = 'open' if open_access else 'closed'
+        paper['ee'] = ees[0]
+
+    return paper
+
+
+def iter_dump_papers(path, venue_names=None, key_prefixes=KEY_PREFIXES):
+    """
+    单遍流式读取 dblp.xml(.gz)，逐条产出属于目标会议目录的论文。
+    每处理完一条顶层记录就清空根节点，内存占用与文件大小无关。
+    """
+    toc_table = build_toc_table(venue_names or sorted(VENUE_MODULES))
+
+    with open_dump(path) as f:
+        root = None
+        depth = 0
+        for event, elem in ET.iterparse(f, events=('start', 'end'), parser=make_parser()):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+
+            depth -= 1
+            # 只在顶层记录结束时处理，子元素留给记录自己遍历
+            if depth != 1 or elem.tag not in RECORD_TAGS:
+                continue
+
+            key = elem.get('key', '')
+            if key.startswith(key_prefixes):
+                url = elem.findtext('url') or ''
+                # db/conf/icde/icde2020.html#0001BM20 -> db/conf/icde/icde2020
+                source = toc_table.get(url.split('#', 1)[0].rsplit('.html', 1)[0])
+                if source is not None:
+                    yield parse_record(elem, *source)
+
+            root.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从 dblp.xml(.gz) 全量数据导入论文，输出与 parse_papers.py 相同的 JSONL")
+    parser.add_argument('dump', help="dblp.xml 或 dblp.xml.gz 路径")
+    parser.add_argument('-o', '--output', default="papers.jsonl", help="输出的 JSONL 文件")
+    parser.add_argument('--venues', nargs='+', choices=sorted(VENUE_MODULES), default=sorted(VENUE_MODULES))
+    args = parser.parse_args()
+
+    print(f"正在读取: {args.dump} ({os.path.getsize(args.dump) / 1e6:.1f} MB)")
+    counts = {}
+    tmp_file = args.output + '.part'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for paper in iter_dump_papers(args.dump, args.venues):
+            json.dump(paper, f, ensure_ascii=False)
+            f.write('\n')
+            counts[paper['conference']] = counts.get(paper['conference'], 0) + 1
+    os.replace(tmp_file, args.output)
+
+    print(f"\n导入完成！")
+    for conference, count in sorted(counts.items()):
+        print(f"{conference}: {count} 篇论文")
+    print(f"总共导入了 {sum(counts.values())} 篇论文")
+    print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+import os
+import re
+import time
+import json
+import hashlib
+import tempfile
+import random
+import argparse
+import importlib
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+from instrumentation import metrics
+
+# dblp 检索接口
+DBLP_API_URL = "https://dblp.org/search/publ/api"
+
+# dblp 单次请求最多返回的条目数
+PAGE_SIZE = 1000
+
+# 结果文件中的 <hits total=".." sent=".." first=".."> 标签
+HITS_TAG_RE = re.compile(rb'<hits\b[^>]*>')
+HITS_ATTR_RE = re.compile(rb'(\w+)="(\d+)"')
+
+# 默认的下载清单文件
+MANIFEST_FILE = "fetch_manifest.json"
+
+# 单年下载结果
+FETCHED = 'fetched'      # 下载了新内容
+UNCHANGED = 'unchanged'  # 服务器返回304或内容哈希未变，没有改写文件
+FROZEN = 'frozen'        # 年份已冻结且本地文件完好，没有发请求
+FAILED = 'failed'
+
+# 各会议的下载定义所在的脚本
+VENUE_MODULES = {
+    'icde': 'download_icde_papers',
+    'sigmod': 'download_sigmod_papers',
+    'vldb': 'download_vldb_papers',
+}
+
+
+class TokenBucket:
+    """令牌桶限速器：平均每秒发放 rate 个令牌，最多积攒 capacity 个用于突发请求"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """阻塞直到拿到一个令牌"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """服务器要求退避时，让所有线程至少等待 seconds 秒再发请求"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class Venue:
+    """单个会议的下载定义：查询字符串、输出文件名和额外的请求参数"""
+
+    def __init__(self, name, output_dir, build_query, build_filename, first_year, extra_params=None):
+        self.name = name
+        self.output_dir = output_dir
+        self.build_query = build_query
+        self.build_filename = build_filename
+        self.first_year = first_year
+        self.extra_params = extra_params or {}
+
+    def output_path(self, year):
+        return os.path.join(self.output_dir, self.build_filename(year))
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头，支持秒数和 HTTP 日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class IncompleteFetchError(Exception):
+    """合并后的条目数与接口报告的 hits@total 不一致"""
+
+
+def split_hits(content):
+    """把一页结果拆成 (hits之前的部分, hits开始标签, 条目部分, hits结束标签及之后的部分)"""
+    match = HITS_TAG_RE.search(content)
+    if match is None:
+        raise ValueError("结果中没有 <hits> 标签")
+    tag = match.group(0)
+    if tag.endswith(b'/>'):
+        # 没有任何条目时是自闭合标签
+        return content[:match.start()], tag, b'', content[match.end():]
+    end = content.find(b'</hits>', match.end())
+    if end < 0:
+        raise ValueError("结果中没有 </hits> 结束标签")
+    return content[:match.start()], tag, content[match.end():end], content[end:]
+
+
+def hits_attrs(tag):
+    """读取 <hits> 标签上的数字属性（total / computed / sent / first）"""
+    return {name.decode(): int(value) for name, value in HITS_ATTR_RE.findall(tag)}
+
+
+def count_hits(body):
+    return body.count(b'<hit ') + body.count(b'<hit>')
+
+
+def hits_sha256(path):
+    """
+    结果文件的内容指纹：只对 <hits> 中的条目部分求哈希。
+    <time>、<query id> 等每次请求都会变化，计入哈希的话内容相同的两次下载也永远对不上。
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    try:
+        body = split_hits(content)[2]
+    except ValueError:
+        return None
+    return hashlib.sha256(body).hexdigest()
+
+
+class FetchManifest:
+    """下载清单：记录每个结果文件的URL、ETag/Last-Modified、内容哈希、条目数和下载时间"""
+
+    def __init__(self, path=MANIFEST_FILE):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def _key(output_file):
+        return output_file.replace(os.sep, '/')
+
+    def get(self, output_file):
+        with self.lock:
+            return self.entries.get(self._key(output_file))
+
+    def update(self, output_file, **fields):
+        with self.lock:
+            entry = self.entries.setdefault(self._key(output_file), {})
+            entry.update(fields)
+
+    def save(self):
+        with self.lock:
+            tmp_file = self.path + '.part'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp_file, self.path)
+
+
+class DblpFetcher:
+    """共享的 dblp 下载器：复用连接的会话 + 令牌桶限速 + 有界并发"""
+
+    def __init__(self, base_url=DBLP_API_URL, workers=4, rate=1.0, burst=2,
+                 max_retries=5, backoff=2.0, timeout=60, manifest=None, frozen_years=None, force=False):
+        self.base_url = base_url
+        # manifest 为 None 时不做增量判断，每次都完整下载
+        self.manifest = manifest
+        # 早于 (今年 - frozen_years) 的年份视为不会再变化
+        self.frozen_years = frozen_years
+        # force 为 True 时忽略清单里的旧记录，但仍然写入新记录
+        self.force = force
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = TokenBucket(rate, burst)
+        # 翻页请求单独一个线程池，避免外层任务等待内层任务时互相占满线程
+        self.page_executor = ThreadPoolExecutor(max_workers=workers)
+
+        # 连接池大小与并发数一致，保证每个线程都能复用keep-alive连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.page_executor.shutdown()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, params, headers=None):
+        """发送请求；遇到429/503按Retry-After退避，其他临时错误按指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            with metrics.stage('rate_limit_wait'):
+                self.limiter.acquire()
+            try:
+                with metrics.stage('http_request'):
+                    response = self.session.get(self.base_url, params=params, headers=headers,
+                                                timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                metrics.count('http_retries')
+                wait = self.backoff * (2 ** attempt) + random.uniform(0, 1)
+                print(f"请求出错 ({e})，{wait:.1f} 秒后重试...")
+                time.sleep(wait)
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                wait = parse_retry_after(response.headers.get('Retry-After'))
+                if wait is None:
+                    wait = self.backoff * (2 ** attempt) + random.uniform(0, 1)
+                print(f"服务器返回 {response.status_code}，{wait:.1f} 秒后重试...")
+                metrics.count('http_retries')
+                # 限速器暂停会同时拦住其他线程，避免一起撞上限流
+                self.limiter.pause(wait)
+                continue
+
+            response.raise_for_status()
+            metrics.count('http_requests')
+            metrics.count('bytes_fetched', len(response.content))
+            return response
+
+    def _fetch_page(self, params, first, spool_dir):
+        """下载从第 first 条开始的一页，落盘到临时文件后返回文件路径"""
+        page_params = dict(params, f=str(first))
+        response = self.get(page_params)
+        fd, path = tempfile.mkstemp(prefix=f"page{first}_", suffix='.xml', dir=spool_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(response.content)
+        return path
+
+    def _write_merged(self, output_file, first_content, page_files, total):
+        """把第一页和后续各页的条目流式拼接成一个文件，并核对条目总数；返回 (条目数, 条目部分的哈希)"""
+        head, tag, body, tail = split_hits(first_content)
+        merged = count_hits(body)
+
+        # 合并后的文件就是一次性返回全部条目的样子
+        tag = re.sub(rb'sent="\d+"', b'sent="%d"' % total, tag)
+        tag = re.sub(rb'first="\d+"', b'first="0"', tag)
+
+        sha = hashlib.sha256(body)
+        with open(output_file, 'wb') as out:
+            out.write(head)
+            out.write(tag)
+            out.write(body)
+            # 每次只读一页进内存
+            for path in page_files:
+                with open(path, 'rb') as f:
+                    _, _, page_body, _ = split_hits(f.read())
+                merged += count_hits(page_body)
+                sha.update(page_body)
+                out.write(page_body)
+            out.write(tail)
+
+        if merged != total:
+            raise IncompleteFetchError(f"合并后共 {merged} 条，但接口报告 {total} 条")
+        return merged, sha.hexdigest()
+
+    def is_frozen(self, year):
+        return self.frozen_years is not None and year < datetime.now().year - self.frozen_years
+
+    def download_year(self, venue, year):
+        """下载某个会议某一年的论文引用文件，返回 FETCHED / UNCHANGED / FROZEN / FAILED"""
+        query = venue.build_query(year)
+        if query is None:
+            return FAILED
+
+        params = {
+            'q': query,
+            'h': str(PAGE_SIZE),
+            'format': 'xml',
+        }
+        params.update(venue.extra_params)
+
+        os.makedirs(venue.output_dir, exist_ok=True)
+        output_file = venue.output_path(year)
+        # 先写临时文件再替换，避免中断时留下半个文件
+        tmp_file = output_file + '.part'
+
+        # 本地已有文件的条目哈希，用于判断清单是否可信以及新内容是否真的变化
+        entry = self.manifest.get(output_file) if self.manifest is not None else None
+        old_sha = hits_sha256(output_file) if os.path.exists(output_file) else None
+        if self.force or (entry and entry.get('hits_sha256') != old_sha):
+            entry = None
+
+        if entry and self.is_frozen(year):
+            print(f"{venue.name} {year} 年已冻结，跳过下载")
+            return FROZEN
+
+        # 有可信的清单记录时发送条件请求
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = self.get(params, headers=headers)
+            if response.status_code == 304:
+                print(f"{venue.name} {year} 年未变化（304），跳过")
+                metrics.count('http_not_modified')
+                self.manifest.update(output_file, checked_at=datetime.now().isoformat(timespec='seconds'))
+                return UNCHANGED
+
+            content = response.content
+            attrs = hits_attrs(split_hits(content)[1])
+            total = attrs.get('total', 0)
+            sent = attrs.get('sent', 0)
+
+            with tempfile.TemporaryDirectory(dir=venue.output_dir) as spool_dir:
+                offsets = list(range(sent, total, PAGE_SIZE)) if sent else []
+                futures = [self.page_executor.submit(self._fetch_page, params, first, spool_dir)
+                           for first in offsets]
+                try:
+                    page_files = [future.result() for future in futures]
+                except BaseException:
+                    # 取消还没开始的页，并等正在下载的页结束，再删除它们写入的临时目录
+                    for future in futures:
+                        future.cancel()
+                    wait(futures)
+                    raise
+                if page_files:
+                    print(f"{venue.name} {year} 年共 {total} 条，分 {len(page_files) + 1} 页下载")
+                with metrics.stage('merge_pages'):
+                    hits, sha = self._write_merged(tmp_file, content, page_files, total)
+            metrics.count('hits_fetched', hits)
+        except (requests.RequestException, ValueError, IncompleteFetchError) as e:
+            print(f"下载失败 {venue.name} {year}: {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            return FAILED
+
+        now = datetime.now().isoformat(timespec='seconds')
+        if self.manifest is not None:
+            self.manifest.update(
+                output_file,
+                venue=venue.name,
+                year=year,
+                url=response.url,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                hits_sha256=sha,
+                hits=hits,
+                fetched_at=now,
+                checked_at=now,
+            )
+
+        if sha == old_sha:
+            # 内容没变就不改写文件，保留原来的修改时间
+            os.remove(tmp_file)
+            print(f"{venue.name} {year} 年内容未变化，保留 {output_file}")
+            return UNCHANGED
+
+        os.replace(tmp_file, output_file)
+        print(f"成功下载 {venue.name} {year} 年的论文引用文件到 {output_file}")
+        return FETCHED
+
+    def _timed_download_year(self, venue, year):
+        with metrics.stage('download_year'):
+            return self.download_year(venue, year)
+
+    def download(self, venue, year):
+        """下载单个年份并保存清单，返回是否成功"""
+        status = self.download_year(venue, year)
+        if self.manifest is not None:
+            self.manifest.save()
+        return status != FAILED
+
+    def download_many(self, jobs):
+        """并发下载一组 (venue, year) 任务，返回 (成功数, 失败数)"""
+        counts = {FETCHED: 0, UNCHANGED: 0, FROZEN: 0, FAILED: 0}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self._timed_download_year, venue, year): (venue, year)
+                       for venue, year in jobs}
+            for future in as_completed(futures):
+                venue, year = futures[future]
+                try:
+                    status = future.result()
+                except Exception as e:
+                    print(f"下载失败 {venue.name} {year}: {e}")
+                    status = FAILED
+                counts[status] += 1
+                metrics.count(f'years_{status}')
+
+        if self.manifest is not None:
+            self.manifest.save()
+
+        success_count = counts[FETCHED] + counts[UNCHANGED] + counts[FROZEN]
+        fail_count = counts[FAILED]
+        print(f"\n下载完成！成功: {success_count} 个文件"
+              f"（新内容 {counts[FETCHED]}，未变化 {counts[UNCHANGED]}，冻结跳过 {counts[FROZEN]}），"
+              f"失败: {fail_count} 个文件")
+        return success_count, fail_count
+
+    def download_range(self, venue, start_year, end_year):
+        print(f"开始下载 {start_year} 到 {end_year} 年的{venue.name}论文引用文件...")
+        return self.download_many([(venue, year) for year in range(start_year, end_year + 1)])
+
+
+def load_venue(name):
+    """按名称加载会议定义（icde / sigmod / vldb）"""
+    return importlib.import_module(VENUE_MODULES[name]).VENUE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发下载 dblp 会议论文引用文件")
+    parser.add_argument('--venues', nargs='+', choices=sorted(VENUE_MODULES), default=sorted(VENUE_MODULES))
+    parser.add_argument('--start', type=int, default=1975, help="起始年份")
+    parser.add_argument('--end', type=int, default=datetime.now().year, help="结束年份")
+    parser.add_argument('--workers', type=int, default=4, help="并发请求数")
+    parser.add_argument('--rate', type=float, default=1.0, help="每秒平均请求数")
+    parser.add_argument('--base-url', default=DBLP_API_URL, help="dblp 接口地址（可指向本地测试服务）")
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help="下载清单文件，用于增量刷新")
+    parser.add_argument('--frozen-years', type=int, default=None,
+                        help="早于 今年-N 的年份若本地文件完好则不再请求")
+    parser.add_argument('--force', action='store_true', help="忽略清单里的记录，全部重新下载")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args, 'dblp_fetcher')
+
+    jobs = []
+    for name in args.venues:
+        venue = load_venue(name)
+        for year in range(max(args.start, venue.first_year), args.end + 1):
+            jobs.append((venue, year))
+
+    print(f"共 {len(jobs)} 个下载任务，并发数 {args.workers}，限速 {args.rate} 次/秒")
+    with DblpFetcher(args.base_url, workers=args.workers, rate=args.rate, manifest=FetchManifest(args.manifest),
+                     frozen_years=args.frozen_years, force=args.force) as fetcher:
+        fetcher.download_many(jobs)
+    instrumentation.finish(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
-import os
-import requests
-import time
-from urllib.parse import quote
+import argparse
+
+import instrumentation
+from dblp_fetcher import DblpFetcher, FetchManifest, Venue
 
 def get_volume_number(year):
     """
@@ -13,93 +13,64 @@ def get_volume_number(year):
         return None
     return volume
 
-def download_vldb_papers(year):
-    # 创建保存文件的文件夹
-    output_dir = "VLDB_PAPER"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # 构建URL
-    base_url = "https://dblp.org/search/publ/api"
-    
+def build_vldb_query(year):
+    """构建VLDB某一年的dblp目录查询"""
     if year >= 2008:
         # 2008年及以后使用期刊格式
         volume = get_volume_number(year)
         if volume is None:
             print("从 2008 年起，VLDB 社区决定：采用'期刊式'论文集出版模式。PVLDB只支持下载2008年后的论文")
-            return False
-        query = f"toc:db/journals/pvldb/pvldb{volume}.bht:"
-    else:
-        # 2008年之前使用会议格式
-        print(f"注意：{year}年的论文使用传统会议论文集格式")
-        if year < 2000:
-            # 2000年前使用两位数年份
-            year_suffix = str(year)[-2:]
-            query = f"toc:db/conf/vldb/vldb{year_suffix}.bht:"
-        else:
-            query = f"toc:db/conf/vldb/vldb{year}.bht:"
-    
-    params = {
-        'q': query,
-        'h': '1000',
-        'format': 'xml'
-    }
-    
-    try:
-        # 发送请求
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()  # 检查请求是否成功
-        
-        # 保存文件
-        if year >= 2008:
-            output_file = os.path.join(output_dir, f"vldb_{year}_vol{get_volume_number(year)}.xml")
-        else:
-            output_file = os.path.join(output_dir, f"vldb_{year}.xml")
-            
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        print(f"成功下载 VLDB {year} 年的论文引用文件到 {output_file}")
-        return True
-        
-    except requests.RequestException as e:
-        print(f"下载失败: {e}")
-        return False
+            return None
+        return f"toc:db/journals/pvldb/pvldb{volume}.bht:"
+
+    # 2008年之前使用传统会议论文集格式
+    if year < 2000:
+        # 2000年前使用两位数年份
+        year_suffix = str(year)[-2:]
+        return f"toc:db/conf/vldb/vldb{year_suffix}.bht:"
+    return f"toc:db/conf/vldb/vldb{year}.bht:"
+
+def build_vldb_filename(year):
+    if year >= 2008:
+        return f"vldb_{year}_vol{get_volume_number(year)}.xml"
+    return f"vldb_{year}.xml"
 
-def download_vldb_papers_range(start_year, end_year):
-    print(f"开始下载 {start_year} 到 {end_year} 年的VLDB论文引用文件...")
-    success_count = 0
-    fail_count = 0
-    
-    for year in range(start_year, end_year + 1):
-        print(f"\n正在处理 {year} 年的数据...")
-        if download_vldb_papers(year):
-            success_count += 1
-            if year != end_year:  # 如果不是最后一年，则等待10秒
-                print(f"下载成功，等待10秒后继续下载下一年...")
-                time.sleep(10)
-        else:
-            fail_count += 1
-            if year != end_year:  # 如果不是最后一年，则等待1秒
-                print("下载失败，等待1秒后继续尝试下一年...")
-                time.sleep(1)
-    
-    print(f"\n下载完成！成功: {success_count} 个文件，失败: {fail_count} 个文件")
-    return success_count, fail_count
+VENUE = Venue(
+    name='VLDB',
+    output_dir="VLDB_PAPER",
+    build_query=build_vldb_query,
+    build_filename=build_vldb_filename,
+    first_year=1975,
+)
+
+def download_vldb_papers(year, fetcher=None):
+    if fetcher is not None:
+        return fetcher.download(VENUE, year)
+    # 自己创建的下载器用完即关闭（会话和分页线程池）
+    with DblpFetcher(manifest=FetchManifest()) as fetcher:
+        return fetcher.download(VENUE, year)
+
+def download_vldb_papers_range(start_year, end_year, fetcher=None):
+    if fetcher is not None:
+        return fetcher.download_range(VENUE, start_year, end_year)
+    with DblpFetcher(manifest=FetchManifest()) as fetcher:
+        return fetcher.download_range(VENUE, start_year, end_year)
 
 if __name__ == "__main__":
-    try:
-        # 获取年份范围
-        start_year = int(input("请输入起始年份: "))
-        end_year = int(input("请输入结束年份: "))
-        
-        # 验证输入
-        if start_year > end_year:
-            print("错误：起始年份不能大于结束年份！")
-        elif end_year > 2024:
-            print("警告：结束年份超过当前年份，可能没有数据。")
-        else:
-            # 执行下载
-            download_vldb_papers_range(start_year, end_year)
-        
-    except ValueError:
-        print("错误：请输入有效的年份数字！") 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="下载VLDB论文引用文件")
+    parser.add_argument('--start', type=int, required=True, help="起始年份")
+    parser.add_argument('--end', type=int, required=True, help="结束年份")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args, 'download_vldb_papers')
+    start_year, end_year = args.start, args.end
+
+    # 验证输入
+    if start_year > end_year:
+        print("错误：起始年份不能大于结束年份！")
+    elif end_year > 2024:
+        print("警告：结束年份超过当前年份，可能没有数据。")
+    else:
+        # 执行下载
+        download_vldb_papers_range(start_year, end_year)
+        instrumentation.finish(args)
@@ -0,0 +1,148 @@
+import os
+import re
+import hashlib
+import argparse
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, EmbeddingWriter
+
+# 默认的缓存目录
+CACHE_DIR = "embedding_cache"
+
+
+def text_hash(text):
+    """嵌入文本的内容哈希，作为缓存主键"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def cache_path(cache_dir, model_name, normalized):
+    """每个 (模型, 是否归一化) 组合一个缓存文件"""
+    safe_name = re.sub(r'[^A-Za-z0-9._-]+', '_', model_name)
+    suffix = 'norm' if normalized else 'raw'
+    return os.path.join(cache_dir, f"{safe_name}.{suffix}.bin")
+
+
+class EmbeddingCache:
+    """
+    内容寻址的嵌入缓存：主键是 (模型名, 文本哈希)，底层是可追加的嵌入存储文件。
+    文本没变的论文直接复用缓存的向量，只需要编码未命中的部分。
+    """
+
+    def __init__(self, cache_dir, model_name, normalized=False):
+        self.model_name = model_name
+        self.normalized = normalized
+        self.path = cache_path(cache_dir, model_name, normalized)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._store = None
+
+    @property
+    def store(self):
+        if self._store is None and os.path.exists(self.path):
+            self._store = EmbeddingStore(self.path)
+            if self._store.model_name != self.model_name:
+                raise ValueError(f"缓存文件 {self.path} 属于模型 {self._store.model_name}")
+        return self._store
+
+    def __len__(self):
+        return len(self.store) if self.store is not None else 0
+
+    @property
+    def dim(self):
+        return self.store.dim if self.store is not None else None
+
+    def lookup(self, hashes):
+        """批量查找，返回 (行号数组, 命中掩码)"""
+        if self.store is None:
+            return np.full(len(hashes), -1, dtype=np.int64), np.zeros(len(hashes), dtype=bool)
+        return self.store.rows(hashes)
+
+    def vectors(self, rows):
+        return np.asarray(self.store.matrix[rows], dtype=np.float32)
+
+    def appender(self, dim):
+        """
+        以追加方式打开缓存文件，供流式写入多批向量。
+        已经打开的只读视图仍然有效，但看不到本次追加的条目。
+        """
+        return EmbeddingWriter(self.path, self.model_name, dim, normalized=self.normalized, append=True)
+
+    def add(self, hashes, vectors):
+        """把新编码的向量追加到缓存"""
+        if len(hashes) == 0:
+            return
+        with self.appender(vectors.shape[1]) as writer:
+            writer.write(hashes, vectors)
+        self._store = None
+
+    def compact(self, keep_hashes):
+        """只保留 keep_hashes 中仍被引用的条目并去重，返回 (保留数, 删除数)"""
+        store = self.store
+        if store is None:
+            return 0, 0
+        index = store.index
+        keep = sorted({index[h] for h in keep_hashes if h in index})
+        removed = len(store) - len(keep)
+
+        # 新存储写到 .part，完成后才替换原缓存
+        with EmbeddingWriter(self.path, self.model_name, store.dim, normalized=self.normalized) as writer:
+            # 分块复制，避免一次性把整个缓存读进内存
+            for start in range(0, len(keep), 65536):
+                rows = keep[start:start + 65536]
+                writer.write([store.keys[row] for row in rows], store.matrix[rows])
+        self._store = None
+        return len(keep), removed
+
+
+def referenced_hashes(papers, fulltext=None):
+    """
+    论文（主键 -> 记录）引用的缓存条目。fulltext 为 主键 -> PDF补充文本，
+    有补充文本的论文同时保留不带和带全文两种嵌入文本，加不加 --fulltext 运行都能命中。
+    """
+    from generate_embeddings import create_paper_text
+
+    fulltext = fulltext or {}
+    hashes = set()
+    for key, paper in papers.items():
+        hashes.add(text_hash(create_paper_text(paper)))
+        if fulltext.get(key):
+            hashes.add(text_hash(create_paper_text(paper, fulltext[key])))
+    return hashes
+
+
+def main():
+    from generate_embeddings import load_papers
+
+    parser = argparse.ArgumentParser(description="嵌入缓存维护")
+    parser.add_argument('command', choices=['stats', 'compact'],
+                        help="stats：查看缓存；compact：清除 papers.jsonl 中已不再引用的条目")
+    parser.add_argument('--input', default="papers.jsonl", help="papers.jsonl 或列式存储目录")
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--normalize', action='store_true')
+    parser.add_argument('--fulltext', metavar='FILE',
+                        help="generate_embeddings.py 使用的 pdf_texts.jsonl；带全文的嵌入文本对应的条目同样保留")
+    args = parser.parse_args()
+
+    cache = EmbeddingCache(args.cache_dir, args.model, args.normalize)
+    if cache.store is None:
+        print(f"缓存不存在: {cache.path}")
+        return
+
+    fulltext = None
+    if args.fulltext:
+        from pdf_text import load_fulltext
+        fulltext = load_fulltext(args.fulltext)
+    papers = load_papers(args.input)
+    hashes = referenced_hashes(papers, fulltext)
+    _, hit = cache.lookup(sorted(hashes))
+    print(f"缓存文件: {cache.path}")
+    print(f"缓存条目: {len(cache)}，当前论文引用: {int(hit.sum())} / {len(hashes)}")
+
+    if args.command == 'compact':
+        kept, removed = cache.compact(hashes)
+        print(f"压缩完成！保留 {kept} 条，删除 {removed} 条")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import os
+import json
+import struct
+import argparse
+
+import numpy as np
+
+# 文件格式：固定大小的文件头（魔数 + JSON元数据），随后是按行连续存放的向量矩阵；
+# 行号对应的主键按行写在同名的 .keys 文件中；int8 存储的逐维缩放/偏移写在同名的 .quant.npy 中
+MAGIC = b'PEMB0001'
+HEADER_SIZE = 4096
+SUPPORTED_DTYPES = ('float32', 'float16', 'int8')
+
+
+def keys_path(path):
+    return path + '.keys'
+
+
+def quant_path(path):
+    return path + '.quant.npy'
+
+
+def _pack_header(header):
+    payload = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    if len(MAGIC) + 4 + len(payload) > HEADER_SIZE:
+        raise ValueError("文件头过大")
+    block = MAGIC + struct.pack('<I', len(payload)) + payload
+    return block + b'\0' * (HEADER_SIZE - len(block))
+
+
+def read_header(path):
+    """只读取文件头：模型名、维度、数据类型、是否归一化、向量条数，不读取任何向量"""
+    with open(path, 'rb') as f:
+        block = f.read(HEADER_SIZE)
+    if len(block) < HEADER_SIZE or not block.startswith(MAGIC):
+        raise ValueError(f"不是嵌入存储文件: {path}")
+    (length,) = struct.unpack('<I', block[len(MAGIC):len(MAGIC) + 4])
+    return json.loads(block[len(MAGIC) + 4:len(MAGIC) + 4 + length].decode('utf-8'))
+
+
+class EmbeddingWriter:
+    """
+    流式写入嵌入存储：可以分多次追加向量，close() 时把条数写回文件头。
+    新建的存储先写到 <path>.part，close() 时才替换原文件；abort() 丢弃临时文件，原文件保持不变。
+    append=True 时在已有存储后面继续追加（模型、维度、类型、归一化必须一致）。
+    quantizer 为 int8 存储的 (scale, offset)，与矩阵、主键文件一起在 close() 时替换。
+    """
+
+    def __init__(self, path, model_name, dim, dtype='float32', normalized=False, append=False, quantizer=None):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"不支持的数据类型: {dtype}")
+        if (quantizer is not None) != (dtype == 'int8' and not append):
+            raise ValueError("新建 int8 存储时必须（且只有这时）给出 quantizer")
+        self.path = path
+        self.header = {
+            'model': model_name,
+            'dim': int(dim),
+            'dtype': dtype,
+            'normalized': bool(normalized),
+            'count': 0,
+        }
+        self.row_bytes = self.header['dim'] * np.dtype(dtype).itemsize
+        self.tmp_path = None
+
+        if append and os.path.exists(path):
+            existing = read_header(path)
+            for field in ('model', 'dim', 'dtype', 'normalized'):
+                if existing[field] != self.header[field]:
+                    raise ValueError(f"追加写入的 {field} 与已有存储不一致: {existing[field]} != {self.header[field]}")
+            self.header['count'] = existing['count']
+            self.f = open(path, 'r+b')
+            # 截掉上次异常中断时可能残留的半截数据
+            self.f.truncate(HEADER_SIZE + self.header['count'] * self.row_bytes)
+            self.f.seek(0, os.SEEK_END)
+            self.keys_file = _open_keys_for_append(keys_path(path), self.header['count'])
+        else:
+            self.tmp_path = path + '.part'
+            self.f = open(self.tmp_path, 'wb')
+            self.f.write(_pack_header(self.header))
+            self.keys_file = open(keys_path(self.tmp_path), 'w', encoding='utf-8')
+            if quantizer is not None:
+                np.save(quant_path(self.tmp_path), np.stack(quantizer))
+
+    def write(self, keys, vectors):
+        """追加一批向量，keys 与 vectors 的行一一对应"""
+        vectors = np.ascontiguousarray(vectors, dtype=self.header['dtype'])
+        if vectors.ndim != 2 or vectors.shape[1] != self.header['dim'] or len(keys) != len(vectors):
+            raise ValueError(f"向量形状 {vectors.shape} 与 {len(keys)} 个主键 / 维度 {self.header['dim']} 不匹配")
+        for key in keys:
+            if '\n' in key:
+                raise ValueError(f"主键中不能包含换行: {key!r}")
+        self.f.write(vectors.tobytes())
+        self.keys_file.write(''.join(key + '\n' for key in keys))
+        self.header['count'] += len(keys)
+
+    def close(self):
+        self.keys_file.close()
+        self.f.seek(0)
+        self.f.write(_pack_header(self.header))
+        self.f.close()
+        if self.tmp_path is not None:
+            # 矩阵文件最后替换：读取方以它的文件头为准
+            if self.header['dtype'] == 'int8':
+                os.replace(quant_path(self.tmp_path), quant_path(self.path))
+            os.replace(keys_path(self.tmp_path), keys_path(self.path))
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """写入出错时调用：新建的存储删掉临时文件；追加模式下已完整写入的行照常保留"""
+        if self.tmp_path is None:
+            self.close()
+            return
+        self.keys_file.close()
+        self.f.close()
+        for path in (self.tmp_path, keys_path(self.tmp_path), quant_path(self.tmp_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _open_keys_for_append(path, count):
+    """只保留前 count 行主键，再以追加方式打开"""
+    keys = []
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            keys = [line.rstrip('\n') for _, line in zip(range(count), f)]
+    if len(keys) != count:
+        raise ValueError(f"主键文件 {path} 只有 {len(keys)} 行，少于文件头中的 {count} 条")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join(key + '\n' for key in keys))
+    return open(path, 'a', encoding='utf-8')
+
+
+class EmbeddingStore:
+    """嵌入存储的只读视图：矩阵通过 np.memmap 打开，不复制数据"""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.dim = self.header['dim']
+        self.model_name = self.header['model']
+        self.normalized = self.header['normalized']
+        count = self.header['count']
+        if count:
+            self.matrix = np.memmap(path, dtype=self.header['dtype'], mode='r',
+                                    offset=HEADER_SIZE, shape=(count, self.dim))
+        else:
+            self.matrix = np.zeros((0, self.dim), dtype=self.header['dtype'])
+        # int8 存储：原始向量 ≈ 编码 * scale + offset（逐维）
+        self.scale = self.offset = None
+        if self.header['dtype'] == 'int8':
+            self.scale, self.offset = np.load(quant_path(path))
+        self._keys = None
+        self._index = None
+
+    def __len__(self):
+        return self.header['count']
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            with open(keys_path(self.path), 'r', encoding='utf-8') as f:
+                self._keys = [line.rstrip('\n') for _, line in zip(range(len(self)), f)]
+        return self._keys
+
+    @property
+    def index(self):
+        """主键 -> 行号；同一主键出现多次时以最后一次为准"""
+        if self._index is None:
+            self._index = {key: row for row, key in enumerate(self.keys)}
+        return self._index
+
+    def vectors(self, rows):
+        """读取若干行为 float32，int8 存储会先反量化"""
+        vectors = np.asarray(self.matrix[rows], dtype=np.float32)
+        if self.scale is not None:
+            vectors = vectors * self.scale + self.offset
+        return vectors
+
+    def get(self, key):
+        row = self.index.get(key)
+        return None if row is None else self.vectors(row)
+
+    def rows(self, keys):
+        """批量查找，返回 (行号数组, 命中掩码)"""
+        index = self.index
+        rows = np.array([index.get(key, -1) for key in keys], dtype=np.int64)
+        return rows, rows >= 0
+
+
+def open_embeddings(path):
+    return EmbeddingStore(path)
+
+
+def write_embeddings(path, keys, matrix, model_name, dtype='float32', normalized=False):
+    """一次性写入整个矩阵"""
+    with EmbeddingWriter(path, model_name, matrix.shape[1], dtype, normalized) as writer:
+        writer.write(keys, matrix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看嵌入存储的文件头，或导出为旧的JSON格式")
+    parser.add_argument('path', help="嵌入存储文件，如 paper_embeddings.bin")
+    parser.add_argument('--to-json', metavar='FILE', help="导出为 键 -> 向量列表 的JSON文件")
+    args = parser.parse_args()
+
+    header = read_header(args.path)
+    for field, value in header.items():
+        print(f"{field}: {value}")
+
+    if args.to_json:
+        store = open_embeddings(args.path)
+        with open(args.to_json, 'w', encoding='utf-8') as f:
+            json.dump({key: store.vectors(row).astype(float).tolist() for key, row in store.index.items()},
+                      f, ensure_ascii=False)
+        print(f"已导出到: {args.to_json}")
+
+
+if __name__ == "__main__":
+    main()
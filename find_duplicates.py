@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import argparse
+import unicodedata
+import multiprocessing
+from collections import defaultdict
+
+import numpy as np
+
+from parse_papers import iter_paper_records
+from embedding_store import open_embeddings
+from search_papers import EMBEDDINGS_FILE, PAPERS_FILE, normalize_rows
+
+# 默认的重复簇文件
+DUPLICATES_FILE = "duplicates.jsonl"
+# 余弦相似度阈值
+THRESHOLD = 0.95
+# 每个分块的行数：一次打分生成 TILE_SIZE x TILE_SIZE 的矩阵，4096 时为 64MB
+TILE_SIZE = 4096
+# 同一标题出现超过这么多次时视为 "Front Matter"、"Keynote" 之类的通用标题，不参与标题和嵌入连接
+MAX_TITLE_GROUP = 5
+# 需要的列
+DUPLICATE_COLUMNS = ['conference', 'year', 'title', 'authors', 'doi', 'url', 'key']
+# 子进程只用一个 BLAS 线程，并行度由进程数决定
+BLAS_THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+def normalize_title(title):
+    """去掉重音、大小写、标点和空白后的标题，用于精确哈希连接"""
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return re.sub(r'[^0-9a-z]+', '', text.lower())
+
+
+def author_ids(paper):
+    """作者集合：有 pid 用 pid，没有时用姓名"""
+    return {author.get('pid') or author.get('name') for author in paper.get('authors', [])} - {None, ''}
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+# 子进程中的只读嵌入存储，由 _init_worker 打开一次
+_worker_store = None
+
+
+def _init_worker(embeddings_file):
+    global _worker_store
+    _worker_store = open_embeddings(embeddings_file)
+
+
+def _read_block(start, end):
+    block = _worker_store.vectors(np.arange(start, end))
+    return block if _worker_store.normalized else normalize_rows(block)
+
+
+def _join_row_block(args):
+    """第 start 行开始的一个行块与它及其后所有行块做分块矩阵乘法，返回相似度不低于阈值的行对"""
+    start, tile_size, threshold = args
+    count = len(_worker_store)
+    left = _read_block(start, min(start + tile_size, count))
+    found_i, found_j, found_scores = [], [], []
+    for other in range(start, count, tile_size):
+        right = left if other == start else _read_block(other, min(other + tile_size, count))
+        scores = left @ right.T
+        if other == start:
+            # 对角块只取上三角，不含自身
+            scores = np.triu(scores, k=1)
+        i, j = np.nonzero(scores >= threshold)
+        found_i.append(i + start)
+        found_j.append(j + other)
+        found_scores.append(scores[i, j])
+    return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_scores)
+
+
+def similarity_join(embeddings_file, threshold=THRESHOLD, tile_size=TILE_SIZE, workers=None):
+    """
+    嵌入矩阵的相似度自连接：把矩阵分成 tile_size 行的块，只计算上三角的块对，
+    内存占用由块大小决定而不是 N²。每个子进程负责一个行块，子进程各用一个 BLAS 线程。
+    返回 (行号i, 行号j, 相似度)，i < j。
+    """
+    store = open_embeddings(embeddings_file)
+    tasks = [(start, tile_size, threshold) for start in range(0, len(store), tile_size)]
+    workers = workers or os.cpu_count() or 1
+
+    saved = {name: os.environ.get(name) for name in BLAS_THREAD_VARS}
+    os.environ.update({name: '1' for name in BLAS_THREAD_VARS})
+    try:
+        # spawn 的子进程重新导入 numpy，才能读到上面的线程数设置
+        pool = multiprocessing.get_context('spawn').Pool(workers, _init_worker, (embeddings_file,))
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+    results = []
+    with pool:
+        for index, result in enumerate(pool.imap_unordered(_join_row_block, tasks), 1):
+            results.append(result)
+            print(f"\r相似度连接: {index}/{len(tasks)} 个行块", end='', flush=True)
+    print()
+    if not results:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def find_duplicates(papers_input=PAPERS_FILE, embeddings_file=EMBEDDINGS_FILE, threshold=THRESHOLD,
+                    tile_size=TILE_SIZE, workers=None):
+    """
+    找出重复论文簇。三种证据依次合并进并查集：
+    1. 相同 DOI/URL（load_papers 的主键冲突）；
+    2. 规范化标题完全相同（哈希连接，代价很低，先做）；
+    3. 嵌入余弦相似度不低于 threshold（分块自连接）。
+    后两种要求至少有一个共同作者，且排除出现超过 MAX_TITLE_GROUP 次的通用标题
+    （如每期都有、编辑相同的 "Front Matter"）。
+    返回 (论文列表, 簇列表)，每个簇是 [(论文下标a, 论文下标b, 证据, 相似度), ...] 的边集合。
+    """
+    papers = [paper for paper in iter_paper_records(papers_input, DUPLICATE_COLUMNS) if paper.get('key')]
+    authors = [author_ids(paper) for paper in papers]
+    union_find = UnionFind(len(papers))
+    edges = []
+
+    def link(a, b, method, score, need_author=True):
+        if need_author and (a in generic or b in generic or not authors[a] & authors[b]):
+            return
+        union_find.union(a, b)
+        edges.append((a, b, method, score))
+
+    by_key = defaultdict(list)
+    by_title = defaultdict(list)
+    for i, paper in enumerate(papers):
+        key = paper.get('doi', '') or paper.get('url', '')
+        if key:
+            by_key[key].append(i)
+        title = normalize_title(paper.get('title'))
+        if title:
+            by_title[title].append(i)
+
+    generic = {i for group in by_title.values() if len(group) > MAX_TITLE_GROUP for i in group}
+    for group in by_key.values():
+        for other in group[1:]:
+            link(group[0], other, 'doi', 1.0, need_author=False)
+    for group in by_title.values():
+        for a_index, a in enumerate(group):
+            for b in group[a_index + 1:]:
+                link(a, b, 'title', 1.0)
+    print(f"主键/标题连接: {len(edges)} 对")
+
+    if embeddings_file and os.path.exists(embeddings_file):
+        store = open_embeddings(embeddings_file)
+        rows_i, rows_j, scores = similarity_join(embeddings_file, threshold, tile_size, workers)
+        # 同一主键写入多次时只有最后一行有效；每行对应该主键的第一篇论文（其余已按主键合并）
+        index = store.index
+        keys = store.keys
+        before = len(edges)
+        for i, j, score in zip(rows_i.tolist(), rows_j.tolist(), scores.tolist()):
+            key_i, key_j = keys[i], keys[j]
+            if index[key_i] != i or index[key_j] != j or key_i not in by_key or key_j not in by_key:
+                continue
+            a, b = by_key[key_i][0], by_key[key_j][0]
+            if union_find.find(a) != union_find.find(b):
+                link(a, b, 'embedding', score)
+        print(f"嵌入相似度连接: {len(rows_i)} 对超过阈值，新增 {len(edges) - before} 对")
+
+    clusters = defaultdict(list)
+    for edge in edges:
+        clusters[union_find.find(edge[0])].append(edge)
+    return papers, sorted(clusters.values(), key=lambda cluster: min(cluster[0][:2]))
+
+
+def write_clusters(papers, clusters, output=DUPLICATES_FILE):
+    """每行一个重复簇：成员论文和把它们连在一起的证据"""
+    with open(output, 'w', encoding='utf-8') as f:
+        for number, cluster in enumerate(clusters):
+            members = sorted({i for a, b, _, _ in cluster for i in (a, b)})
+            f.write(json.dumps({
+                'cluster': number,
+                'papers': [{name: papers[i].get(name) for name in ('key', 'conference', 'year', 'title', 'doi')}
+                           for i in members],
+                'pairs': [[papers[a]['key'], papers[b]['key'], method, round(score, 4)]
+                          for a, b, method, score in cluster],
+            }, ensure_ascii=False) + '\n')
+
+
+def load_clusters(path=DUPLICATES_FILE):
+    """dblp key -> 重复簇编号"""
+    clusters = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            cluster = json.loads(line)
+            for paper in cluster['papers']:
+                clusters[paper['key']] = cluster['cluster']
+    return clusters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="跨会议重复论文检测：主键/标题哈希连接 + 嵌入相似度分块自连接")
+    parser.add_argument('--input', default=PAPERS_FILE, help="papers.jsonl 或列式存储目录")
+    parser.add_argument('--embeddings', default=EMBEDDINGS_FILE, help="嵌入存储文件，不存在时只做主键/标题连接")
+    parser.add_argument('-o', '--output', default=DUPLICATES_FILE, help="重复簇文件")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="余弦相似度阈值")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help="分块行数")
+    parser.add_argument('--workers', type=int, help="并行进程数，默认为CPU核数")
+    args = parser.parse_args()
+
+    papers, clusters = find_duplicates(args.input, args.embeddings, args.threshold, args.tile_size, args.workers)
+    write_clusters(papers, clusters, args.output)
+    members = sum(len({i for a, b, _, _ in cluster for i in (a, b)}) for cluster in clusters)
+    print(f"找到 {len(clusters)} 个重复簇，共 {members} 篇论文，已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
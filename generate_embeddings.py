@@ -1,22 +1,45 @@
+import os
 import json
-import torch
-from sentence_transformers import SentenceTransformer
+import argparse
+import multiprocessing
+from collections import deque
+
+import numpy as np
 from tqdm import tqdm
 
+from parse_papers import iter_paper_records
+from embedding_store import EmbeddingWriter, write_embeddings
+from embedding_cache import CACHE_DIR, EmbeddingCache, text_hash
+import instrumentation
+from instrumentation import metrics
+
+# 生成嵌入文本只需要这几列
+EMBEDDING_COLUMNS = ['conference', 'year', 'title', 'authors', 'doi', 'url', 'venue']
+
 def load_papers(jsonl_file):
     """加载论文数据"""
     papers = {}
-    with open(jsonl_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            paper = json.loads(line.strip())
-            # 使用DOI作为主键，如果没有DOI则使用URL
-            key = paper.get('doi', '') or paper.get('url', '')
-            if key:
-                papers[key] = paper
+    for paper in iter_paper_records(jsonl_file, EMBEDDING_COLUMNS):
+        # 使用DOI作为主键，如果没有DOI则使用URL
+        key = paper.get('doi', '') or paper.get('url', '')
+        if key:
+            papers[key] = paper
     return papers
 
-def create_paper_text(paper):
-    """将论文信息组合成文本"""
+def iter_paper_texts(jsonl_file, fulltext=None):
+    """逐条读取论文，产生 (主键, 嵌入文本)，不把整个语料留在内存里；fulltext 为 主键 -> 补充文本"""
+    return paper_texts(iter_paper_records(jsonl_file, EMBEDDING_COLUMNS), fulltext)
+
+def paper_texts(papers, fulltext=None):
+    """论文记录流 -> (主键, 嵌入文本) 流；记录可以来自文件，也可以由上游阶段在内存中直接传入"""
+    fulltext = fulltext or {}
+    for paper in papers:
+        key = paper.get('doi', '') or paper.get('url', '')
+        if key:
+            yield key, create_paper_text(paper, fulltext.get(key))
+
+def create_paper_text(paper, fulltext=None):
+    """将论文信息组合成文本；fulltext 为从PDF抽取的摘要（或首页文本）"""
     # 组合标题、作者和venue信息
     text_parts = []
     
@@ -37,64 +60,354 @@ def create_paper_text(paper):
     if paper.get('venue'):
         text_parts.append(f"Venue: {paper['venue']}")
     
+    # 添加PDF中的摘要
+    if fulltext:
+        text_parts.append(f"Abstract: {fulltext}")
+    
     return " | ".join(text_parts)
 
-def generate_embeddings(papers, model_name='all-MiniLM-L6-v2', batch_size=32):
-    """生成论文嵌入"""
-    # 加载模型
+def load_model(model_name, device=None):
+    """加载模型，未指定 device 时有GPU就放到GPU上"""
+    # 只有真正需要编码时才导入 torch，其他模块可以不依赖它使用 create_paper_text 等函数
+    import torch
+    from sentence_transformers import SentenceTransformer
+
     print(f"加载模型: {model_name}")
-    model = SentenceTransformer(model_name)
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
-    model = model.to(device)
-    
+    with metrics.stage('load_model'):
+        model = SentenceTransformer(model_name)
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        return model.to(device)
+
+def token_lengths(model, texts):
+    """每条文本分词后的长度（含特殊符号，按模型最大长度截断）"""
+    input_ids = model.tokenizer(texts, truncation=True, max_length=model.max_seq_length)['input_ids']
+    return np.array([len(ids) for ids in input_ids], dtype=np.int64)
+
+def fixed_batches(count, batch_size):
+    """按输入顺序每 batch_size 条一批"""
+    return [np.arange(i, min(i + batch_size, count)) for i in range(0, count, batch_size)]
+
+def token_batches(lengths, max_tokens):
+    """
+    按长度排序后切批：一批补齐后的 token 数（条数 x 批内最长长度）不超过 max_tokens。
+    长度相近的文本分到同一批，补齐浪费少；短文本的批条数多，长文本的批条数少。
+    返回每批的原始下标数组。
+    """
+    order = np.argsort(lengths, kind='stable')
+    batches = []
+    start = 0
+    for i, index in enumerate(order):
+        # 升序排列，当前文本就是批内最长的
+        if i > start and (i - start + 1) * lengths[index] > max_tokens:
+            batches.append(order[start:i])
+            start = i
+    if start < len(order):
+        batches.append(order[start:])
+    return batches
+
+def padding_ratio(lengths, batches):
+    """补齐位置占全部计算位置的比例"""
+    total = padded = 0
+    for batch in batches:
+        batch_lengths = lengths[batch]
+        total += int(batch_lengths.sum())
+        padded += len(batch) * int(batch_lengths.max())
+    return 1 - total / padded if padded else 0.0
+
+def make_batches(model, texts, batch_size=32, max_tokens=None):
+    """max_tokens 为空时按固定条数分批，否则按 token 预算做长度分桶"""
+    if not max_tokens:
+        return fixed_batches(len(texts), batch_size)
+    with metrics.stage('tokenize'):
+        return token_batches(token_lengths(model, texts), max_tokens)
+
+def encode_batches(model, texts, batches, normalize=False, progress=False):
+    """按给定的分批编码，结果按下标写回矩阵，保持原始顺序"""
+    matrix = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    for batch in (tqdm(batches) if progress else batches):
+        with metrics.stage('encode_batch'):
+            matrix[batch] = model.encode([texts[i] for i in batch], batch_size=len(batch),
+                                         convert_to_numpy=True, normalize_embeddings=normalize)
+        metrics.observe('batch_size', len(batch))
+    return matrix
+
+def encode_texts(model, texts, batch_size=32, normalize=False, max_tokens=None):
+    """分批编码，直接得到 numpy 数组写入矩阵，不再逐行转换成Python列表"""
+    batches = make_batches(model, texts, batch_size, max_tokens)
+    return encode_batches(model, texts, batches, normalize, progress=True)
+
+def generate_embeddings(papers, model_name='all-MiniLM-L6-v2', batch_size=32, normalize=False, cache_dir=None,
+                        max_tokens=None, fulltext=None):
+    """
+    生成论文嵌入，返回 (主键列表, float32 矩阵)，矩阵第 i 行对应第 i 个主键。
+    指定 cache_dir 时先按文本哈希批量查缓存，只编码未命中的文本并写回缓存。
+    """
     # 准备数据
     keys = list(papers.keys())
-    texts = [create_paper_text(papers[key]) for key in keys]
-    
-    # 生成嵌入
-    print("生成嵌入...")
-    embeddings = {}
-    
-    # 使用批处理来提高效率
-    for i in tqdm(range(0, len(texts), batch_size)):
-        batch_texts = texts[i:i + batch_size]
-        batch_keys = keys[i:i + batch_size]
-        
-        # 生成当前批次的嵌入
-        batch_embeddings = model.encode(batch_texts, convert_to_tensor=True)
-        
-        # 将张量转换为列表并保存
-        for key, embedding in zip(batch_keys, batch_embeddings):
-            embeddings[key] = embedding.cpu().numpy().tolist()
-    
-    return embeddings
+    fulltext = fulltext or {}
+    texts = [create_paper_text(papers[key], fulltext.get(key)) for key in keys]
+
+    if cache_dir is None:
+        # 生成嵌入
+        model = load_model(model_name)
+        print("生成嵌入...")
+        return keys, encode_texts(model, texts, batch_size, normalize, max_tokens)
+
+    cache = EmbeddingCache(cache_dir, model_name, normalize)
+    hashes = [text_hash(text) for text in texts]
+    rows, hit = cache.lookup(hashes)
+
+    # 未命中的文本去重后再编码
+    missing = {}
+    for i in np.flatnonzero(~hit):
+        missing.setdefault(hashes[i], texts[i])
+    print(f"缓存命中 {int(hit.sum())} 篇，需要编码 {len(missing)} 条文本")
 
-def save_embeddings(embeddings, output_file):
-    """保存嵌入到JSON文件"""
+    new_vectors = None
+    if missing:
+        model = load_model(model_name)
+        print("生成嵌入...")
+        new_vectors = encode_texts(model, list(missing.values()), batch_size, normalize, max_tokens)
+        if cache.dim is not None and cache.dim != new_vectors.shape[1]:
+            raise ValueError(f"模型维度 {new_vectors.shape[1]} 与缓存维度 {cache.dim} 不一致")
+
+    dim = cache.dim if cache.dim is not None else new_vectors.shape[1]
+    matrix = np.empty((len(keys), dim), dtype=np.float32)
+    if hit.any():
+        matrix[hit] = cache.vectors(rows[hit])
+    if missing:
+        new_rows = {h: i for i, h in enumerate(missing)}
+        miss_index = np.flatnonzero(~hit)
+        matrix[miss_index] = new_vectors[[new_rows[hashes[i]] for i in miss_index]]
+        cache.add(list(missing), new_vectors)
+
+    return keys, matrix
+
+# 当前进程持有的模型副本，由 _init_worker 在每个进程里加载一次
+_worker_model = None
+
+def _init_worker(model_name, threads=None, device=None):
+    global _worker_model
+    if threads:
+        import torch
+        # 每个工作进程只用分到的核数，避免 N 个进程各自开满线程互相抢占
+        torch.set_num_threads(threads)
+    _worker_model = load_model(model_name, device)
+
+def _encode_chunk(texts, batch_size, normalize, max_tokens=None):
+    batches = make_batches(_worker_model, texts, batch_size, max_tokens)
+    return encode_batches(_worker_model, texts, batches, normalize)
+
+class _Ready:
+    """单进程模式下已经算好的结果，接口与 AsyncResult 一致"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def stream_embeddings(items, output_file, model_name='all-MiniLM-L6-v2', batch_size=32, normalize=False,
+                      workers=1, chunk_size=256, dtype='float32', cache_dir=None, max_tokens=None):
+    """
+    流式生成嵌入：items 是 (主键, 文本) 迭代器，按 chunk_size 分块交给 workers 个CPU进程编码
+    （每个进程持有一份模型），结果按输入顺序边算边写入 output_file。
+    在途的块最多 2*workers 个，内存占用与语料大小无关。workers 为 1 时在当前进程编码（可用GPU）。
+    主键重复时存储中会有多行，按 EmbeddingStore.index 的约定以最后一行为准。
+    指定 max_tokens 时在每块内部按长度分桶，块越大分桶效果越好。
+    返回 (写入条数, 缓存命中条数)。
+    """
+    cache = EmbeddingCache(cache_dir, model_name, normalize) if cache_dir else None
+    max_in_flight = 2 * max(1, workers)
+    pending = deque()
+    pool = None
+    writer = None
+    cache_writer = None
+    written = cached = 0
+    completed = False
+    progress = tqdm(unit='篇')
+
+    def submit(texts):
+        nonlocal pool
+        if workers > 1:
+            if pool is None:
+                # 全部命中缓存时不会创建进程池，也就不用加载模型
+                threads = max(1, (os.cpu_count() or 1) // workers)
+                print(f"启动 {workers} 个编码进程，每个 {threads} 个线程")
+                pool = multiprocessing.Pool(workers, _init_worker, (model_name, threads, 'cpu'))
+            return pool.apply_async(_encode_chunk, (texts, batch_size, normalize, max_tokens))
+        if _worker_model is None:
+            _init_worker(model_name)
+        return _Ready(_encode_chunk(texts, batch_size, normalize, max_tokens))
+
+    def flush(entry):
+        nonlocal writer, cache_writer, written, cached
+        keys, rows, hit, missing, hashes, result = entry
+        # 多进程时这是一块从提交到取回的等待时间
+        with metrics.stage('wait_encode'):
+            new_vectors = result.get() if result is not None else None
+        dim = new_vectors.shape[1] if new_vectors is not None else cache.dim
+        if cache is not None and cache.dim is not None and cache.dim != dim:
+            raise ValueError(f"模型维度 {dim} 与缓存维度 {cache.dim} 不一致")
+
+        if cache is None:
+            matrix = new_vectors
+        else:
+            matrix = np.empty((len(keys), dim), dtype=np.float32)
+            if hit.any():
+                matrix[hit] = cache.vectors(rows[hit])
+            if missing:
+                new_rows = {h: i for i, h in enumerate(missing)}
+                miss_index = np.flatnonzero(~hit)
+                matrix[miss_index] = new_vectors[[new_rows[hashes[i]] for i in miss_index]]
+                if cache_writer is None:
+                    cache_writer = cache.appender(dim)
+                cache_writer.write(list(missing), new_vectors)
+
+        with metrics.stage('write_embeddings'):
+            if writer is None:
+                writer = EmbeddingWriter(output_file, model_name, dim, dtype, normalize)
+            writer.write(keys, matrix)
+        written += len(keys)
+        cached += int(hit.sum())
+        metrics.count('papers_embedded', len(keys))
+        metrics.count('papers_cached', int(hit.sum()))
+        metrics.count('texts_encoded', len(missing))
+        progress.update(len(keys))
+
+    try:
+        for chunk in _chunks(metrics.timed_iter('read_papers', items), chunk_size):
+            keys = [key for key, _ in chunk]
+            texts = [text for _, text in chunk]
+            if cache is None:
+                rows, hit, hashes = None, np.zeros(len(keys), dtype=bool), None
+                missing = texts
+            else:
+                with metrics.stage('cache_lookup'):
+                    hashes = [text_hash(text) for text in texts]
+                    rows, hit = cache.lookup(hashes)
+                    # 块内未命中的文本去重后再编码
+                    missing = {}
+                    for i in np.flatnonzero(~hit):
+                        missing.setdefault(hashes[i], texts[i])
+            texts = list(missing.values()) if cache is not None else missing
+            result = submit(texts) if texts else None
+            pending.append((keys, rows, hit, missing, hashes, result))
+            # 按提交顺序取结果写盘；在途块达到上限时阻塞等待最早的一块
+            while len(pending) >= max_in_flight:
+                flush(pending.popleft())
+        while pending:
+            flush(pending.popleft())
+        if writer is None:
+            # 输入为空时同样写出一个空存储，替换掉上次运行留下的旧文件
+            dim = cache.dim if cache is not None else None
+            if dim is None:
+                if _worker_model is None:
+                    _init_worker(model_name)
+                dim = _worker_model.get_sentence_embedding_dimension()
+            writer = EmbeddingWriter(output_file, model_name, dim, dtype, normalize)
+        completed = True
+    finally:
+        progress.close()
+        if pool is not None:
+            if pending:
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+        if cache_writer is not None:
+            cache_writer.close()
+        if writer is not None:
+            # 中途出错时丢弃 .part，不留下条数不全却看似完整的存储
+            if completed:
+                writer.close()
+            else:
+                writer.abort()
+    return written, cached
+
+def save_embeddings(keys, matrix, output_file, model_name, dtype='float32', normalized=False):
+    """保存嵌入到二进制存储（矩阵文件 + 主键文件）"""
+    print(f"保存嵌入到: {output_file}")
+    write_embeddings(output_file, keys, matrix, model_name, dtype, normalized)
+
+def save_embeddings_json(keys, matrix, output_file):
+    """保存嵌入到JSON文件（旧格式，体积大、读写慢）"""
     print(f"保存嵌入到: {output_file}")
     with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(embeddings, f, ensure_ascii=False, indent=2)
+        json.dump({key: row.tolist() for key, row in zip(keys, matrix)}, f, ensure_ascii=False, indent=2)
 
 def main():
-    # 配置
-    input_file = "papers.jsonl"
-    output_file = "paper_embeddings.json"
-    model_name = 'all-MiniLM-L6-v2'  # 使用轻量级模型
-    batch_size = 32
-    
+    parser = argparse.ArgumentParser(description="为论文生成语义向量")
+    parser.add_argument('--input', default="papers.jsonl", help="papers.jsonl 或列式存储目录")
+    parser.add_argument('--output', default="paper_embeddings.bin", help="输出文件")
+    parser.add_argument('--format', choices=['binary', 'json'], default='binary',
+                        help="binary：可 mmap 的二进制存储；json：旧的 键 -> 向量列表 格式")
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32', help="二进制存储的数据类型")
+    parser.add_argument('--normalize', action='store_true', help="对向量做L2归一化")
+    parser.add_argument('--model', default='all-MiniLM-L6-v2', help="使用轻量级模型")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-tokens', type=int,
+                        help="按 token 预算做长度分桶的动态批（如 8192），代替固定 --batch-size 条一批")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="嵌入缓存目录，文本未变化的论文不再重新编码")
+    parser.add_argument('--no-cache', action='store_true', help="不使用缓存，全部重新编码")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="CPU编码进程数，每个进程加载一份模型；1 表示在当前进程编码（有GPU时用GPU）")
+    parser.add_argument('--chunk-size', type=int, default=256, help="每次交给编码进程的论文条数")
+    parser.add_argument('--fulltext', metavar='FILE',
+                        help="pdf_text.py 生成的全文文本流，有PDF的论文在嵌入文本中加入摘要")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args, 'generate_embeddings')
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    fulltext = None
+    if args.fulltext:
+        from pdf_text import load_fulltext
+        fulltext = load_fulltext(args.fulltext)
+        print(f"加载了 {len(fulltext)} 篇论文的PDF文本")
+
+    if args.format == 'binary':
+        # 二进制存储可以边算边写：逐条读取论文，按顺序流式写入
+        print(f"流式读取论文数据从: {args.input}")
+        written, cached = stream_embeddings(
+            iter_paper_texts(args.input, fulltext), args.output, args.model, args.batch_size, args.normalize,
+            args.workers, args.chunk_size, args.dtype, cache_dir, args.max_tokens)
+        if cache_dir is not None:
+            print(f"缓存命中 {cached} 篇，新编码 {written - cached} 篇")
+        print(f"生成了 {written} 个嵌入，保存到: {args.output}")
+        print("完成！")
+        instrumentation.finish(args)
+        return
+
     # 加载论文数据
-    print(f"加载论文数据从: {input_file}")
-    papers = load_papers(input_file)
+    print(f"加载论文数据从: {args.input}")
+    with metrics.stage('read_papers'):
+        papers = load_papers(args.input)
     print(f"加载了 {len(papers)} 篇论文")
     
     # 生成嵌入
-    embeddings = generate_embeddings(papers, model_name, batch_size)
-    print(f"生成了 {len(embeddings)} 个嵌入")
+    keys, matrix = generate_embeddings(papers, args.model, args.batch_size, args.normalize, cache_dir,
+                                       args.max_tokens, fulltext)
+    print(f"生成了 {len(keys)} 个嵌入")
     
     # 保存结果
-    save_embeddings(embeddings, output_file)
+    with metrics.stage('write_embeddings'):
+        save_embeddings_json(keys, matrix, args.output)
+    metrics.count('papers_embedded', len(keys))
     print("完成！")
+    instrumentation.finish(args)
 
 if __name__ == "__main__":
     print("【所有下载程序都简单验证过】该嵌入文件没有运行过，如果有bug请自行修改！")
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,398 @@
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不记录峰值内存
+    resource = None
+
+# 阶段耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+# 条数、字节数之类数值的桶上界
+SIZE_BUCKETS = tuple(2 ** i for i in range(0, 21, 2))
+# Prometheus 指标名前缀
+METRIC_PREFIX = "pipeline"
+# 性能剖析结果目录
+PROFILE_DIR = "profiles"
+
+
+class Histogram:
+    """固定桶的直方图，只保存每个桶的计数、总和与条数"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """按桶估计分位数：返回落入的桶的上界"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'counts': self.counts, 'sum': self.sum, 'count': self.count}
+
+
+class _NullStage:
+    """关闭时所有阶段共用的空上下文"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'start', 'profiler', 'peak')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.profiler = None
+        self.peak = 0
+
+    def __enter__(self):
+        metrics = self.metrics
+        if metrics.profile is not None and (self.name in metrics.profile or 'all' in metrics.profile):
+            self.profiler = metrics._profiler(self.name)
+        if metrics.trace_memory:
+            metrics._start_peak(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        peak = None
+        if self.metrics.trace_memory:
+            peak = self.metrics._stop_peak(self)
+        if self.profiler is not None:
+            self.metrics._stop_profiler(self.profiler)
+        self.metrics._record_stage(self.name, elapsed, peak)
+        return False
+
+
+class Metrics:
+    """
+    流水线各阶段的计时、计数和直方图。默认关闭：关闭时 stage() 返回共用的空上下文，
+    count()/observe() 直接返回，开销只有一次属性判断。
+    指标只在当前进程内汇总，进程池子进程中的工作由主进程在收到结果时计数。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.job = None
+        self.profile = None
+        self.trace_memory = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.histograms = {}
+        self.memory_peaks = {}
+        self.profilers = {}
+        # 正在记录内存峰值的阶段，以及当前开启的剖析器
+        self.traced = set()
+        self.active_profiler = None
+
+    def enable(self, job, profile=None, trace_memory=False):
+        """
+        开始记录。profile 为需要 cProfile 的阶段名集合（'all' 表示全部）；
+        trace_memory 为 True 时用 tracemalloc 记录每个阶段的Python内存峰值（开销较大，只在排查时用）。
+        """
+        self.reset()
+        self.job = job
+        self.profile = set(profile) if profile else None
+        self.trace_memory = trace_memory
+        if trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.stop()
+            self.trace_memory = False
+
+    def stage(self, name):
+        """with metrics.stage('parse_xml'): ... 记录一次阶段耗时"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def timed_iter(self, name, iterable):
+        """逐条计时的迭代器：每次取下一条的耗时记到阶段 name 下；关闭时原样返回"""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iterable)
+
+    def _timed_iter(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, buckets=SIZE_BUCKETS):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def _record_stage(self, name, elapsed, peak):
+        with self.lock:
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(elapsed)
+            if peak is not None and peak > self.memory_peaks.get(name, 0):
+                self.memory_peaks[name] = peak
+
+    def _start_peak(self, stage):
+        """
+        tracemalloc 的峰值是全进程共用的：重置前先把当前峰值记到所有进行中的阶段上，
+        嵌套的内层阶段或其他线程的阶段重置后，外层阶段的峰值不会丢失。
+        """
+        import tracemalloc
+        with self.lock:
+            current = tracemalloc.get_traced_memory()[1]
+            for other in self.traced:
+                other.peak = max(other.peak, current)
+            tracemalloc.reset_peak()
+            self.traced.add(stage)
+
+    def _stop_peak(self, stage):
+        import tracemalloc
+        with self.lock:
+            self.traced.discard(stage)
+            return max(stage.peak, tracemalloc.get_traced_memory()[1])
+
+    def _profiler(self, name):
+        """
+        开启该阶段的 cProfile。同一时刻只有一个剖析器：嵌套阶段只剖析最外层，
+        其他线程已在剖析时跳过，不会替换掉正在运行的剖析器。
+        """
+        import cProfile
+        with self.lock:
+            if self.active_profiler is not None:
+                return None
+            profiler = self.profilers.get(name)
+            if profiler is None:
+                profiler = self.profilers[name] = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # 其他剖析工具（如外部的 cProfile 运行）已经开启
+                return None
+            self.active_profiler = profiler
+        return profiler
+
+    def _stop_profiler(self, profiler):
+        profiler.disable()
+        with self.lock:
+            self.active_profiler = None
+
+    def snapshot(self):
+        """当前全部指标，计数器同时给出按总运行时间计算的每秒速率"""
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            return {
+                'job': self.job,
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+                'elapsed_seconds': elapsed,
+                'peak_rss_bytes': peak_rss(),
+                'peak_rss_children_bytes': peak_rss(children=True),
+                'stages': {name: dict(h.to_dict(), memory_peak_bytes=self.memory_peaks.get(name))
+                           for name, h in self.stages.items()},
+                'counters': dict(self.counters),
+                'rates': {name: value / elapsed for name, value in self.counters.items()} if elapsed else {},
+                'histograms': {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+
+    def dump_profiles(self, profile_dir=PROFILE_DIR):
+        """每个剖析过的阶段写一个 .prof 文件，可用 python -m pstats 或 snakeviz 查看"""
+        paths = []
+        if not self.profilers:
+            return paths
+        os.makedirs(profile_dir, exist_ok=True)
+        for name, profiler in self.profilers.items():
+            path = os.path.join(profile_dir, f"{self.job}.{name}.prof")
+            profiler.dump_stats(path)
+            paths.append(path)
+        return paths
+
+
+def peak_rss(children=False):
+    """进程（或已结束的子进程中最大者）的峰值常驻内存，字节"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux 上单位是KB，macOS 上是字节
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+def write_jsonl(snapshot, path):
+    """每次运行追加一行"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(snapshot, ensure_ascii=False) + '\n')
+
+
+def _metric_name(name):
+    return ''.join(ch if ch.isalnum() else '_' for ch in name).lower()
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + '}'
+
+
+def _format_histogram(lines, name, histogram, **labels):
+    cumulative = 0
+    for bound, count in zip(histogram['buckets'] + ['+Inf'], histogram['counts']):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram['sum']}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram['count']}")
+
+
+def format_prometheus(snapshot):
+    """Prometheus 文本格式（node_exporter textfile collector 可直接读取）"""
+    job = snapshot['job']
+    prefix = METRIC_PREFIX
+    lines = []
+
+    def gauge(name, value, help_text, **labels):
+        if value is None:
+            return
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name}{_labels(job=job, **labels)} {value}")
+
+    gauge('run_seconds', snapshot['elapsed_seconds'], "Wall time of the last run.")
+    gauge('last_run_timestamp_seconds', time.time(), "Unix time the metrics were written.")
+    gauge('peak_rss_bytes', snapshot['peak_rss_bytes'], "Peak resident set size of the main process.")
+    gauge('peak_rss_children_bytes', snapshot['peak_rss_children_bytes'],
+          "Peak resident set size of the largest finished child process.")
+
+    if snapshot['stages']:
+        lines.append(f"# HELP {prefix}_stage_seconds Time spent per stage call.")
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        for stage, histogram in sorted(snapshot['stages'].items()):
+            _format_histogram(lines, f"{prefix}_stage_seconds", histogram, job=job, stage=stage)
+        peaks = {stage: h['memory_peak_bytes'] for stage, h in snapshot['stages'].items()
+                 if h['memory_peak_bytes'] is not None}
+        if peaks:
+            lines.append(f"# HELP {prefix}_stage_memory_peak_bytes Peak traced Python memory per stage.")
+            lines.append(f"# TYPE {prefix}_stage_memory_peak_bytes gauge")
+            for stage, peak in sorted(peaks.items()):
+                lines.append(f"{prefix}_stage_memory_peak_bytes{_labels(job=job, stage=stage)} {peak}")
+
+    for name, value in sorted(snapshot['counters'].items()):
+        metric = f"{prefix}_{_metric_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_labels(job=job)} {value}")
+
+    for name, histogram in sorted(snapshot['histograms'].items()):
+        metric = f"{prefix}_{_metric_name(name)}"
+        lines.append(f"# TYPE {metric} histogram")
+        _format_histogram(lines, metric, histogram, job=job)
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(snapshot, path):
+    """先写临时文件再替换，采集器不会读到半个文件"""
+    tmp_file = path + '.part'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(format_prometheus(snapshot))
+    os.replace(tmp_file, path)
+
+
+def print_summary(snapshot):
+    print(f"\n{'阶段':<20}{'次数':>10}{'总耗时(s)':>12}{'p50(s)':>10}{'p99(s)':>10}")
+    for name, data in sorted(snapshot['stages'].items(), key=lambda item: -item[1]['sum']):
+        histogram = Histogram(data['buckets'])
+        histogram.counts, histogram.count = data['counts'], data['count']
+        print(f"{name:<20}{data['count']:>10}{data['sum']:>12.2f}"
+              f"{histogram.quantile(0.5):>10g}{histogram.quantile(0.99):>10g}")
+    for name, value in sorted(snapshot['counters'].items()):
+        print(f"{name}: {value}（{snapshot['rates'].get(name, 0):.1f}/秒）")
+    if snapshot['peak_rss_bytes'] is not None:
+        print(f"峰值内存: {snapshot['peak_rss_bytes'] / 2 ** 20:.1f}MB")
+
+
+# 进程内共享的指标对象
+metrics = Metrics()
+
+
+def add_arguments(parser):
+    """给各脚本的命令行加上统一的指标参数"""
+    group = parser.add_argument_group("指标")
+    group.add_argument('--metrics', metavar='FILE',
+                       help="记录各阶段耗时和计数并在结束时写出；.prom 结尾写 Prometheus 文本格式，否则追加一行JSON")
+    group.add_argument('--profile', nargs='+', metavar='STAGE',
+                       help=f"对这些阶段做 cProfile（all 表示全部），结果写到 {PROFILE_DIR}/")
+    group.add_argument('--trace-memory', action='store_true', help="用 tracemalloc 记录每个阶段的内存峰值")
+
+
+def configure(args, job):
+    """根据命令行参数开启指标；没有指定任何指标参数时保持关闭"""
+    if args.metrics or args.profile or args.trace_memory:
+        metrics.enable(job, args.profile, args.trace_memory)
+
+
+def finish(args):
+    """写出指标和剖析结果，并打印摘要"""
+    if not metrics.enabled:
+        return
+    snapshot = metrics.snapshot()
+    print_summary(snapshot)
+    if args.metrics:
+        if args.metrics.endswith('.prom'):
+            write_prometheus(snapshot, args.metrics)
+        else:
+            write_jsonl(snapshot, args.metrics)
+        print(f"指标已写入: {args.metrics}")
+    for path in metrics.dump_profiles():
+        print(f"性能剖析已写入: {path}")
+    metrics.disable()
@@ -0,0 +1,276 @@
+import json
+import sqlite3
+import argparse
+
+from parse_papers import iter_paper_records
+
+# 默认的目录数据库
+CATALOG_FILE = "papers.sqlite"
+
+# papers 表中除 id/key/record 外的列，与 parse_papers.parse_paper 的字段一致
+PAPER_COLUMNS = ('conference', 'year', 'volume', 'title', 'doi', 'url', 'pages', 'type',
+                 'venue', 'published_year', 'access', 'ee')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    conference TEXT,
+    year INTEGER,
+    volume INTEGER,
+    title TEXT,
+    doi TEXT,
+    url TEXT,
+    pages TEXT,
+    type TEXT,
+    venue TEXT,
+    published_year TEXT,
+    access TEXT,
+    ee TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_papers_doi ON papers(doi);
+CREATE INDEX IF NOT EXISTS idx_papers_conference_year ON papers(conference, year);
+
+CREATE TABLE IF NOT EXISTS paper_author (
+    paper_id INTEGER NOT NULL REFERENCES papers(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT,
+    pid TEXT,
+    PRIMARY KEY (paper_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_paper_author_pid ON paper_author(pid);
+
+-- find_duplicates.py 生成的重复簇，按 dblp key 关联
+CREATE TABLE IF NOT EXISTS paper_duplicate (
+    key TEXT PRIMARY KEY,
+    cluster INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_paper_duplicate_cluster ON paper_duplicate(cluster);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(title, content='papers', content_rowid='id');
+
+CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+    INSERT INTO papers_fts(rowid, title) VALUES (new.id, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+    INSERT INTO papers_fts(papers_fts, rowid, title) VALUES ('delete', old.id, old.title);
+END;
+CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE OF title ON papers BEGIN
+    INSERT INTO papers_fts(papers_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    INSERT INTO papers_fts(rowid, title) VALUES (new.id, new.title);
+END;
+"""
+
+UPSERT_SQL = (
+    f"INSERT INTO papers (key, {', '.join(PAPER_COLUMNS)}, record) "
+    f"VALUES (?, {', '.join('?' for _ in PAPER_COLUMNS)}, ?) "
+    f"ON CONFLICT(key) DO UPDATE SET "
+    f"{', '.join(f'{name} = excluded.{name}' for name in PAPER_COLUMNS)}, record = excluded.record"
+)
+
+# SQLite 单条语句的参数个数上限（旧版本为 999）
+MAX_PARAMS = 900
+
+
+class PaperCatalog:
+    """论文目录：SQLite + 索引，支持按DOI/key/作者pid查询和标题全文检索，按 dblp key 增量更新"""
+
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _existing_records(self, keys):
+        existing = {}
+        for i in range(0, len(keys), MAX_PARAMS):
+            chunk = keys[i:i + MAX_PARAMS]
+            rows = self.conn.execute(
+                f"SELECT key, id, record FROM papers WHERE key IN ({', '.join('?' for _ in chunk)})", chunk)
+            for key, paper_id, record in rows:
+                existing[key] = (paper_id, record)
+        return existing
+
+    def _write_batch(self, batch):
+        """写入一批论文，跳过内容完全相同的记录，返回实际写入的条数"""
+        # 同一批中重复的 dblp key 只保留最后一条，与逐条 upsert 的结果一致
+        batch = list({key: (key, paper, record) for key, paper, record in batch}.values())
+        existing = self._existing_records([key for key, _, _ in batch])
+        changed = [(key, paper, record) for key, paper, record in batch
+                   if key not in existing or existing[key][1] != record]
+        if not changed:
+            return 0
+
+        with self.conn:
+            self.conn.executemany(UPSERT_SQL, [
+                (key, *(paper.get(name) for name in PAPER_COLUMNS), record)
+                for key, paper, record in changed
+            ])
+            ids = {key: paper_id for key, (paper_id, _) in
+                   self._existing_records([key for key, _, _ in changed]).items()}
+            self.conn.executemany("DELETE FROM paper_author WHERE paper_id = ?",
+                                  [(ids[key],) for key, _, _ in changed if key in existing])
+            self.conn.executemany("INSERT INTO paper_author (paper_id, position, name, pid) VALUES (?, ?, ?, ?)", [
+                (ids[key], position, author.get('name'), author.get('pid'))
+                for key, paper, _ in changed
+                for position, author in enumerate(paper.get('authors', []))
+            ])
+        return len(changed)
+
+    def upsert_papers(self, papers, batch_size=5000, prune=False):
+        """
+        按 dblp key 批量插入或更新论文，返回 (写入数, 未变化数, 删除数)。
+        prune 为 True 时删除本次输入中没有出现的论文。
+        """
+        written = 0
+        seen = 0
+        keys = set()
+        batch = []
+        for paper in papers:
+            key = paper.get('key')
+            if not key:
+                continue
+            seen += 1
+            keys.add(key)
+            batch.append((key, paper, json.dumps(paper, ensure_ascii=False)))
+            if len(batch) >= batch_size:
+                written += self._write_batch(batch)
+                batch = []
+        if batch:
+            written += self._write_batch(batch)
+
+        removed = 0
+        if prune:
+            stale = [(key,) for (key,) in self.conn.execute("SELECT key FROM papers") if key not in keys]
+            with self.conn:
+                self.conn.executemany("DELETE FROM papers WHERE key = ?", stale)
+            removed = len(stale)
+        return written, seen - written, removed
+
+    def load_duplicates(self, clusters):
+        """用 dblp key -> 簇编号 整体替换重复簇表，返回条数"""
+        with self.conn:
+            self.conn.execute("DELETE FROM paper_duplicate")
+            self.conn.executemany("INSERT INTO paper_duplicate (key, cluster) VALUES (?, ?)", clusters.items())
+        return len(clusters)
+
+    def duplicates_of(self, key):
+        """与该论文在同一重复簇中的其他论文"""
+        return self._papers(
+            "SELECT p.record FROM paper_duplicate d JOIN paper_duplicate o ON o.cluster = d.cluster "
+            "JOIN papers p ON p.key = o.key WHERE d.key = ? AND o.key != ? ORDER BY p.year, p.key", (key, key))
+
+    def _papers(self, sql, params=()):
+        return [json.loads(record) for (record,) in self.conn.execute(sql, params)]
+
+    def by_key(self, key):
+        papers = self._papers("SELECT record FROM papers WHERE key = ?", (key,))
+        return papers[0] if papers else None
+
+    def by_doi(self, doi):
+        return self._papers("SELECT record FROM papers WHERE doi = ?", (doi,))
+
+    def by_author(self, pid, conference=None, years=None):
+        """某个作者（dblp pid）的论文，可按会议和年份区间过滤"""
+        sql = ("SELECT p.record FROM paper_author a JOIN papers p ON p.id = a.paper_id "
+               "WHERE a.pid = ?")
+        params = [pid]
+        if conference:
+            sql += " AND p.conference = ?"
+            params.append(conference)
+        if years:
+            sql += " AND p.year BETWEEN ? AND ?"
+            params.extend(years)
+        sql += " ORDER BY p.year, p.title"
+        return self._papers(sql, params)
+
+    def search_titles(self, query, limit=20, conference=None):
+        """标题全文检索（FTS5 语法），按 bm25 相关度排序"""
+        sql = ("SELECT p.record FROM papers_fts JOIN papers p ON p.id = papers_fts.rowid "
+               "WHERE papers_fts MATCH ?")
+        params = [query]
+        if conference:
+            sql += " AND p.conference = ?"
+            params.append(conference)
+        sql += " ORDER BY bm25(papers_fts) LIMIT ?"
+        params.append(limit)
+        return self._papers(sql, params)
+
+
+def print_papers(papers):
+    for paper in papers:
+        authors = ", ".join(author['name'] for author in paper.get('authors', []))
+        print(f"[{paper['conference']} {paper['year']}] {paper['title']}")
+        print(f"    {authors}")
+        print(f"    key: {paper['key']}  doi: {paper.get('doi') or '-'}")
+    print(f"共 {len(papers)} 条结果")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="论文目录（SQLite）：构建与查询")
+    parser.add_argument('--db', default=CATALOG_FILE, help="目录数据库文件")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="从 papers.jsonl 或列式存储增量导入")
+    build.add_argument('--input', default="papers.jsonl")
+    build.add_argument('--batch-size', type=int, default=5000)
+    build.add_argument('--prune', action='store_true', help="删除输入中已经不存在的论文")
+    build.add_argument('--duplicates', metavar='FILE', help="同时导入 find_duplicates.py 生成的重复簇文件")
+
+    doi = subparsers.add_parser('doi', help="按DOI查询")
+    doi.add_argument('doi')
+
+    key = subparsers.add_parser('key', help="按 dblp key 查询")
+    key.add_argument('key')
+
+    duplicates = subparsers.add_parser('duplicates', help="查询与某篇论文（dblp key）重复的论文")
+    duplicates.add_argument('key')
+
+    author = subparsers.add_parser('author', help="按作者 pid 查询")
+    author.add_argument('pid')
+    author.add_argument('--conference')
+    author.add_argument('--years', type=int, nargs=2, metavar=('START', 'END'))
+
+    search = subparsers.add_parser('search', help="标题全文检索")
+    search.add_argument('query')
+    search.add_argument('--conference')
+    search.add_argument('--limit', type=int, default=20)
+
+    args = parser.parse_args()
+
+    with PaperCatalog(args.db) as catalog:
+        if args.command == 'build':
+            written, unchanged, removed = catalog.upsert_papers(
+                iter_paper_records(args.input), args.batch_size, args.prune)
+            print(f"导入完成！写入 {written} 条，未变化 {unchanged} 条，删除 {removed} 条")
+            if args.duplicates:
+                from find_duplicates import load_clusters
+                count = catalog.load_duplicates(load_clusters(args.duplicates))
+                print(f"导入重复簇: {count} 篇论文")
+        elif args.command == 'doi':
+            print_papers(catalog.by_doi(args.doi))
+        elif args.command == 'key':
+            paper = catalog.by_key(args.key)
+            print_papers([paper] if paper else [])
+        elif args.command == 'duplicates':
+            print_papers(catalog.duplicates_of(args.key))
+        elif args.command == 'author':
+            print_papers(catalog.by_author(args.pid, args.conference, args.years))
+        elif args.command == 'search':
+            print_papers(catalog.search_titles(args.query, args.limit, args.conference))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import shutil
+import argparse
+
+import numpy as np
+
+# 默认的列式存储目录
+STORE_DIR = "papers_columns"
+STORE_VERSION = 1
+
+# 字典编码的低基数列
+DICT_COLUMNS = ('conference', 'venue', 'type', 'access')
+# 整数列，None 存成 -1
+INT_COLUMNS = ('year', 'volume')
+# 变长字符串列：\0 结尾拼接的 UTF-8 字节 + 偏移数组
+STRING_COLUMNS = ('title', 'doi', 'url', 'pages', 'key', 'published_year', 'ee')
+# 只在存在时才写入论文字典的字段
+OPTIONAL_COLUMNS = ('published_year', 'access', 'ee')
+
+# 与 parse_papers.parse_paper 输出一致的字段顺序
+PAPER_COLUMNS = ('conference', 'year', 'volume', 'title', 'authors', 'doi', 'url',
+                 'pages', 'type', 'key', 'venue', 'published_year', 'access', 'ee')
+
+# 单元格状态：正常 / 值为 None / 字段不存在
+PRESENT, NULL, ABSENT = 0, 1, 2
+MISSING_CODE = np.iinfo(np.uint16).max
+
+
+class _StringColumnBuilder:
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = [0]
+
+    def append(self, value):
+        if value:
+            self.data += value.encode('utf-8')
+        self.data += b'\0'
+        self.offsets.append(len(self.data))
+
+    def save(self, path, name):
+        np.save(os.path.join(path, f"{name}.data.npy"), np.frombuffer(bytes(self.data), dtype=np.uint8))
+        np.save(os.path.join(path, f"{name}.offsets.npy"), np.array(self.offsets, dtype=np.int64))
+
+
+def write_paper_store(papers, path=STORE_DIR):
+    """把论文信息写成列式存储，返回写入的论文数"""
+    dictionaries = {name: {} for name in DICT_COLUMNS}
+    codes = {name: [] for name in DICT_COLUMNS}
+    ints = {name: [] for name in INT_COLUMNS}
+    strings = {name: _StringColumnBuilder() for name in STRING_COLUMNS}
+    states = {name: [] for name in DICT_COLUMNS + STRING_COLUMNS}
+    author_offsets = [0]
+    author_names = _StringColumnBuilder()
+    author_pids = _StringColumnBuilder()
+
+    count = 0
+    for paper in papers:
+        count += 1
+        for name in DICT_COLUMNS:
+            value = paper.get(name)
+            states[name].append(PRESENT if value is not None else (NULL if name in paper else ABSENT))
+            if value is None:
+                codes[name].append(MISSING_CODE)
+            else:
+                codes[name].append(dictionaries[name].setdefault(value, len(dictionaries[name])))
+        for name in INT_COLUMNS:
+            value = paper.get(name)
+            ints[name].append(-1 if value is None else int(value))
+        for name in STRING_COLUMNS:
+            value = paper.get(name)
+            states[name].append(PRESENT if value is not None else (NULL if name in paper else ABSENT))
+            strings[name].append(value)
+        for author in paper.get('authors', []):
+            author_names.append(author.get('name'))
+            author_pids.append(author.get('pid'))
+        author_offsets.append(len(author_names.offsets) - 1)
+
+    # 先写到临时目录，完成后整体替换
+    tmp_path = path.rstrip('/\\') + '.part'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    for name in DICT_COLUMNS:
+        np.save(os.path.join(tmp_path, f"{name}.codes.npy"), np.array(codes[name], dtype=np.uint16))
+    for name in INT_COLUMNS:
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.array(ints[name], dtype=np.int16))
+    for name, builder in strings.items():
+        builder.save(tmp_path, name)
+    # 只有出现过 None 或缺失的列才保存状态数组
+    stateful = []
+    for name, values in states.items():
+        if any(values):
+            np.save(os.path.join(tmp_path, f"{name}.state.npy"), np.array(values, dtype=np.uint8))
+            stateful.append(name)
+    np.save(os.path.join(tmp_path, "authors.offsets.npy"), np.array(author_offsets, dtype=np.int64))
+    author_names.save(tmp_path, "author_name")
+    author_pids.save(tmp_path, "author_pid")
+
+    meta = {
+        'version': STORE_VERSION,
+        'count': count,
+        'dictionaries': {name: list(values) for name, values in dictionaries.items()},
+        'stateful': stateful,
+    }
+    with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return count
+
+
+class PaperStore:
+    """列式论文存储的读取端：所有数组按需以 mmap 方式打开，支持列裁剪和年份/会议过滤下推"""
+
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != STORE_VERSION:
+            raise ValueError(f"不支持的存储版本: {self.meta['version']}")
+        self._arrays = {}
+
+    def __len__(self):
+        return self.meta['count']
+
+    def _array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+        return self._arrays[name]
+
+    def _state(self, name):
+        if name in self.meta['stateful']:
+            return self._array(f"{name}.state")
+        return None
+
+    def select(self, conference=None, years=None, venue=None):
+        """
+        按会议、年份范围和venue过滤，只读取编码列，返回满足条件的行号数组。
+        years 可以是单个年份或 (起始, 结束) 闭区间。
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in (('conference', conference), ('venue', venue)):
+            if value is None:
+                continue
+            values = [value] if isinstance(value, str) else value
+            dictionary = self.meta['dictionaries'][name]
+            wanted = [dictionary.index(v) for v in values if v in dictionary]
+            mask &= np.isin(self._array(f"{name}.codes"), wanted)
+        if years is not None:
+            year = self._array("year")
+            if isinstance(years, int):
+                mask &= year == years
+            else:
+                mask &= (year >= years[0]) & (year <= years[1])
+        return np.flatnonzero(mask)
+
+    def _strings(self, name, rows):
+        data = self._array(f"{name}.data")
+        if rows is None:
+            # 整列读取：一次解码后按 \0 切分
+            return bytes(data).decode('utf-8').split('\0')[:-1]
+        offsets = self._array(f"{name}.offsets")
+        rows = np.asarray(rows, dtype=np.int64)
+        view = memoryview(data)
+        return [str(view[start:end], 'utf-8')
+                for start, end in zip(offsets[rows].tolist(), (offsets[rows + 1] - 1).tolist())]
+
+    def _author_lists(self, rows):
+        offsets = self._array("authors.offsets")
+        if rows is None:
+            rows = range(len(self))
+            names = self._strings("author_name", None)
+            pids = self._strings("author_pid", None)
+            bounds = offsets.tolist()
+            starts, ends = bounds[:-1], bounds[1:]
+        else:
+            # 先把所有命中行的作者下标拼在一起，一次解码
+            rows = np.asarray(rows, dtype=np.int64)
+            starts, ends = offsets[rows].tolist(), offsets[rows + 1].tolist()
+            flat = [j for start, end in zip(starts, ends) for j in range(start, end)]
+            names = self._strings("author_name", flat)
+            pids = self._strings("author_pid", flat)
+            lengths = [end - start for start, end in zip(starts, ends)]
+            starts = np.cumsum([0] + lengths[:-1]).tolist() if lengths else []
+            ends = [start + length for start, length in zip(starts, lengths)]
+        return [[{'name': names[j], 'pid': pids[j]} for j in range(start, end)]
+                for start, end in zip(starts, ends)]
+
+    def column(self, name, rows=None):
+        """读取一列；rows 为 None 时读取全部行。缺失或为 None 的单元格返回 None"""
+        if name == 'authors':
+            return self._author_lists(rows)
+        if name in INT_COLUMNS:
+            values = self._array(name) if rows is None else self._array(name)[rows]
+            return [None if v < 0 else int(v) for v in values.tolist()]
+        if name in DICT_COLUMNS:
+            dictionary = self.meta['dictionaries'][name]
+            codes = self._array(f"{name}.codes") if rows is None else self._array(f"{name}.codes")[rows]
+            values = [dictionary[c] if c != MISSING_CODE else None for c in codes.tolist()]
+        elif name in STRING_COLUMNS:
+            values = self._strings(name, rows)
+        else:
+            raise KeyError(name)
+
+        state = self._state(name)
+        if state is not None:
+            state = state if rows is None else state[rows]
+            for i in np.flatnonzero(state):
+                values[i] = None
+        return values
+
+    def read(self, columns=None, conference=None, years=None, venue=None):
+        """读取若干列，返回 列名 -> 值列表；带过滤条件时只解码命中的行"""
+        columns = columns or PAPER_COLUMNS
+        rows = None
+        if conference is not None or years is not None or venue is not None:
+            rows = self.select(conference, years, venue)
+        return {name: self.column(name, rows) for name in columns}
+
+    def iter_papers(self, columns=None, conference=None, years=None, venue=None):
+        """按 parse_papers.parse_paper 的字段顺序重建论文字典"""
+        columns = [name for name in PAPER_COLUMNS if columns is None or name in columns]
+        rows = None
+        if conference is not None or years is not None or venue is not None:
+            rows = self.select(conference, years, venue)
+        data = {name: self.column(name, rows) for name in columns}
+        states = {}
+        for name in OPTIONAL_COLUMNS:
+            state = self._state(name) if name in data else None
+            if state is not None:
+                states[name] = state if rows is None else state[rows]
+
+        count = len(self) if rows is None else len(rows)
+        for i in range(count):
+            paper = {}
+            for name in columns:
+                if name in states and states[name][i] == ABSENT:
+                    continue
+                paper[name] = data[name][i]
+            yield paper
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从 papers.jsonl 构建列式存储，或查询已有的存储")
+    parser.add_argument('--input', default="papers.jsonl", help="构建时读取的 JSONL 文件")
+    parser.add_argument('--store', default=STORE_DIR, help="列式存储目录")
+    parser.add_argument('--build', action='store_true', help="从 JSONL 重新构建存储")
+    parser.add_argument('--columns', nargs='+', default=['title'], help="查询时读取的列")
+    parser.add_argument('--conference', help="只读取该会议")
+    parser.add_argument('--years', type=int, nargs=2, metavar=('START', 'END'), help="只读取该年份区间")
+    args = parser.parse_args()
+
+    if args.build:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            count = write_paper_store((json.loads(line) for line in f), args.store)
+        print(f"已写入 {count} 篇论文到: {args.store}")
+        return
+
+    start = time.perf_counter()
+    store = PaperStore(args.store)
+    data = store.read(args.columns, conference=args.conference,
+                      years=tuple(args.years) if args.years else None)
+    elapsed = time.perf_counter() - start
+    rows = len(next(iter(data.values()))) if data else 0
+    print(f"读取了 {rows} 行 x {len(data)} 列，用时 {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,30 @@
 import os
 import json
+import shutil
+import hashlib
+import argparse
+import multiprocessing
 import xml.etree.ElementTree as ET
 from glob import glob
 from datetime import datetime
 
+import instrumentation
+from instrumentation import metrics
+
+# 增量解析时每个XML文件对应的输出分片目录
+SHARD_DIR = "papers_shards"
+SHARD_MANIFEST = "manifest.json"
+
+# 解析逻辑或输出格式变化时加一，使已有分片全部失效
+PARSER_VERSION = 1
+
+# 只在存在时才写入的额外字段：(info 中的标签, 论文字段名)，按输出顺序排列
+OPTIONAL_FIELDS = (
+    ('year', 'published_year'),
+    ('access', 'access'),
+    ('ee', 'ee'),
+)
+
 def parse_author(author_elem):
     """解析作者信息"""
     return {
@@ -13,102 +34,356 @@ def parse_author(author_elem):
 
 def parse_paper(entry, conference, year, volume=None):
     """解析单篇论文信息"""
-    info = entry.find('.//info')
+    info = entry.find('info')
+    if info is None:
+        info = entry.find('.//info')
     if info is None:
         return None
-        
+
+    # 单遍扫描 info 的子元素，按标签分发到字段表
+    # 倒序遍历：同名标签（如多个 ee）重复出现时，最终留下的是第一个，与 find() 的结果一致
+    fields = {}
+    authors = []
+    for child in reversed(info):
+        tag = child.tag
+        if tag == 'authors':
+            authors[:0] = [parse_author(author) for author in child.iter('author')]
+        elif tag == 'author':
+            authors.insert(0, parse_author(child))
+        else:
+            fields[tag] = child.text
+
     paper = {
         'conference': conference,
         'year': year,
         'volume': volume,
-        'title': info.find('title').text if info.find('title') is not None else '',
-        'authors': [parse_author(author) for author in info.findall('.//author')],
-        'doi': info.find('doi').text if info.find('doi') is not None else '',
-        'url': info.find('url').text if info.find('url') is not None else '',
-        'pages': info.find('pages').text if info.find('pages') is not None else '',
-        'type': info.find('type').text if info.find('type') is not None else '',
-        'key': info.find('key').text if info.find('key') is not None else '',
-        'venue': info.find('venue').text if info.find('venue') is not None else '',
+        'title': fields.get('title', ''),
+        'authors': authors,
+        'doi': fields.get('doi', ''),
+        'url': fields.get('url', ''),
+        'pages': fields.get('pages', ''),
+        'type': fields.get('type', ''),
+        'key': fields.get('key', ''),
+        'venue': fields.get('venue', ''),
     }
     
     # 提取可能存在的额外信息
-    if info.find('year') is not None:
-        paper['published_year'] = info.find('year').text
-    if info.find('access') is not None:
-        paper['access'] = info.find('access').text
-    if info.find('ee') is not None:
-        paper['ee'] = info.find('ee').text
+    for tag, name in OPTIONAL_FIELDS:
+        if tag in fields:
+            paper[name] = fields[tag]
     
     return paper
 
-def process_xml_file(file_path):
-    """处理单个XML文件"""
+def parse_filename(filename):
+    """从文件名解析会议信息，返回 (conference, year, volume)；无法识别时返回 None"""
+    if filename.startswith('icde_'):
+        conference = 'ICDE'
+        year = int(filename.split('_')[1].split('.')[0])
+        volume = None
+    elif filename.startswith('sigmod_'):
+        conference = 'SIGMOD'
+        year = int(filename.split('_')[1].split('.')[0])
+        volume = None
+    elif filename.startswith('vldb_'):
+        conference = 'VLDB'
+        # 只处理带卷号的 PVLDB 文件（2008年起）；更早的会议论文集文件名里没有卷号，与原来一样不计入
+        if 'vol' not in filename:
+            return None
+        year = int(filename.split('_')[1])
+        volume = int(filename.split('vol')[1].split('.')[0])
+    else:
+        return None
+    return conference, year, volume
+
+def iter_xml_file(file_path, report=print):
+    """流式解析单个XML文件，逐条产出论文信息，处理完的条目立即释放；出错信息交给 report 输出"""
     try:
         # 从文件名解析会议信息
-        filename = os.path.basename(file_path)
-        if filename.startswith('icde_'):
-            conference = 'ICDE'
-            year = int(filename.split('_')[1].split('.')[0])
-            volume = None
-        elif filename.startswith('sigmod_'):
-            conference = 'SIGMOD'
-            year = int(filename.split('_')[1].split('.')[0])
-            volume = None
-        elif filename.startswith('vldb_'):
-            conference = 'VLDB'
-            year = int(filename.split('_')[1])
-            volume = int(filename.split('vol')[1].split('.')[0])
-        else:
-            return []
-
-        # 解析XML文件
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        # 提取所有论文信息
-        papers = []
-        for hit in root.findall('.//hit'):
+        source = parse_filename(os.path.basename(file_path))
+        if source is None:
+            return
+        conference, year, volume = source
+
+        hits = None
+        for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == 'hits':
+                    hits = elem
+                continue
+            if elem.tag != 'hit':
+                continue
+
             try:
-                paper = parse_paper(hit, conference, year, volume)
-                if paper is not None:
-                    papers.append(paper)
+                paper = parse_paper(elem, conference, year, volume)
             except Exception as e:
-                print(f"解析论文时出错 {file_path}: {str(e)}")
-                continue
-                
-        return papers
-        
+                report(f"解析论文时出错 {file_path}: {str(e)}")
+                paper = None
+
+            # 清空已处理的条目并从父节点摘掉，内存占用不随文件大小增长
+            elem.clear()
+            if hits is not None:
+                hits.clear()
+
+            if paper is not None:
+                yield paper
+
     except Exception as e:
-        print(f"处理文件时出错 {file_path}: {str(e)}")
-        return []
+        report(f"处理文件时出错 {file_path}: {str(e)}")
 
-def main():
-    # 输出文件
-    output_file = "papers.jsonl"
-    
-    # 获取所有XML文件
+def process_xml_file(file_path):
+    """处理单个XML文件"""
+    return list(iter_xml_file(file_path))
+
+def serialize_xml_file(file_path):
+    """
+    进程池中的任务：解析单个文件并直接序列化成JSONL文本。
+    出错信息先收集起来，由主进程按文件顺序打印，返回 (JSONL文本, 论文数, 出错信息)
+    """
+    messages = []
+    lines = [json.dumps(paper, ensure_ascii=False) + '\n'
+             for paper in iter_xml_file(file_path, report=messages.append)]
+    return ''.join(lines), len(lines), messages
+
+def iter_paper_records(path, columns=None):
+    """逐条读取论文：path 是目录时按列式存储读取（只解码需要的列），否则按 JSONL 读取"""
+    if os.path.isdir(path):
+        from paper_store import PaperStore
+        yield from PaperStore(path).iter_papers(columns)
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line.strip())
+
+def write_columnar(jsonl_file, store_dir):
+    """由 papers.jsonl 生成列式存储"""
+    # 只有需要列式存储时才依赖 numpy
+    from paper_store import write_paper_store
+    count = write_paper_store(iter_paper_records(jsonl_file), store_dir)
+    print(f"列式存储已保存到: {store_dir}（{count} 篇论文）")
+
+def find_xml_files():
+    """获取所有XML文件，按文件名排序保证输出顺序稳定"""
     xml_files = []
     xml_files.extend(glob("ICDE_PAPER/*.xml"))
     xml_files.extend(glob("SIGMOD_PAPER/*.xml"))
     xml_files.extend(glob("VLDB_PAPER/*.xml"))
+    return sorted(xml_files)
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def shard_path(xml_file, shard_dir=SHARD_DIR):
+    """ICDE_PAPER/icde_2020.xml -> papers_shards/ICDE_PAPER/icde_2020.jsonl"""
+    return os.path.join(shard_dir, os.path.splitext(xml_file)[0] + '.jsonl')
+
+def load_shard_manifest(shard_dir=SHARD_DIR):
+    """读取分片清单：源文件 -> {sha256, size, mtime_ns, shard, papers}"""
+    path = os.path.join(shard_dir, SHARD_MANIFEST)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('parser_version') == PARSER_VERSION:
+            return manifest
+    return {'parser_version': PARSER_VERSION, 'sources': {}, 'combined': None}
+
+def save_shard_manifest(manifest, shard_dir=SHARD_DIR):
+    path = os.path.join(shard_dir, SHARD_MANIFEST)
+    tmp_file = path + '.part'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_file, path)
+
+def shard_is_fresh(entry, xml_file, stat):
+    """
+    分片是否仍然有效：先比较大小和修改时间，不一致时再比较内容哈希。
+    返回 (是否有效, 内容哈希)；大小和修改时间一致时不计算哈希，返回的哈希为 None
+    """
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns \
+            and os.path.exists(entry['shard']):
+        return True, None
+    sha = file_sha256(xml_file)
+    if entry and entry['sha256'] == sha and os.path.exists(entry['shard']):
+        # 只是修改时间变了，内容没变
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True, sha
+    return False, sha
+
+def store_shard(sources, xml_file, sha, stat, text, count, shard_dir=SHARD_DIR):
+    """写出一个源文件的分片并记入清单"""
+    shard = shard_path(xml_file, shard_dir)
+    os.makedirs(os.path.dirname(shard), exist_ok=True)
+    with metrics.stage('write_jsonl'), open(shard, 'w', encoding='utf-8') as f:
+        f.write(text)
+    sources[xml_file] = {
+        'sha256': sha,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'shard': shard,
+        'papers': count,
+    }
+    count_parsed(stat.st_size, count)
+
+def remove_stale_sources(manifest, xml_files):
+    """删除已经不存在的源文件对应的分片"""
+    sources = manifest['sources']
+    for xml_file in set(sources) - set(xml_files):
+        shard = sources.pop(xml_file)['shard']
+        if os.path.exists(shard):
+            os.remove(shard)
+        manifest['combined'] = None
+
+def update_shards(xml_files, shard_dir=SHARD_DIR, workers=1):
+    """
+    只重新解析新增或内容变化的XML文件，每个源文件写一个JSONL分片。
+    先比较大小和修改时间，不一致时再比较内容哈希。返回 (分片清单, 重新解析的文件列表)
+    """
+    manifest = load_shard_manifest(shard_dir)
+    sources = manifest['sources']
+
+    stale = []
+    for xml_file in xml_files:
+        stat = os.stat(xml_file)
+        fresh, sha = shard_is_fresh(sources.get(xml_file), xml_file, stat)
+        if not fresh:
+            stale.append((xml_file, sha, stat))
+
+    remove_stale_sources(manifest, xml_files)
+
+    if workers > 1 and len(stale) > 1:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(serialize_xml_file, [xml_file for xml_file, _, _ in stale])
+    else:
+        pool = None
+        results = map(serialize_xml_file, [xml_file for xml_file, _, _ in stale])
+
+    try:
+        for (xml_file, sha, stat), (text, count, messages) in zip(stale, metrics.timed_iter('parse_file', results)):
+            print(f"正在处理: {xml_file}")
+            for message in messages:
+                print(message)
+            store_shard(sources, xml_file, sha, stat, text, count, shard_dir)
+            manifest['combined'] = None
+            print(f"已解析 {count} 篇论文")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return manifest, [xml_file for xml_file, _, _ in stale]
+
+def count_parsed(size, count):
+    metrics.count('files_parsed')
+    metrics.count('bytes_parsed', size)
+    metrics.count('hits_parsed', count)
+
+def iter_papers(shard_dir=SHARD_DIR):
+    """按源文件顺序依次读取所有分片，得到与 papers.jsonl 相同顺序的论文"""
+    manifest = load_shard_manifest(shard_dir)
+    for xml_file in sorted(manifest['sources']):
+        with open(manifest['sources'][xml_file]['shard'], 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+def combined_is_fresh(manifest, output_file):
+    """output_file 仍是上次合并的结果：分片变化时 combined 会被清空，输出被改动时大小或修改时间对不上"""
+    combined = manifest.get('combined')
+    if not combined or combined['path'] != output_file or not os.path.exists(output_file):
+        return False
+    stat = os.stat(output_file)
+    return combined['size'] == stat.st_size and combined['mtime_ns'] == stat.st_mtime_ns
+
+def combine_shards(manifest, output_file):
+    """把所有分片按源文件顺序拼接成 papers.jsonl；分片和输出都没变时什么也不做"""
+    if combined_is_fresh(manifest, output_file):
+        return False
+
+    tmp_file = output_file + '.part'
+    with open(tmp_file, 'wb') as out:
+        for xml_file in sorted(manifest['sources']):
+            with open(manifest['sources'][xml_file]['shard'], 'rb') as f:
+                shutil.copyfileobj(f, out)
+    os.replace(tmp_file, output_file)
+
+    stat = os.stat(output_file)
+    manifest['combined'] = {'path': output_file, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="把下载的XML文件解析为 papers.jsonl")
+    parser.add_argument('-o', '--output', default="papers.jsonl", help="输出的 JSONL 文件")
+    parser.add_argument('--workers', type=int, default=1, help="并行解析的进程数，1 表示单进程")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"只重新解析变化的XML文件，分片保存在 {SHARD_DIR}/ 后拼接输出")
+    parser.add_argument('--columnar', metavar='DIR', help="同时写出列式存储（如 papers_columns）")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args, 'parse_papers')
+
+    # 输出文件
+    output_file = args.output
+    
+    # 获取所有XML文件
+    xml_files = find_xml_files()
+
+    if args.incremental:
+        manifest, parsed = update_shards(xml_files, workers=args.workers)
+        changed = combine_shards(manifest, output_file)
+        save_shard_manifest(manifest)
+        total_papers = sum(entry['papers'] for entry in manifest['sources'].values())
+        print(f"\n处理完成！")
+        print(f"重新解析了 {len(parsed)} 个文件，{len(xml_files) - len(parsed)} 个文件未变化")
+        print(f"总共有 {total_papers} 篇论文")
+        if changed:
+            print(f"结果已保存到: {output_file}")
+        else:
+            print(f"{output_file} 已是最新，无需改写")
+        if args.columnar and (changed or not os.path.exists(args.columnar)):
+            with metrics.stage('write_columnar'):
+                write_columnar(output_file, args.columnar)
+        instrumentation.finish(args)
+        return
     
     total_papers = 0
     
-    # 处理所有文件并写入JSONL
     with open(output_file, 'w', encoding='utf-8') as f:
-        for xml_file in sorted(xml_files):
-            print(f"正在处理: {xml_file}")
-            papers = process_xml_file(xml_file)
-            for paper in papers:
-                json.dump(paper, f, ensure_ascii=False)
-                f.write('\n')
-            total_papers += len(papers)
-            print(f"已解析 {len(papers)} 篇论文")
+        if args.workers > 1:
+            # 多进程并行解析，imap 按提交顺序返回结果，输出顺序与单进程完全一致
+            with multiprocessing.Pool(args.workers) as pool:
+                results = metrics.timed_iter('parse_file', pool.imap(serialize_xml_file, xml_files))
+                for xml_file, (text, count, messages) in zip(xml_files, results):
+                    print(f"正在处理: {xml_file}")
+                    for message in messages:
+                        print(message)
+                    with metrics.stage('write_jsonl'):
+                        f.write(text)
+                    count_parsed(os.path.getsize(xml_file), count)
+                    total_papers += count
+                    print(f"已解析 {count} 篇论文")
+        else:
+            # 边解析边写入JSONL
+            for xml_file in xml_files:
+                print(f"正在处理: {xml_file}")
+                count = 0
+                for paper in metrics.timed_iter('parse_xml', iter_xml_file(xml_file)):
+                    with metrics.stage('write_jsonl'):
+                        f.write(json.dumps(paper, ensure_ascii=False) + '\n')
+                    count += 1
+                count_parsed(os.path.getsize(xml_file), count)
+                total_papers += count
+                print(f"已解析 {count} 篇论文")
     
     print(f"\n处理完成！")
     print(f"总共处理了 {len(xml_files)} 个文件")
     print(f"总共解析了 {total_papers} 篇论文")
     print(f"结果已保存到: {output_file}")
+    if args.columnar:
+        with metrics.stage('write_columnar'):
+            write_columnar(output_file, args.columnar)
+    instrumentation.finish(args)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,300 @@
+import os
+import json
+import hashlib
+import argparse
+import multiprocessing
+from collections import defaultdict
+
+from parse_papers import iter_paper_records
+
+# PDF的本地存放目录：PDF_PAPERS/<会议>/<年份>/<文件名>
+PDF_DIR = "PDF_PAPERS"
+# 默认的目录文件
+PDF_CATALOG_FILE = "pdf_catalog.json"
+# 目录格式变化时加一，旧目录全部重新扫描
+CATALOG_VERSION = 1
+# 在文件末尾这么多字节内找 %%EOF（规范允许其后还有少量空白或垃圾字节）
+EOF_WINDOW = 1024
+# 与PDF文件名匹配需要的列
+MATCH_COLUMNS = ['conference', 'year', 'title', 'authors', 'doi', 'url', 'key']
+
+
+def build_pdf_filename(paper):
+    """构建文件名：标题_作者.pdf"""
+    first_author = paper['authors'][0]['name'] if paper['authors'] else 'Unknown'
+    safe_title = "".join(x for x in paper['title'][:50] if x.isalnum() or x in (' ', '-', '_'))
+    return f"{safe_title}_{first_author}.pdf".replace(' ', '_')
+
+
+def pdf_path(paper, base_dir=PDF_DIR):
+    """论文PDF的本地路径"""
+    return os.path.join(base_dir, paper['conference'], str(paper['year']), build_pdf_filename(paper))
+
+
+def inspect_pdf(path):
+    """一遍读取文件：内容 sha256、是否以 %PDF- 开头、末尾是否有 %%EOF"""
+    sha = hashlib.sha256()
+    head = b''
+    tail = b''
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+            if not head:
+                head = chunk[:5]
+            tail = (tail + chunk)[-EOF_WINDOW:]
+    return {'sha256': sha.hexdigest(), 'header': head == b'%PDF-', 'eof': b'%%EOF' in tail}
+
+
+def _inspect_entry(path):
+    return path, inspect_pdf(path)
+
+
+def scan_pdfs(pdf_dir=PDF_DIR):
+    """一遍 os.scandir 遍历 PDF_PAPERS/<会议>/<年份>/*.pdf，产生 (会议, 年份, 文件名, DirEntry)"""
+    if not os.path.isdir(pdf_dir):
+        return
+    for conference in sorted(os.scandir(pdf_dir), key=lambda e: e.name):
+        if not conference.is_dir():
+            continue
+        for year in sorted(os.scandir(conference.path), key=lambda e: e.name):
+            if not year.is_dir():
+                continue
+            for entry in sorted(os.scandir(year.path), key=lambda e: e.name):
+                if entry.is_file() and entry.name.lower().endswith('.pdf'):
+                    yield conference.name, year.name, entry.name, entry
+
+
+def index_papers(papers_input):
+    """(会议, 年份, 下载器生成的文件名) -> 论文记录"""
+    papers = {}
+    for paper in iter_paper_records(papers_input, MATCH_COLUMNS):
+        if paper.get('title') is None:
+            continue
+        papers.setdefault((paper['conference'], str(paper['year']), build_pdf_filename(paper)), paper)
+    return papers
+
+
+class PdfCatalog:
+    """
+    本地PDF目录：路径 -> {size, mtime_ns, sha256, header, eof, key, doi}。
+    同时维护 dblp key / DOI -> 路径 的索引，查找一篇论文的本地PDF不再需要逐个 os.path.exists。
+    论文与文件的对应在第一次匹配或下载时记下，之后标题变化也不会丢失。
+    pdf_dir 为扫描的PDF目录，按文件名规则查找时在这里找。
+    """
+
+    def __init__(self, path=PDF_CATALOG_FILE, pdf_dir=PDF_DIR):
+        self.path = path
+        self.pdf_dir = pdf_dir
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                catalog = json.load(f)
+            if catalog.get('version') == CATALOG_VERSION:
+                self.files = catalog['files']
+        self._reindex()
+
+    def _reindex(self):
+        self.by_key = {}
+        self.by_doi = {}
+        for path, entry in self.files.items():
+            self._index(path, entry)
+
+    def _index(self, path, entry):
+        if entry.get('key'):
+            self.by_key.setdefault(entry['key'], path)
+        if entry.get('doi'):
+            self.by_doi.setdefault(entry['doi'], path)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self, path):
+        return path in self.files
+
+    def entry(self, path):
+        return self.files.get(path)
+
+    def lookup(self, paper, valid_only=True):
+        """论文的本地PDF路径：依次按 dblp key、DOI、下载器的文件名规则查找，找不到返回 None"""
+        candidates = (self.by_key.get(paper.get('key')), self.by_doi.get(paper.get('doi')))
+        for path in candidates:
+            if path is not None:
+                break
+        else:
+            path = pdf_path(paper, self.pdf_dir) if paper.get('title') is not None else None
+            if path not in self.files:
+                return None
+        if valid_only and not is_valid(self.files[path]):
+            return None
+        return path
+
+    def add(self, path, paper=None, stat=None, inspected=None):
+        """登记（或更新）一个文件；paper 给出时记下它对应的论文"""
+        stat = stat or os.stat(path)
+        old = self.files.get(path, {})
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        entry.update(inspected or inspect_pdf(path))
+        entry['key'] = (paper or {}).get('key') or old.get('key')
+        entry['doi'] = (paper or {}).get('doi') or old.get('doi')
+        self.files[path] = entry
+        # 新登记的文件优先：例如不完整的旧文件被重新下载到了规范路径
+        if entry['key']:
+            self.by_key[entry['key']] = path
+        if entry['doi']:
+            self.by_doi[entry['doi']] = path
+        return entry
+
+    def remove(self, path):
+        self.files.pop(path, None)
+
+    def save(self):
+        tmp_file = self.path + '.part'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'version': CATALOG_VERSION, 'files': self.files}, f, ensure_ascii=False, indent=1,
+                      sort_keys=True)
+        os.replace(tmp_file, self.path)
+
+    def duplicates(self):
+        """内容完全相同的文件组，以及对应到同一篇论文的多个文件：[(原因, 值, [路径...]), ...]"""
+        groups = []
+        for field in ('sha256', 'key'):
+            paths = defaultdict(list)
+            for path, entry in self.files.items():
+                if entry.get(field):
+                    paths[entry[field]].append(path)
+            groups.extend((field, value, sorted(group)) for value, group in sorted(paths.items()) if len(group) > 1)
+        return groups
+
+    def truncated(self):
+        """有 %PDF- 文件头但末尾没有 %%EOF：通常是下载中断"""
+        return sorted(path for path, entry in self.files.items() if entry['header'] and not entry['eof'])
+
+    def invalid(self):
+        """不是PDF（如镜像站返回的HTML页面）"""
+        return sorted(path for path, entry in self.files.items() if not entry['header'])
+
+
+def is_valid(entry):
+    return entry['header'] and entry['eof']
+
+
+def update_catalog(pdf_dir=PDF_DIR, catalog_file=PDF_CATALOG_FILE, papers_input=None, workers=1):
+    """
+    一遍扫描 pdf_dir 增量更新目录：大小和修改时间都没变的文件直接沿用，其余文件重新计算哈希和有效性；
+    已删除的文件移出目录。给出 papers_input 时，把还没有对应论文的文件按文件名规则对应到论文。
+    返回 (目录, 统计)。
+    """
+    catalog = PdfCatalog(catalog_file, pdf_dir)
+    stats = {'files': 0, 'unchanged': 0, 'inspected': 0, 'removed': 0, 'matched': 0}
+
+    seen = set()
+    stale = []
+    names = {}
+    for conference, year, filename, dir_entry in scan_pdfs(pdf_dir):
+        path = dir_entry.path
+        stat = dir_entry.stat()
+        seen.add(path)
+        names[path] = (conference, year, filename)
+        stats['files'] += 1
+        entry = catalog.entry(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            stats['unchanged'] += 1
+            continue
+        stale.append((path, stat))
+
+    for path in set(catalog.files) - seen:
+        catalog.remove(path)
+        stats['removed'] += 1
+
+    if workers > 1 and len(stale) > 1:
+        pool = multiprocessing.Pool(workers)
+        results = pool.imap(_inspect_entry, [path for path, _ in stale], chunksize=8)
+    else:
+        pool = None
+        results = map(_inspect_entry, [path for path, _ in stale])
+    try:
+        for (path, stat), (_, inspected) in zip(stale, results):
+            catalog.add(path, stat=stat, inspected=inspected)
+            stats['inspected'] += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if papers_input:
+        unmatched = [path for path in seen if not catalog.files[path].get('key')]
+        if unmatched:
+            papers = index_papers(papers_input)
+            for path in unmatched:
+                paper = papers.get(names[path])
+                if paper is not None:
+                    entry = catalog.files[path]
+                    entry['key'] = paper.get('key')
+                    entry['doi'] = paper.get('doi') or entry.get('doi')
+                    stats['matched'] += 1
+
+    catalog._reindex()
+    catalog.save()
+    return catalog, stats
+
+
+def print_report(catalog):
+    duplicates = catalog.duplicates()
+    truncated = catalog.truncated()
+    invalid = catalog.invalid()
+    print(f"重复: {len(duplicates)} 组")
+    for field, value, paths in duplicates:
+        print(f"  [{'内容相同' if field == 'sha256' else '同一论文'}] {value}")
+        for path in paths:
+            print(f"      {path}")
+    print(f"不完整（缺少 %%EOF）: {len(truncated)} 个")
+    for path in truncated:
+        print(f"  {path}")
+    print(f"不是PDF: {len(invalid)} 个")
+    for path in invalid:
+        print(f"  {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地PDF目录：一遍扫描 PDF_PAPERS，记录哈希与有效性，按论文O(1)查找")
+    parser.add_argument('--pdf-dir', default=PDF_DIR)
+    parser.add_argument('--catalog', default=PDF_CATALOG_FILE, help="目录文件")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update = subparsers.add_parser('update', help="扫描并增量更新目录")
+    update.add_argument('--input', default="papers.jsonl", help="papers.jsonl 或列式存储目录，用于把文件对应到论文")
+    update.add_argument('--workers', type=int, default=1, help="并行计算哈希的进程数")
+    update.add_argument('--report', action='store_true', help="更新后列出重复和不完整的文件")
+
+    subparsers.add_parser('report', help="列出重复、不完整和不是PDF的文件")
+
+    lookup = subparsers.add_parser('lookup', help="按 dblp key 或 DOI 查找本地PDF")
+    lookup.add_argument('identifier')
+
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        papers_input = args.input if os.path.exists(args.input) else None
+        catalog, stats = update_catalog(args.pdf_dir, args.catalog, papers_input, args.workers)
+        print(f"PDF文件 {stats['files']} 个：未变化 {stats['unchanged']} 个，重新检查 {stats['inspected']} 个，"
+              f"移除 {stats['removed']} 个，新对应到论文 {stats['matched']} 个")
+        valid = sum(is_valid(entry) for entry in catalog.files.values())
+        print(f"有效 {valid} 个，已对应论文 {len(catalog.by_key)} 篇，目录已保存到: {args.catalog}")
+        if args.report:
+            print_report(catalog)
+        return
+
+    catalog = PdfCatalog(args.catalog, args.pdf_dir)
+    if args.command == 'report':
+        print_report(catalog)
+    elif args.command == 'lookup':
+        path = catalog.by_key.get(args.identifier) or catalog.by_doi.get(args.identifier)
+        if path is None:
+            print(f"目录中没有: {args.identifier}")
+            return
+        entry = catalog.entry(path)
+        print(f"{path}  {entry['size']} 字节  {'有效' if is_valid(entry) else '无效'}  sha256={entry['sha256']}")
+
+
+if __name__ == "__main__":
+    main()
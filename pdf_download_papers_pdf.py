@@ -1,14 +1,15 @@
 import os
-import json
 import time
 import random
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import quote_plus, urljoin
 from tqdm import tqdm
 
+from parse_papers import iter_paper_records
+from pdf_catalog import PDF_DIR, PdfCatalog, pdf_path, update_catalog
+
 class SciHubDownloader:
-    def __init__(self):
+    def __init__(self, catalog=None):
         # Sci-Hub镜像站点列表（需要定期更新）
         self.scihub_mirrors = [
             "https://sci-hub.se/",
@@ -23,16 +24,21 @@ class SciHubDownloader:
         }
         
         # 创建下载目录
-        self.base_dir = "PDF_PAPERS"
+        self.base_dir = PDF_DIR
         if not os.path.exists(self.base_dir):
             os.makedirs(self.base_dir)
 
+        # 本地PDF目录：按 dblp key / DOI 查找已下载的文件，下载成功后登记
+        self.catalog = catalog if catalog is not None else PdfCatalog(pdf_dir=self.base_dir)
+
     def get_random_mirror(self):
         """随机选择一个镜像站点"""
         return random.choice(self.scihub_mirrors)
 
     def get_real_pdf_url(self, html_content, base_url):
         """从Sci-Hub页面提取真实的PDF下载链接"""
+        # 只在真正下载时才需要 bs4
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html_content, 'html.parser')
         
         # 尝试多种可能的PDF链接位置
@@ -78,19 +84,15 @@ class SciHubDownloader:
             return False
 
         # 创建会议特定的目录
-        conf_dir = os.path.join(self.base_dir, paper_info['conference'], str(paper_info['year']))
+        filepath = pdf_path(paper_info, self.base_dir)
+        conf_dir = os.path.dirname(filepath)
         if not os.path.exists(conf_dir):
             os.makedirs(conf_dir)
 
-        # 构建文件名：标题_作者.pdf
-        first_author = paper_info['authors'][0]['name'] if paper_info['authors'] else 'Unknown'
-        safe_title = "".join(x for x in paper_info['title'][:50] if x.isalnum() or x in (' ', '-', '_'))
-        filename = f"{safe_title}_{first_author}.pdf".replace(' ', '_')
-        filepath = os.path.join(conf_dir, filename)
-
-        # 如果文件已存在，跳过
-        if os.path.exists(filepath):
-            print(f"文件已存在: {filepath}")
+        # 目录中已有有效的PDF时跳过；不完整的文件会被重新下载
+        existing = self.catalog.lookup(paper_info)
+        if existing:
+            print(f"文件已存在: {existing}")
             return True
 
         # 尝试从不同镜像下载
@@ -124,6 +126,7 @@ class SciHubDownloader:
                 # 保存PDF
                 with open(filepath, 'wb') as f:
                     f.write(pdf_response.content)
+                self.catalog.add(filepath, paper_info)
                 
                 print(f"成功下载: {filepath}")
                 return True
@@ -138,14 +141,15 @@ class SciHubDownloader:
         
         return False
 
+# 下载PDF只需要这几列
+DOWNLOAD_COLUMNS = ['conference', 'year', 'title', 'authors', 'doi', 'ee', 'key']
+
 def load_papers(jsonl_file):
-    """加载论文信息"""
+    """加载论文信息；jsonl_file 也可以是 parse_papers.py --columnar 生成的列式存储目录"""
     papers = []
-    with open(jsonl_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            paper = json.loads(line.strip())
-            if paper.get('doi') or paper.get('ee'):  # 确保有DOI或其他链接
-                papers.append(paper)
+    for paper in iter_paper_records(jsonl_file, DOWNLOAD_COLUMNS):
+        if paper.get('doi') or paper.get('ee'):  # 确保有DOI或其他链接
+            papers.append(paper)
     return papers
 
 def main():
@@ -157,8 +161,12 @@ def main():
     papers = load_papers(input_file)
     print(f"找到 {len(papers)} 篇论文")
     
+    # 扫描已下载的PDF，更新本地目录
+    catalog, stats = update_catalog(papers_input=input_file)
+    print(f"本地已有 {stats['files']} 个PDF")
+
     # 初始化下载器
-    downloader = SciHubDownloader()
+    downloader = SciHubDownloader(catalog)
     
     # 统计
     success_count = 0
@@ -183,6 +191,7 @@ def main():
                 delay = random.uniform(5, 8)
                 print(f"下载失败，等待 {delay:.1f} 秒后继续...")
                 time.sleep(delay)
+    catalog.save()
     
     # 打印统计信息
     print(f"\n下载完成！")
@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import time
+import argparse
+import multiprocessing
+
+from parse_papers import iter_paper_records
+from pdf_catalog import PDF_DIR, PDF_CATALOG_FILE, MATCH_COLUMNS, update_catalog, is_valid
+
+# 按PDF内容哈希缓存的抽取结果（追加写入的 JSONL）
+TEXT_CACHE_FILE = "pdf_text_cache.jsonl"
+# 输出的全文文本流
+FULLTEXT_FILE = "pdf_texts.jsonl"
+# 抽取逻辑变化时加一，旧缓存自动失效
+EXTRACTOR_VERSION = 1
+# 摘要一般在第一页，偶尔跨到第二页
+MAX_PAGES = 2
+# 首页文本最多保留的字符数
+MAX_FIRST_PAGE = 4000
+
+ABSTRACT_RE = re.compile(
+    r'\babstract\b[\s.:—-]*(.+?)'
+    r'(?=\n\s*(?:(?:1|I)\.?\s*introduction\b|introduction\b|keywords\b|index terms\b|ccs concepts\b|'
+    r'categories and subject descriptors\b|pvldb reference format\b)|\Z)',
+    re.IGNORECASE | re.DOTALL)
+
+
+def clean_text(text):
+    """合并断行和多余空白；去掉行尾连字符断词"""
+    text = re.sub(r'-\n(?=[a-z])', '', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def extract_abstract(text):
+    match = ABSTRACT_RE.search(text)
+    return clean_text(match.group(1)) if match else ''
+
+
+def extract_pdf(path, max_pages=MAX_PAGES):
+    """
+    读取前 max_pages 页的文本，返回总页数、实际读取页数、摘要和首页文本；损坏的文件返回 error。
+    读文件出错或内存不足与文件内容无关，另外标记 transient，不写入缓存。
+    """
+    from pypdf import PdfReader
+
+    try:
+        reader = PdfReader(path)
+        pages = reader.pages
+        texts = [pages[i].extract_text() or '' for i in range(min(max_pages, len(pages)))]
+    except (OSError, MemoryError) as e:
+        return {'pages': 0, 'pages_read': 0, 'error': f"{type(e).__name__}: {e}", 'transient': True}
+    except Exception as e:
+        return {'pages': 0, 'pages_read': 0, 'error': f"{type(e).__name__}: {e}"}
+    return {
+        'pages': len(pages),
+        'pages_read': len(texts),
+        'abstract': extract_abstract('\n'.join(texts)),
+        'first_page': clean_text(texts[0])[:MAX_FIRST_PAGE] if texts else '',
+    }
+
+
+class TextCache:
+    """内容哈希 -> 抽取结果；文件内容不变就不会重新抽取"""
+
+    def __init__(self, path=TEXT_CACHE_FILE):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get('version') == EXTRACTOR_VERSION:
+                        self.entries[entry['sha256']] = entry['result']
+
+    def __contains__(self, sha):
+        return sha in self.entries
+
+    def get(self, sha):
+        return self.entries.get(sha)
+
+    def add(self, sha, result, f):
+        self.entries[sha] = result
+        f.write(json.dumps({'sha256': sha, 'version': EXTRACTOR_VERSION, 'result': result},
+                           ensure_ascii=False) + '\n')
+
+
+# 子进程中读取的页数，由 _init_worker 设置
+_worker_max_pages = MAX_PAGES
+
+
+def _init_worker(max_pages):
+    global _worker_max_pages
+    _worker_max_pages = max_pages
+
+
+def _process_pdf(args):
+    sha, path = args
+    return sha, extract_pdf(path, _worker_max_pages)
+
+
+def iter_fulltext(papers_input="papers.jsonl", pdf_dir=PDF_DIR, cache_file=TEXT_CACHE_FILE,
+                  workers=None, max_pages=MAX_PAGES, stats=None, catalog_file=PDF_CATALOG_FILE,
+                  retry_failed=False):
+    """
+    全文文本流：先增量更新本地PDF目录（文件哈希、有效性、对应的论文），
+    缓存未命中的PDF交给进程池并行抽取（内容相同的文件只抽取一次），
+    逐条产生 {key, embedding_key, path, sha256, pages, abstract, first_page}。
+    缓存中记录为失败的文件默认不再抽取，retry_failed 为 True 时重新抽取（例如升级 pypdf 之后）。
+    stats 为字典时写入文件数、缓存命中、抽取页数、用时等统计。
+    """
+    stats = {} if stats is None else stats
+    stats.update(files=0, unmatched=0, cached=0, extracted=0, failed=0, pages_read=0, seconds=0.0)
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    catalog, _ = update_catalog(pdf_dir, catalog_file, papers_input, workers)
+    papers = {paper['key']: paper for paper in iter_paper_records(papers_input, MATCH_COLUMNS) if paper.get('key')}
+    cache = TextCache(cache_file)
+
+    def record(path, entry, result):
+        paper = papers[entry['key']]
+        return {
+            'key': paper['key'],
+            'embedding_key': paper.get('doi', '') or paper.get('url', ''),
+            'path': path,
+            'sha256': entry['sha256'],
+            'pages': result['pages'],
+            'abstract': result['abstract'],
+            'first_page': result['first_page'],
+        }
+
+    pending = {}
+    for path, entry in sorted(catalog.files.items()):
+        stats['files'] += 1
+        if entry.get('key') not in papers:
+            stats['unmatched'] += 1
+        elif not is_valid(entry):
+            # 不是PDF或下载不完整，不必交给 pypdf
+            stats['failed'] += 1
+        elif entry['sha256'] in cache and not (retry_failed and 'error' in cache.get(entry['sha256'])):
+            stats['cached'] += 1
+            result = cache.get(entry['sha256'])
+            if 'error' in result:
+                stats['failed'] += 1
+                continue
+            yield record(path, entry, result)
+        else:
+            pending.setdefault(entry['sha256'], []).append((path, entry))
+    stats['seconds'] = time.perf_counter() - start
+
+    if not pending:
+        return
+    jobs = [(sha, paths[0][0]) for sha, paths in pending.items()]
+    with open(cache_file, 'a', encoding='utf-8') as cache_out, \
+            multiprocessing.Pool(min(workers, len(jobs)), _init_worker, (max_pages,)) as pool:
+        for sha, result in pool.imap_unordered(_process_pdf, jobs, chunksize=4):
+            if not result.get('transient'):
+                cache.add(sha, result, cache_out)
+            stats['extracted'] += 1
+            stats['pages_read'] += result['pages_read']
+            stats['seconds'] = time.perf_counter() - start
+            if 'error' in result:
+                stats['failed'] += len(pending[sha])
+                continue
+            for path, entry in pending[sha]:
+                yield record(path, entry, result)
+    stats['seconds'] = time.perf_counter() - start
+
+
+def load_fulltext(path=FULLTEXT_FILE):
+    """嵌入主键 -> 补充文本：优先用摘要，没有摘要时用首页文本"""
+    texts = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            text = record.get('abstract') or record.get('first_page')
+            if record.get('embedding_key') and text:
+                texts[record['embedding_key']] = text
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从本地 PDF_PAPERS 并行抽取摘要和首页文本，按内容哈希缓存")
+    parser.add_argument('--input', default="papers.jsonl", help="papers.jsonl 或列式存储目录")
+    parser.add_argument('--pdf-dir', default=PDF_DIR)
+    parser.add_argument('-o', '--output', default=FULLTEXT_FILE, help="输出的全文文本流（JSONL）")
+    parser.add_argument('--cache', default=TEXT_CACHE_FILE, help="抽取结果缓存")
+    parser.add_argument('--catalog', default=PDF_CATALOG_FILE, help="本地PDF目录文件")
+    parser.add_argument('--workers', type=int, help="并行进程数，默认为CPU核数")
+    parser.add_argument('--max-pages', type=int, default=MAX_PAGES, help="每个PDF最多读取的页数")
+    parser.add_argument('--retry-failed', action='store_true', help="缓存中抽取失败的文件也重新抽取")
+    args = parser.parse_args()
+
+    stats = {}
+    count = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for record in iter_fulltext(args.input, args.pdf_dir, args.cache, args.workers, args.max_pages, stats,
+                                    args.catalog, args.retry_failed):
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+
+    seconds = stats['seconds'] or 1e-9
+    print(f"PDF文件 {stats['files']} 个（{stats['unmatched']} 个无法对应到论文记录）")
+    print(f"缓存命中 {stats['cached']} 个，新抽取 {stats['extracted']} 个，失败 {stats['failed']} 个")
+    print(f"抽取 {stats['pages_read']} 页，用时 {seconds:.1f} 秒，{stats['pages_read'] / seconds:.1f} 页/秒")
+    print(f"已写入 {count} 条到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import time
+import argparse
+
+import numpy as np
+
+from embedding_store import EmbeddingWriter, open_embeddings, quant_path, keys_path
+from search_papers import EMBEDDINGS_FILE, BLOCK_SIZE, normalize_rows, top_k, rerank_exact
+
+# int8 编码范围，对称取 [-127, 127]
+QMAX = 127
+
+
+def default_output(path):
+    """paper_embeddings.bin -> paper_embeddings.q8.bin"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.q8{ext or '.bin'}"
+
+
+def _normalized_blocks(store, block_size=BLOCK_SIZE):
+    """按块读出归一化后的 float32 向量"""
+    for start in range(0, len(store), block_size):
+        block = np.asarray(store.matrix[start:start + block_size], dtype=np.float32)
+        yield block if store.normalized else normalize_rows(block)
+
+
+def fit_quantizer(store, block_size=BLOCK_SIZE):
+    """逐维统计最小/最大值，得到 scale 和 offset：x ≈ code * scale + offset"""
+    low = np.full(store.dim, np.inf, dtype=np.float32)
+    high = np.full(store.dim, -np.inf, dtype=np.float32)
+    for block in _normalized_blocks(store, block_size):
+        low = np.minimum(low, block.min(axis=0))
+        high = np.maximum(high, block.max(axis=0))
+    scale = (high - low) / (2 * QMAX)
+    scale[scale == 0] = 1
+    offset = (high + low) / 2
+    return scale.astype(np.float32), offset.astype(np.float32)
+
+
+def quantize(vectors, scale, offset):
+    return np.clip(np.rint((vectors - offset) / scale), -QMAX, QMAX).astype(np.int8)
+
+
+def quantize_store(source, output, block_size=BLOCK_SIZE):
+    """
+    把嵌入存储量化为 int8 存储（体积约为 float32 的 1/4）。
+    向量先做L2归一化，量化存储与原存储行顺序、主键完全一致，可以用原存储精确重排。
+    """
+    store = open_embeddings(source)
+    if store.scale is not None:
+        raise ValueError(f"{source} 已经是量化存储")
+    scale, offset = fit_quantizer(store, block_size)
+    # scale/offset 与矩阵一起原子替换，不会出现新矩阵配旧参数
+    with EmbeddingWriter(output, store.model_name, store.dim, 'int8', normalized=True,
+                         quantizer=(scale, offset)) as writer:
+        start = 0
+        for block in _normalized_blocks(store, block_size):
+            writer.write(store.keys[start:start + len(block)], quantize(block, scale, offset))
+            start += len(block)
+    return len(store)
+
+
+def file_size(path):
+    return sum(os.path.getsize(p) for p in (path, keys_path(path), quant_path(path)) if os.path.exists(p))
+
+
+def evaluate(source, quantized, queries=1000, k=10, rerank=100, seed=0):
+    """
+    对比全精度与 int8 存储：文件大小、矩阵内存，以及 recall@k（不重排 / 全精度重排前 rerank 个候选）。
+    查询为随机抽取的已存储向量。
+    """
+    full = open_embeddings(source)
+    quant = open_embeddings(quantized)
+    if full.keys != quant.keys:
+        raise ValueError(f"{source} 与 {quantized} 的主键不一致")
+
+    print(f"{'':<10}{'文件大小':>14}{'矩阵内存':>14}")
+    for name, path, store in (('全精度', source, full), ('int8', quantized, quant)):
+        print(f"{name:<10}{file_size(path) / 2 ** 20:>12.1f}MB{store.matrix.nbytes / 2 ** 20:>12.1f}MB")
+    print(f"矩阵内存节省 {1 - quant.matrix.nbytes / full.matrix.nbytes:.1%}")
+
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(full), min(queries, len(full)), replace=False))
+    vectors = full.vectors(rows)
+    if not full.normalized:
+        vectors = normalize_rows(vectors)
+
+    start = time.perf_counter()
+    _, expected = top_k(full.matrix, vectors, k, normalized=full.normalized)
+    full_ms = (time.perf_counter() - start) * 1000 / len(rows)
+
+    start = time.perf_counter()
+    _, approx = top_k(quant.matrix, vectors, k, scale=quant.scale, offset=quant.offset)
+    quant_ms = (time.perf_counter() - start) * 1000 / len(rows)
+
+    start = time.perf_counter()
+    _, candidates = top_k(quant.matrix, vectors, max(k, rerank), scale=quant.scale, offset=quant.offset)
+    _, reranked = rerank_exact(full, vectors, candidates, k)
+    rerank_ms = (time.perf_counter() - start) * 1000 / len(rows)
+
+    def recall(hits):
+        return sum(len(np.intersect1d(h, e)) for h, e in zip(hits, expected)) / expected.size
+
+    print(f"{len(rows)} 条查询")
+    print(f"{'检索方式':<20}{f'recall@{k}':>12}{'ms/条':>10}")
+    print(f"{'全精度':<20}{1:>12.4f}{full_ms:>10.3f}")
+    print(f"{'int8':<20}{recall(approx):>12.4f}{quant_ms:>10.3f}")
+    print(f"{f'int8 + 重排 {rerank}':<20}{recall(reranked):>12.4f}{rerank_ms:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把嵌入存储量化为 int8（逐维缩放/偏移），并评测内存与召回")
+    parser.add_argument('--embeddings', default=EMBEDDINGS_FILE, help="全精度嵌入存储文件")
+    parser.add_argument('--output', help="量化存储文件，默认 paper_embeddings.q8.bin")
+    parser.add_argument('--eval', action='store_true', help="量化后对比内存与 recall@k")
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--rerank', type=int, default=100, help="全精度重排的候选数")
+    args = parser.parse_args()
+
+    output = args.output or default_output(args.embeddings)
+    count = quantize_store(args.embeddings, output)
+    print(f"已量化 {count} 条向量到: {output}")
+    if args.eval:
+        evaluate(args.embeddings, output, args.queries, args.k, args.rerank)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,519 @@
+import os
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import instrumentation
+from instrumentation import metrics
+from parse_papers import (PARSER_VERSION, SHARD_DIR, iter_paper_records, find_xml_files, file_sha256,
+                          load_shard_manifest, save_shard_manifest, shard_is_fresh, store_shard,
+                          remove_stale_sources, serialize_xml_file, combine_shards, combined_is_fresh)
+from dblp_fetcher import DBLP_API_URL, DblpFetcher, FetchManifest, VENUE_MODULES, MANIFEST_FILE, load_venue, UNCHANGED, FROZEN
+from dblp_fetcher import FAILED as FETCH_FAILED
+from generate_embeddings import paper_texts, iter_paper_texts, stream_embeddings
+from embedding_cache import CACHE_DIR
+
+# 记录每个任务上次运行时输入文件和参数的状态文件
+STATE_FILE = "pipeline_state.json"
+STATE_VERSION = 1
+
+# 任务结果
+RAN = 'ran'          # 执行了，输出已更新
+FRESH = 'fresh'      # 输入和参数都没变（或执行后发现没有变化），输出沿用
+STALE = 'stale'      # 只在 --dry-run 时出现：需要执行
+FAILED = 'failed'
+BLOCKED = 'blocked'  # 上游任务失败，没有执行
+
+# 解析之后可选的下游产物
+EXTRA_STAGES = ('columnar', 'bm25', 'graph')
+
+
+class Task:
+    """
+    DAG 中的一个任务。deps 为前置任务名；inputs/outputs 为文件或目录路径。
+    默认按状态文件中记录的输入（大小、修改时间、sha256）和参数判断是否需要执行；
+    fresh 不为空时改用它判断。action 返回 False 表示执行后发现输出没有变化。
+    """
+
+    def __init__(self, name, action, kind, deps=(), inputs=(), outputs=(), params=None, fresh=None,
+                 force=False, on_done=None):
+        self.name = name
+        self.action = action
+        self.kind = kind
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.fresh = fresh
+        self.force = force
+        self.on_done = on_done
+
+
+def stat_entry(path, old=None):
+    """输入文件的状态；大小和修改时间都没变时沿用旧的哈希"""
+    stat = os.stat(path)
+    if old and old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+        return dict(old)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+
+
+class Pipeline:
+    """按依赖关系调度任务：前置任务都完成的任务立即放进线程池，彼此独立的任务并发执行"""
+
+    def __init__(self, state_file=STATE_FILE, jobs=4):
+        self.state_file = state_file
+        self.jobs = jobs
+        self.tasks = {}
+        self.status = {}
+        self.seconds = {}
+        self.lock = threading.Lock()
+        self.state = {'version': STATE_VERSION, 'tasks': {}}
+        if os.path.exists(state_file):
+            with open(state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == STATE_VERSION:
+                self.state = state
+
+    def add(self, task):
+        self.tasks[task.name] = task
+        return task
+
+    def save_state(self):
+        with self.lock:
+            tmp_file = self.state_file + '.part'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_file, self.state_file)
+
+    def stamp_matches(self, task):
+        """make 式判断：输出都存在，参数相同，输入文件集合相同且每个文件大小和修改时间（或内容哈希）未变"""
+        if not all(os.path.exists(path) for path in task.outputs):
+            return False
+        with self.lock:
+            record = self.state['tasks'].get(task.name)
+        if record is None or record['params'] != task.params or sorted(record['inputs']) != sorted(task.inputs):
+            return False
+        for path in task.inputs:
+            if not os.path.exists(path):
+                return False
+            old = record['inputs'][path]
+            stat = os.stat(path)
+            if old['size'] == stat.st_size and old['mtime_ns'] == stat.st_mtime_ns:
+                continue
+            if old['size'] != stat.st_size or old['sha256'] != file_sha256(path):
+                return False
+            # 只是修改时间变了，内容没变
+            old['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def record_stamp(self, task):
+        with self.lock:
+            old = self.state['tasks'].get(task.name, {}).get('inputs', {})
+        inputs = {path: stat_entry(path, old.get(path)) for path in task.inputs}
+        with self.lock:
+            self.state['tasks'][task.name] = {
+                'params': task.params,
+                'inputs': inputs,
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+            }
+
+    def is_stale(self, task):
+        if task.force:
+            return True
+        if task.fresh is not None:
+            return not task.fresh()
+        return not self.stamp_matches(task)
+
+    def _execute(self, task, dry_run):
+        start = time.perf_counter()
+        try:
+            if dry_run:
+                # 上游需要执行时下游一定也要执行，不必再检查
+                if any(self.status.get(dep) == STALE for dep in task.deps) or self.is_stale(task):
+                    return STALE
+                return FRESH
+            if not self.is_stale(task):
+                return FRESH
+            with metrics.stage(task.kind):
+                changed = task.action()
+            if task.fresh is None:
+                self.record_stamp(task)
+            return FRESH if changed is False else RAN
+        finally:
+            self.seconds[task.name] = time.perf_counter() - start
+
+    def _finish(self, name, status, waiting, dependents):
+        self.status[name] = status
+        metrics.count(f'tasks_{status}')
+        task = self.tasks[name]
+        if task.on_done is not None:
+            task.on_done(status)
+        if status == FAILED or status == BLOCKED:
+            # 下游任务全部标记为受阻
+            for dependent in dependents[name]:
+                if dependent in waiting:
+                    del waiting[dependent]
+                    self._finish(dependent, BLOCKED, waiting, dependents)
+            return
+        for dependent in dependents[name]:
+            if dependent in waiting:
+                waiting[dependent].discard(name)
+
+    def run(self, dry_run=False):
+        """执行全部任务，返回 任务名 -> 结果"""
+        waiting = {name: set(task.deps) for name, task in self.tasks.items()}
+        dependents = defaultdict(list)
+        for name, task in self.tasks.items():
+            for dep in task.deps:
+                dependents[dep].append(name)
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            def launch_ready():
+                # 同时提交的任务不超过 jobs 个；有前置任务的（下游）优先，
+                # 已下载的文件先解析，而不是排在所有下载请求之后
+                ready = [name for name, deps in waiting.items() if not deps]
+                ready.sort(key=lambda name: not self.tasks[name].deps)
+                for name in ready[:self.jobs - len(running)]:
+                    del waiting[name]
+                    running[executor.submit(self._execute, self.tasks[name], dry_run)] = name
+
+            launch_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status = future.result()
+                    except Exception as e:
+                        print(f"任务失败 {name}: {type(e).__name__}: {e}")
+                        status = FAILED
+                    self._finish(name, status, waiting, dependents)
+                launch_ready()
+
+        if not dry_run:
+            self.save_state()
+        return self.status
+
+
+class RecordStream:
+    """
+    --stream 时解析与嵌入之间的内存管道：解析结果可以按完成顺序乱序到达，
+    消费者按源文件顺序逐个等待，产生与 papers.jsonl 相同顺序的论文记录。
+    """
+
+    def __init__(self, xml_files):
+        self.xml_files = list(xml_files)
+        self.items = {}
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, xml_file, value):
+        """value 为 ('text', JSONL文本)、('shard', 未变化的分片路径)，或 None 表示上游失败"""
+        with self.condition:
+            if self.closed:
+                return
+            self.items[xml_file] = value
+            self.condition.notify_all()
+
+    def close(self):
+        """消费者结束（或无需执行）后丢弃之后到达的结果，不再占用内存"""
+        with self.condition:
+            self.closed = True
+            self.items.clear()
+
+    def __iter__(self):
+        for xml_file in self.xml_files:
+            with self.condition:
+                self.condition.wait_for(lambda: xml_file in self.items)
+                value = self.items.pop(xml_file)
+            if value is None:
+                raise RuntimeError(f"{xml_file} 下载或解析失败")
+            kind, payload = value
+            if kind == 'text':
+                lines = payload.splitlines()
+            else:
+                with open(payload, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+            for line in lines:
+                yield json.loads(line)
+
+
+def build_columnar(papers_input, path):
+    from paper_store import write_paper_store
+    return write_paper_store(iter_paper_records(papers_input), path)
+
+
+def build_bm25(papers_input, path):
+    from bm25_index import INDEX_COLUMNS, build_index
+    return build_index(iter_paper_records(papers_input, INDEX_COLUMNS), path)
+
+
+def build_coauthor_graph(papers_input, path):
+    from coauthor_graph import GRAPH_COLUMNS, build_graph
+    return build_graph(iter_paper_records(papers_input, GRAPH_COLUMNS), path)
+
+
+# 下游产物：名称 -> (构建函数, 默认输出目录)
+EXTRA_BUILDERS = {
+    'columnar': (build_columnar, "papers_columns"),
+    'bm25': (build_bm25, "titles.bm25"),
+    'graph': (build_coauthor_graph, "coauthor_graph"),
+}
+
+
+class PipelineRun:
+    """把命令行参数展开成具体任务，并持有各任务共享的下载器、进程池、分片清单和内存管道"""
+
+    def __init__(self, args):
+        self.args = args
+        self.fetcher = None
+        self.pool = None
+        self.manifest = load_shard_manifest(SHARD_DIR)
+        self.manifest_lock = threading.Lock()
+        # 解析任务判断新鲜度时得到的 (stat, 哈希)，执行时复用
+        self.parse_inputs = {}
+        self.stream = None
+
+    def download_targets(self):
+        """(会议定义, 年份, XML路径)"""
+        if self.args.no_download:
+            return []
+        targets = []
+        for name in self.args.venues:
+            venue = load_venue(name)
+            for year in range(max(self.args.start, venue.first_year), self.args.end + 1):
+                targets.append((venue, year, venue.output_path(year)))
+        return targets
+
+    def build(self, pipeline):
+        args = self.args
+        targets = self.download_targets()
+        xml_files = sorted(set(find_xml_files()) | set(path for _, _, path in targets))
+        if args.stream and 'embed' in args.stages:
+            self.stream = RecordStream(xml_files)
+            # 不等 papers.jsonl：与下载、解析同时开始，按源文件顺序从内存管道取记录。
+            # 先于解析任务加入，保证第一批就被调度
+            pipeline.add(Task('embed', self._embed_action(), 'embed', inputs=xml_files,
+                              outputs=self._embed_outputs(), params=self._embed_params(), force=args.refresh,
+                              on_done=lambda status: self.stream.close()))
+
+        downloads = {}
+        for venue, year, path in targets:
+            task = pipeline.add(Task(f"download:{path}", self._download_action(venue, year), 'download',
+                                     outputs=[path], fresh=self._download_fresh(path)))
+            downloads[path] = task.name
+
+        parse_tasks = []
+        for xml_file in xml_files:
+            deps = [downloads[xml_file]] if xml_file in downloads else []
+            task = pipeline.add(Task(f"parse:{xml_file}", self._parse_action(xml_file), 'parse', deps=deps,
+                                     fresh=self._parse_fresh(xml_file), on_done=self._parse_done(xml_file)))
+            parse_tasks.append(task.name)
+
+        pipeline.add(Task('combine', self._combine_action(xml_files), 'combine', deps=parse_tasks,
+                          outputs=[args.output], fresh=self._combine_fresh(xml_files)))
+
+        if 'embed' in args.stages and self.stream is None:
+            pipeline.add(Task('embed', self._embed_action(), 'embed', deps=['combine'], inputs=[args.output],
+                              outputs=self._embed_outputs(), params=self._embed_params()))
+
+        for stage in EXTRA_STAGES:
+            if stage in args.stages:
+                builder, path = EXTRA_BUILDERS[stage]
+                pipeline.add(Task(stage, self._extra_action(builder, path), stage, deps=['combine'],
+                                  inputs=[args.output], outputs=[path], params={'parser_version': PARSER_VERSION}))
+
+    def _embed_params(self):
+        args = self.args
+        return {'model': args.model, 'dtype': args.dtype, 'normalize': args.normalize,
+                'fulltext': args.fulltext, 'parser_version': PARSER_VERSION}
+
+    def _embed_outputs(self):
+        return [self.args.embeddings, self.args.embeddings + '.keys']
+
+    def _download_fresh(self, path):
+        # 已经下载过的文件只在 --refresh 时重新检查（由下载清单发条件请求）
+        return lambda: os.path.exists(path) and not self.args.refresh
+
+    def _download_action(self, venue, year):
+        def action():
+            status = self.fetcher.download_year(venue, year)
+            if status == FETCH_FAILED:
+                raise RuntimeError(f"下载失败 {venue.name} {year}")
+            return status not in (UNCHANGED, FROZEN)
+        return action
+
+    def _parse_fresh(self, xml_file):
+        def fresh():
+            stat = os.stat(xml_file)
+            with self.manifest_lock:
+                entry = self.manifest['sources'].get(xml_file)
+            is_fresh, sha = shard_is_fresh(entry, xml_file, stat)
+            self.parse_inputs[xml_file] = (stat, sha)
+            return is_fresh
+        return fresh
+
+    def _parse_action(self, xml_file):
+        def action():
+            stat, sha = self.parse_inputs.pop(xml_file)
+            text, count, messages = self.pool.apply(serialize_xml_file, (xml_file,))
+            print(f"已解析 {xml_file}: {count} 篇论文")
+            for message in messages:
+                print(message)
+            with self.manifest_lock:
+                store_shard(self.manifest['sources'], xml_file, sha or file_sha256(xml_file), stat, text, count)
+                self.manifest['combined'] = None
+            if self.stream is not None:
+                self.stream.put(xml_file, ('text', text))
+        return action
+
+    def _parse_done(self, xml_file):
+        def done(status):
+            if self.stream is None or status == RAN:
+                return
+            if status == FRESH:
+                with self.manifest_lock:
+                    shard = self.manifest['sources'][xml_file]['shard']
+                self.stream.put(xml_file, ('shard', shard))
+            else:
+                self.stream.put(xml_file, None)
+        return done
+
+    def _combine_fresh(self, xml_files):
+        # 有解析任务执行过时 combined 已被清空；--dry-run 时上游待执行的情况由调度器处理
+        def fresh():
+            with self.manifest_lock:
+                return (set(self.manifest['sources']) == set(xml_files)
+                        and combined_is_fresh(self.manifest, self.args.output))
+        return fresh
+
+    def _combine_action(self, xml_files):
+        def action():
+            with self.manifest_lock:
+                remove_stale_sources(self.manifest, xml_files)
+                changed = combine_shards(self.manifest, self.args.output)
+                save_shard_manifest(self.manifest)
+            total = sum(entry['papers'] for entry in self.manifest['sources'].values())
+            if changed:
+                print(f"已合并 {len(xml_files)} 个分片到 {self.args.output}（{total} 篇论文）")
+            return changed
+        return action
+
+    def _embed_action(self):
+        def action():
+            args = self.args
+            fulltext = None
+            if args.fulltext:
+                from pdf_text import load_fulltext
+                fulltext = load_fulltext(args.fulltext)
+            if self.stream is not None:
+                items = paper_texts(self.stream, fulltext)
+            else:
+                items = iter_paper_texts(args.output, fulltext)
+            cache_dir = None if args.no_cache else args.cache_dir
+            written, cached = stream_embeddings(items, args.embeddings, args.model, args.batch_size, args.normalize,
+                                                args.embed_workers, args.chunk_size, args.dtype, cache_dir,
+                                                args.max_tokens)
+            print(f"生成了 {written} 个嵌入（缓存命中 {cached} 篇），保存到: {args.embeddings}")
+        return action
+
+    def _extra_action(self, builder, path):
+        def action():
+            # 在进程池里构建，几个下游产物可以真正并行
+            self.pool.apply(builder, (self.args.output, path))
+            print(f"已生成: {path}")
+        return action
+
+
+def print_summary(pipeline, status):
+    kinds = defaultdict(lambda: defaultdict(int))
+    seconds = defaultdict(float)
+    for name, result in status.items():
+        kind = pipeline.tasks[name].kind
+        kinds[kind][result] += 1
+        seconds[kind] += pipeline.seconds.get(name, 0.0)
+    print(f"\n{'任务':<12}{'执行':>6}{'最新':>6}{'待执行':>8}{'失败':>6}{'受阻':>6}{'累计耗时(s)':>14}")
+    for kind, counts in kinds.items():
+        print(f"{kind:<12}{counts[RAN]:>6}{counts[FRESH]:>6}{counts[STALE]:>8}{counts[FAILED]:>6}"
+              f"{counts[BLOCKED]:>6}{seconds[kind]:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="非交互的流水线：下载 -> 解析 -> papers.jsonl -> 嵌入，只执行输入或参数变化的任务")
+    parser.add_argument('--stages', nargs='+', default=['embed'], choices=['papers', 'embed'] + list(EXTRA_STAGES),
+                        help="需要的产物；papers 只生成 papers.jsonl")
+    parser.add_argument('--venues', nargs='+', choices=sorted(VENUE_MODULES), default=sorted(VENUE_MODULES))
+    parser.add_argument('--start', type=int, default=1975, help="下载的起始年份")
+    parser.add_argument('--end', type=int, default=datetime.now().year, help="下载的结束年份")
+    parser.add_argument('--no-download', action='store_true', help="不联网，只处理本地已有的XML")
+    parser.add_argument('--refresh', action='store_true', help="已下载的年份也向 dblp 发条件请求检查更新")
+    parser.add_argument('--rate', type=float, default=1.0, help="每秒平均请求数")
+    parser.add_argument('--fetch-workers', type=int, default=4, help="并发请求数")
+    parser.add_argument('--base-url', default=DBLP_API_URL, help="dblp 接口地址（可指向本地测试服务）")
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help="下载清单文件")
+    parser.add_argument('--frozen-years', type=int, default=None,
+                        help="早于 今年-N 的年份若本地文件完好则不再请求")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="解析和构建下游产物的进程数")
+    parser.add_argument('--jobs', type=int, default=8, help="同时执行的任务数")
+    parser.add_argument('--stream', action='store_true',
+                        help="解析结果经内存直接交给嵌入，边下载边解析边编码，不等 papers.jsonl")
+    parser.add_argument('--dry-run', action='store_true', help="只列出需要执行的任务")
+    parser.add_argument('--state', default=STATE_FILE, help="任务状态文件")
+    parser.add_argument('-o', '--output', default="papers.jsonl")
+    parser.add_argument('--embeddings', default="paper_embeddings.bin")
+    parser.add_argument('--model', default='all-MiniLM-L6-v2')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--max-tokens', type=int, help="按 token 预算做长度分桶的动态批")
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--normalize', action='store_true')
+    parser.add_argument('--embed-workers', type=int, default=1, help="CPU编码进程数")
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--fulltext', metavar='FILE', help="pdf_text.py 生成的全文文本流")
+    instrumentation.add_arguments(parser)
+    args = parser.parse_args()
+    instrumentation.configure(args, 'run_pipeline')
+
+    run = PipelineRun(args)
+    # 流式嵌入占住一个任务线程，至少还要留一个给下载和解析
+    pipeline = Pipeline(args.state, max(args.jobs, 2))
+    run.build(pipeline)
+    print(f"共 {len(pipeline.tasks)} 个任务")
+
+    if args.dry_run:
+        status = pipeline.run(dry_run=True)
+        for name, result in status.items():
+            if result == STALE:
+                print(f"待执行: {name}")
+        print_summary(pipeline, status)
+        return
+
+    # 先建好进程池再启动任务线程，避免在多线程状态下 fork
+    run.pool = multiprocessing.Pool(args.workers)
+    run.fetcher = DblpFetcher(args.base_url, workers=args.fetch_workers, rate=args.rate,
+                              manifest=FetchManifest(args.manifest), frozen_years=args.frozen_years)
+    try:
+        status = pipeline.run()
+    finally:
+        run.fetcher.manifest.save()
+        run.fetcher.close()
+        run.pool.close()
+        run.pool.join()
+
+    print_summary(pipeline, status)
+    instrumentation.finish(args)
+    failed = [name for name, result in status.items() if result == FAILED]
+    if failed:
+        print(f"\n{len(failed)} 个任务失败: {', '.join(failed[:10])}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import json
+import argparse
+
+import numpy as np
+
+from parse_papers import iter_paper_records
+from embedding_store import open_embeddings
+
+# 默认的嵌入文件和论文数据
+EMBEDDINGS_FILE = "paper_embeddings.bin"
+PAPERS_FILE = "papers.jsonl"
+# 每次从 memmap 读入并打分的行数，float32、384维时约 100MB
+BLOCK_SIZE = 65536
+# 结果展示只需要这几列
+METADATA_COLUMNS = ['conference', 'year', 'title', 'venue', 'doi', 'url', 'key']
+
+
+def normalize_rows(matrix):
+    """L2归一化，零向量保持为零"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def top_k(matrix, queries, k=10, rows=None, block_size=BLOCK_SIZE, normalized=True, scale=None, offset=None):
+    """
+    精确 top-k：把 matrix（可以是 memmap）按块读入，与全部查询做一次矩阵乘法打分，
+    每块用 argpartition 取前 k，最后合并各块候选。
+    queries 为已归一化的 (查询数, 维度) 矩阵；matrix 未归一化时按块归一化，得到余弦相似度。
+    给出 scale/offset 时 matrix 是 int8 编码，做非对称打分：查询保持 float，
+    q·(c*scale + offset) = (q*scale)·c + q·offset，语料块只转换类型、不反量化。
+    rows 为候选行号（过滤后的结果），为空时扫描全部行。
+    返回 (分数, 行号)，形状都是 (查询数, k')，每行按分数降序，k' = min(k, 候选数)。
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    if scale is not None:
+        bias = (queries @ offset)[:, None]
+        queries = queries * scale
+    total = len(matrix) if rows is None else len(rows)
+    k = min(k, total)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    if k == 0:
+        return best_scores, best_rows
+
+    for start in range(0, total, block_size):
+        if rows is None:
+            # 连续切片直接映射文件页，不做额外拷贝
+            block_rows = np.arange(start, min(start + block_size, total))
+            block = matrix[start:start + block_size]
+        else:
+            block_rows = rows[start:start + block_size]
+            block = matrix[block_rows]
+        block = np.asarray(block, dtype=np.float32)
+        if scale is not None:
+            scores = queries @ block.T + bias
+        else:
+            if not normalized:
+                block = normalize_rows(block)
+            scores = queries @ block.T
+
+        # 当前块的前 k 与已有候选合并，再取前 k
+        if scores.shape[1] > k:
+            part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, part, axis=1)
+            block_rows = block_rows[part]
+        else:
+            block_rows = np.broadcast_to(block_rows, scores.shape)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_rows = np.concatenate([best_rows, block_rows], axis=1)
+        if best_scores.shape[1] > k:
+            part = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(best_scores, part, axis=1)
+            best_rows = np.take_along_axis(best_rows, part, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+
+def rerank_exact(store, queries, rows, k=10):
+    """
+    用全精度向量对候选行重新打分，返回前 k 的 (分数, 行号)。
+    rows 为 (查询数, 候选数) 的行号矩阵，-1 表示空位。
+    """
+    out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for qi, (query, candidates) in enumerate(zip(queries, rows)):
+        # 排序后读 memmap 更接近顺序访问
+        candidates = np.unique(candidates[candidates >= 0])
+        vectors = store.vectors(candidates)
+        if not store.normalized:
+            vectors = normalize_rows(vectors)
+        scores = vectors @ query
+        order = np.argsort(-scores, kind='stable')[:k]
+        out_scores[qi, :len(order)] = scores[order]
+        out_rows[qi, :len(order)] = candidates[order]
+    return out_scores, out_rows
+
+
+def load_metadata(papers_input):
+    """嵌入主键（DOI，没有DOI时为URL）-> 论文元数据，与 generate_embeddings.load_papers 的主键规则一致"""
+    papers = {}
+    for paper in iter_paper_records(papers_input, METADATA_COLUMNS):
+        key = paper.get('doi', '') or paper.get('url', '')
+        if key:
+            papers[key] = paper
+    return papers
+
+
+class SemanticSearcher:
+    """在嵌入存储上做精确语义检索：查询用存储文件头里记录的同一个模型编码"""
+
+    def __init__(self, embeddings_file=EMBEDDINGS_FILE, papers_input=PAPERS_FILE, model=None, full_embeddings=None):
+        self.store = open_embeddings(embeddings_file)
+        # 量化存储可以再给出全精度存储，用于对候选精确重排（两者行顺序一致）
+        self.full_store = open_embeddings(full_embeddings) if full_embeddings else None
+        if self.full_store is not None and self.full_store.keys != self.store.keys:
+            raise ValueError(f"{full_embeddings} 与 {embeddings_file} 的主键不一致")
+        self.papers = load_metadata(papers_input)
+        self._model = model
+        # 同一主键写入多次时只保留最后一行参与检索
+        index = self.store.index
+        self.unique_rows = None if len(index) == len(self.store) else np.array(sorted(index.values()), dtype=np.int64)
+        self._row_papers = None
+        self._row_columns = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from generate_embeddings import load_model
+            self._model = load_model(self.store.model_name)
+        return self._model
+
+    @property
+    def row_papers(self):
+        """与矩阵行对齐的论文元数据，没有元数据的行为 None"""
+        if self._row_papers is None:
+            self._row_papers = [self.papers.get(key) for key in self.store.keys]
+        return self._row_papers
+
+    @property
+    def row_columns(self):
+        """
+        与矩阵行对齐的过滤列，只构建一次：(是否有元数据, 会议编码, 会议名 -> 编码, 年份)。
+        之后每次过滤都是整列的向量化比较；缺少会议或年份时编码和年份为 -1。
+        """
+        if self._row_columns is None:
+            count = len(self.store)
+            known = np.zeros(count, dtype=bool)
+            codes = np.full(count, -1, dtype=np.int32)
+            years = np.full(count, -1, dtype=np.int32)
+            conferences = {}
+            for row, paper in enumerate(self.row_papers):
+                if paper is None:
+                    continue
+                known[row] = True
+                if paper.get('conference') is not None:
+                    codes[row] = conferences.setdefault(paper['conference'], len(conferences))
+                if paper.get('year') is not None:
+                    years[row] = int(paper['year'])
+            self._row_columns = (known, codes, conferences, years)
+        return self._row_columns
+
+    def candidate_rows(self, conference=None, years=None):
+        """按会议和年份区间过滤出候选行号；没有过滤条件且没有重复主键时返回 None（扫描全部行）"""
+        if conference is None and years is None:
+            return self.unique_rows
+        known, codes, conferences, year = self.row_columns
+        mask = known.copy()
+        if self.unique_rows is not None:
+            unique = np.zeros(len(mask), dtype=bool)
+            unique[self.unique_rows] = True
+            mask &= unique
+        if conference is not None:
+            mask &= codes == conferences.get(conference, -2)
+        if years is not None:
+            mask &= (year >= years[0]) & (year <= years[1])
+        return np.flatnonzero(mask).astype(np.int64)
+
+    def embed(self, queries):
+        vectors = self.model.encode(list(queries), convert_to_numpy=True, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+    def search(self, queries, k=10, conference=None, years=None, block_size=BLOCK_SIZE, rerank=0):
+        """
+        批量检索，返回每个查询的 [(分数, 主键, 论文元数据), ...]。
+        有全精度存储且 rerank > 0 时，先取前 max(k, rerank) 个候选，再用全精度向量重排。
+        """
+        rows = self.candidate_rows(conference, years)
+        vectors = self.embed(queries)
+        candidates = max(k, rerank) if self.full_store is not None else k
+        scores, hits = top_k(self.store.matrix, vectors, candidates, rows, block_size,
+                             normalized=self.store.normalized, scale=self.store.scale, offset=self.store.offset)
+        if self.full_store is not None and rerank:
+            scores, hits = rerank_exact(self.full_store, vectors, hits, k)
+        keys = self.store.keys
+        return [[(float(score), keys[row], self.row_papers[row])
+                 for score, row in zip(query_scores, query_rows) if row >= 0]
+                for query_scores, query_rows in zip(scores.tolist(), hits.tolist())]
+
+
+def print_results(query, results):
+    print(f"查询: {query}")
+    for rank, (score, key, paper) in enumerate(results, 1):
+        if paper is None:
+            print(f"{rank:>3}. {score:.4f}  {key}（缺少元数据）")
+            continue
+        print(f"{rank:>3}. {score:.4f}  [{paper.get('conference')} {paper.get('year')}] {paper.get('title')}")
+        print(f"       venue: {paper.get('venue') or '-'}  doi: {paper.get('doi') or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="论文语义检索：精确 top-k")
+    parser.add_argument('query', nargs='?', help="查询文本")
+    parser.add_argument('--queries-file', help="批量查询：每行一个查询，全部查询一次矩阵乘法打分")
+    parser.add_argument('--embeddings', default=EMBEDDINGS_FILE, help="嵌入存储文件")
+    parser.add_argument('--input', default=PAPERS_FILE, help="papers.jsonl 或列式存储目录，用于展示元数据")
+    parser.add_argument('-k', type=int, default=10, help="返回的结果数")
+    parser.add_argument('--conference', help="只检索该会议")
+    parser.add_argument('--years', type=int, nargs=2, metavar=('START', 'END'), help="只检索该年份区间")
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help="每块打分的行数")
+    parser.add_argument('--full-embeddings', help="--embeddings 为 int8 量化存储时，用于重排的全精度存储")
+    parser.add_argument('--rerank', type=int, default=100, help="用全精度向量重排的候选数")
+    parser.add_argument('--output', help="把结果写成 JSONL 文件（每行一个查询）而不是打印")
+    args = parser.parse_args()
+
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    elif args.query:
+        queries = [args.query]
+    else:
+        parser.error("需要提供查询文本或 --queries-file")
+
+    searcher = SemanticSearcher(args.embeddings, args.input, full_embeddings=args.full_embeddings)
+    results = searcher.search(queries, args.k, args.conference, tuple(args.years) if args.years else None,
+                              args.block_size, args.rerank)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for query, hits in zip(queries, results):
+                f.write(json.dumps({
+                    'query': query,
+                    'results': [{'score': score, 'embedding_key': key, **(paper or {})} for score, key, paper in hits],
+                }, ensure_ascii=False) + '\n')
+        print(f"{len(queries)} 个查询的结果已保存到: {args.output}")
+        return
+
+    for query, hits in zip(queries, results):
+        print_results(query, hits)
+        print()
+
+
+if __name__ == "__main__":
+    main()
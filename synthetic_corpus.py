@@ -0,0 +1,190 @@
+import os
+import json
+import random
+import argparse
+from xml.sax.saxutils import escape
+
+from parse_papers import parse_filename
+from download_vldb_papers import build_vldb_filename
+
+# 每个会议的目录、文件名前缀、dblp 键前缀和 DOI 前缀，与下载器的输出一致
+CONFERENCES = (
+    ('ICDE', 'ICDE_PAPER', 'icde', '10.1109/ICDE'),
+    ('SIGMOD', 'SIGMOD_PAPER', 'sigmod', '10.1145/SIGMOD'),
+    ('VLDB', 'VLDB_PAPER', 'vldb', '10.14778/VLDB'),
+)
+FIRST_YEAR = 1975
+LAST_YEAR = 2024
+# 每年论文数的增长率：近年的文件远大于早年
+YEAR_GROWTH = 1.06
+
+FIRST_NAMES = ('Michael', 'Jennifer', 'Wei', 'Li', 'Hector', 'Anastasia', 'Surajit', 'Divesh', 'Joseph',
+               'Magdalena', 'Samuel', 'Jignesh', 'Raghu', 'Beng Chin', 'Xin Luna', 'Jiawei', 'Gerhard',
+               'Renée', 'Guy', 'Daniel', 'Thomas', 'Yannis', 'Christos', 'Alon', 'Laura', 'Stratos', 'Tim',
+               'Viktor', 'Carsten', 'Felix', 'Jürgen', 'Zhifeng', 'Yufei', 'Haixun', 'Jeffrey', 'Arvind')
+LAST_NAMES = ('Stonebraker', 'Widom', 'Wang', 'Li', 'Garcia-Molina', 'Ailamaki', 'Chaudhuri', 'Srivastava',
+              'Hellerstein', 'Balazinska', 'Madden', 'Patel', 'Ramakrishnan', 'Ooi', 'Dong', 'Han', 'Weikum',
+              'Miller', 'Lohman', 'Abadi', 'Neumann', 'Ioannidis', 'Faloutsos', 'Halevy', 'Haas', 'Idreos',
+              'Kraska', 'Leis', 'Binnig', 'Naumann', 'Müller', 'Bao', 'Tao', 'Zhou', 'Naughton', 'Arasu')
+# 标题词表：高频的领域词 + 由音节拼出的长尾词
+TOPIC_WORDS = ('Query', 'Optimization', 'Efficient', 'Data', 'Database', 'Processing', 'Scalable', 'Index',
+               'Transactions', 'Distributed', 'Learning', 'Graph', 'Streams', 'Approximate', 'Join', 'Systems',
+               'Storage', 'Cloud', 'Parallel', 'Adaptive', 'Towards', 'Framework', 'Management', 'Analysis',
+               'Main-Memory', 'Concurrency', 'Control', 'Cardinality', 'Estimation', 'Learned', 'Similarity',
+               'Search', 'Spatial', 'Temporal', 'Privacy', 'Cleaning', 'Integration', 'Provenance', 'XML',
+               'Relational', 'Columnar', 'Compression', 'Benchmark', 'Workload', 'Caching', 'GPU', 'Vector')
+CONNECTIVES = ('for', 'of', 'in', 'with', 'on', 'and', 'over', 'via', 'using')
+SYLLABLES = ('ka', 'ro', 'mi', 'te', 'su', 'na', 'vel', 'tor', 'plex', 'ion', 'dex', 'gra', 'lin', 'qua')
+
+
+def source_filename(conference, year):
+    """与下载器相同的文件名：VLDB 2008年起带卷号"""
+    name, _, prefix, _ = conference
+    return build_vldb_filename(year) if name == 'VLDB' else f"{prefix}_{year}.xml"
+
+
+class CorpusGenerator:
+    """
+    按 dblp 检索接口的结构（hits/hit/info/authors/author）生成可复现的合成语料。
+    作者和标题词都按幂律分布抽取：少数高产作者、常见术语反复出现，与真实语料的重复和倾斜程度相近。
+    """
+
+    def __init__(self, papers, seed=0):
+        self.papers = papers
+        self.rng = random.Random(seed)
+        # 作者池大小约为论文数的 1/3，按编号从小到大越来越少见
+        self.author_pool = max(10, papers // 3)
+        self.tail_words = [self._word(i) for i in range(2000)]
+        self.next_id = 7600000
+
+    def _word(self, i):
+        rng = random.Random(i)
+        return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+    def _skewed(self, size, power=3):
+        return int(size * self.rng.random() ** power)
+
+    def author(self):
+        i = self._skewed(self.author_pool)
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last = LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        name = f"{first} {last}"
+        # dblp 用四位编号区分同名作者
+        homonym = i // (len(FIRST_NAMES) * len(LAST_NAMES))
+        if homonym:
+            name += f" {homonym:04d}"
+        return {'name': name, 'pid': f"{i % 100}/{i}"}
+
+    def title(self):
+        words = []
+        for _ in range(self.rng.randint(3, 12)):
+            if words and self.rng.random() < 0.2:
+                words.append(self.rng.choice(CONNECTIVES))
+            elif self.rng.random() < 0.7:
+                words.append(TOPIC_WORDS[self._skewed(len(TOPIC_WORDS), 2)])
+            else:
+                words.append(self.tail_words[self._skewed(len(self.tail_words), 2)])
+        title = ' '.join(words)
+        if self.rng.random() < 0.3:
+            title += ': ' + ' '.join(self.rng.choice(TOPIC_WORDS) for _ in range(self.rng.randint(2, 5)))
+        if self.rng.random() < 0.02:
+            # 少量需要转义的字符
+            title = title.replace(' and ', ' & ', 1) + ' <Extended>'
+        return title + '.'
+
+    def file_sizes(self):
+        """把论文总数按年份增长分配到 (会议, 年份) 文件：[(会议定义, 年份, 论文数), ...]"""
+        # 只生成 parse_papers 会处理的文件（不含2008年前没有卷号的VLDB）
+        slots = [(conference, year) for conference in CONFERENCES for year in range(FIRST_YEAR, LAST_YEAR + 1)
+                 if parse_filename(source_filename(conference, year)) is not None]
+        weights = [YEAR_GROWTH ** (year - FIRST_YEAR) for _, year in slots]
+        total = sum(weights)
+        sizes = [int(self.papers * weight / total) for weight in weights]
+        # 取整丢掉的条数补给最近的年份
+        for i in range(self.papers - sum(sizes)):
+            sizes[-1 - i % len(sizes)] += 1
+        return [(conference, year, size) for (conference, year), size in zip(slots, sizes) if size]
+
+    def paper(self, conference, year, number, volume=None):
+        name, _, prefix, doi_prefix = conference
+        authors = [self.author() for _ in range(1 + self._skewed(12))]
+        last_name = next(word for word in reversed(authors[0]['name'].split()) if not word.isdigit())
+        key = f"conf/{prefix}/{last_name.replace('-', '')}{number}-{str(year)[2:]}"
+        doi = f"{doi_prefix}.{year}.{number:05d}"
+        first_page = self.rng.randint(1, 1500)
+        paper = {
+            'conference': name,
+            'year': year,
+            'volume': volume,
+            'title': self.title(),
+            'authors': authors,
+            'doi': doi if self.rng.random() < 0.97 else '',
+            'url': f"https://dblp.org/rec/{key}",
+            'pages': f"{first_page}-{first_page + self.rng.randint(1, 14)}",
+            'type': 'Conference and Workshop Papers',
+            'key': key,
+            'venue': name,
+            'published_year': str(year),
+            'access': 'closed',
+        }
+        if paper['doi']:
+            paper['ee'] = f"https://doi.org/{doi}"
+        return paper
+
+    def hit_xml(self, paper):
+        """与 dblp 返回的 <hit> 元素相同的标签和顺序"""
+        self.next_id += 1
+        authors = ''.join(f'<author pid="{escape(a["pid"])}">{escape(a["name"])}</author>' for a in paper['authors'])
+        fields = [('title', paper['title']), ('venue', paper['venue']), ('pages', paper['pages']),
+                  ('year', paper['published_year']), ('type', paper['type']), ('access', paper['access']),
+                  ('key', paper['key']), ('doi', paper['doi']), ('ee', paper.get('ee')), ('url', paper['url'])]
+        info = ''.join(f'<{tag}>{escape(value)}</{tag}>' for tag, value in fields if value)
+        return (f'<hit score="1" id="{self.next_id}">\n<info><authors>{authors}</authors>{info}</info>\n'
+                f'<url>URL#{self.next_id}</url>\n</hit>\n')
+
+    def write(self, output_dir):
+        """
+        写出 <output_dir>/<会议>_PAPER/<会议>_<年份>.xml（VLDB 为 vldb_<年份>_vol<卷号>.xml）和 <output_dir>/papers.jsonl。
+        文件按 parse_papers.find_xml_files 的顺序生成，papers.jsonl 与解析这些XML的结果逐行一致。
+        返回 (文件数, 论文数)。
+        """
+        files = 0
+        total = 0
+        jsonl_tmp = os.path.join(output_dir, "papers.jsonl.part")
+        os.makedirs(output_dir, exist_ok=True)
+        with open(jsonl_tmp, 'w', encoding='utf-8') as jsonl:
+            for conference, year, size in self.file_sizes():
+                _, directory, prefix, _ = conference
+                filename = source_filename(conference, year)
+                volume = parse_filename(filename)[2]
+                path = os.path.join(output_dir, directory, filename)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as xml:
+                    xml.write('<?xml version="1.0" encoding="UTF-8"?>\n<result>\n')
+                    xml.write(f'<query id="1">:facetid:toc:"db/conf/{prefix}/{prefix}{year}.bht"</query>\n')
+                    xml.write('<status code="200">OK</status>\n')
+                    xml.write(f'<hits total="{size}" computed="{size}" sent="{size}" first="0">\n')
+                    for number in range(size):
+                        paper = self.paper(conference, year, number, volume)
+                        xml.write(self.hit_xml(paper))
+                        jsonl.write(json.dumps(paper, ensure_ascii=False) + '\n')
+                    xml.write('</hits>\n</result>\n')
+                files += 1
+                total += size
+        os.replace(jsonl_tmp, os.path.join(output_dir, "papers.jsonl"))
+        return files, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成 dblp 检索接口格式的合成语料（XML + papers.jsonl），用于基准测试")
+    parser.add_argument('--papers', type=int, default=100000, help="论文总数（如 10000 到 10000000）")
+    parser.add_argument('-o', '--output', default="bench_corpus", help="输出目录")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    files, papers = CorpusGenerator(args.papers, args.seed).write(args.output)
+    print(f"已生成 {files} 个XML文件、{papers} 篇论文到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import re
+import gzip
+import html
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from dblp_dump import iter_dump_papers
+from parse_papers import parse_paper
+
+DOCTYPE = '<?xml version="1.0" encoding="ISO-8859-1"?>\n<!DOCTYPE dblp SYSTEM "dblp.dtd">\n'
+
+# (记录类型, key, 目录URL, 字段, 作者, 期望的 (conference, year, volume)；None 表示应被过滤)
+RECORDS = [
+    ('inproceedings', 'conf/icde/MullerS20', 'db/conf/icde/icde2020.html#MullerS20',
+     {'title': 'Sch&ouml;ne <i>Joins</i> &amp; Co.', 'pages': '1-12', 'year': '2020', 'booktitle': 'ICDE',
+      'ee': 'https://doi.org/10.1109/ICDE48307.2020.00001'},
+     [('J&uuml;rgen M&uuml;ller', '12/3456'), ('Ren&eacute;e Stone', '78/9')], ('ICDE', 2020, None)),
+    ('inproceedings', 'conf/sigmod/Garcia23', 'db/conf/sigmod/sigmod2023c.html#Garcia23',
+     {'title': 'Caf&eacute; Queries.', 'pages': '5-9', 'year': '2023', 'booktitle': 'SIGMOD Conference Companion',
+      'ee': 'https://doi.org/10.1145/3555041.3589001'},
+     [('Hector Garc&iacute;a', '1/2')], ('SIGMOD', 2023, None)),
+    ('article', 'journals/pvldb/LeisK20', 'db/journals/pvldb/pvldb13.html#LeisK20',
+     {'title': 'Learned &ndash; Indexes.', 'pages': '100-113', 'year': '2020', 'journal': 'Proc. VLDB Endow.',
+      'ee': 'https://doi.org/10.14778/3407790.3407832'},
+     [('Viktor Leis', '3/4'), ('Tim Kraska', '5/6')], ('VLDB', 2020, 13)),
+    # 2008年前的 VLDB 会议论文集：parse_papers 不处理这些文件，导入时同样跳过
+    ('inproceedings', 'conf/vldb/Gray99', 'db/conf/vldb/vldb99.html#Gray99',
+     {'title': 'Old Paper.', 'year': '1999', 'booktitle': 'VLDB'}, [('Jim Gray', '7/8')], None),
+    # 前缀匹配但不在会议目录里（如研讨会），以及其他会议
+    ('inproceedings', 'conf/icde/WorkshopX20', 'db/conf/icde/icdew2020.html#WorkshopX20',
+     {'title': 'Workshop.', 'year': '2020', 'booktitle': 'ICDE Workshops'}, [('A B', '9/9')], None),
+    ('inproceedings', 'conf/kdd/Other20', 'db/conf/kdd/kdd2020.html#Other20',
+     {'title': 'Other.', 'year': '2020', 'booktitle': 'KDD'}, [('C D', '9/8')], None),
+]
+
+
+def dump_record(tag, key, url, fields, authors):
+    """dblp.xml 中的一条记录：字符实体按原样写出，由 DTD 定义"""
+    children = [f'<author pid="{pid}">{name}</author>' for name, pid in authors]
+    children += [f'<{name}>{value}</{name}>' for name, value in fields.items()]
+    children.append(f'<url>{url}</url>')
+    return f'<{tag} mdate="2024-01-01" key="{key}">\n' + '\n'.join(children) + f'\n</{tag}>\n'
+
+
+def api_hit(tag, key, fields, authors):
+    """同一条记录在检索接口中的样子（<hit>），实体已替换为字符"""
+    def text(value):
+        # 检索接口返回纯文本：去掉 <i> 等标记，实体替换为字符
+        return escape(html.unescape(re.sub(r'</?\w+>', '', value)))
+
+    info = ''.join(f'<author pid="{pid}">{text(name)}</author>' for name, pid in authors)
+    venue = fields.get('booktitle') or fields.get('journal')
+    types = {'article': 'Journal Articles', 'inproceedings': 'Conference and Workshop Papers'}
+    doi = fields['ee'].split('.org/', 1)[1]
+    return (f'<hit><info><authors>{info}</authors><title>{text(fields["title"])}</title>'
+            f'<venue>{escape(venue)}</venue><pages>{fields["pages"]}</pages><year>{fields["year"]}</year>'
+            f'<type>{types[tag]}</type><access>closed</access><key>{key}</key><doi>{doi}</doi>'
+            f'<ee>{fields["ee"]}</ee><url>https://dblp.org/rec/{key}</url></info></hit>')
+
+
+def write_dump(path, records):
+    with gzip.open(path, 'wt', encoding='iso-8859-1') as f:
+        f.write(DOCTYPE)
+        f.write('<dblp>\n')
+        for tag, key, url, fields, authors, _ in records:
+            f.write(dump_record(tag, key, url, fields, authors))
+        f.write('</dblp>\n')
+
+
+def test_dump_matches_parse_paper(tmp_path):
+    path = str(tmp_path / "dblp.xml.gz")
+    write_dump(path, RECORDS)
+
+    papers = list(iter_dump_papers(path))
+    expected = [parse_paper(ET.fromstring(api_hit(tag, key, fields, authors)), *source)
+                for tag, key, _, fields, authors, source in RECORDS if source is not None]
+    assert papers == expected
+    assert papers[0]['title'] == 'Schöne Joins & Co.'
+    assert papers[0]['authors'][0] == {'name': 'Jürgen Müller', 'pid': '12/3456'}
+
+
+def test_dump_streams_many_records(tmp_path):
+    # 大量不相关的记录夹在中间，只取出目标会议的记录，且顺序不变
+    filler = ('inproceedings', 'conf/kdd/X{}', 'db/conf/kdd/kdd2020.html#X{}', {'title': 'Filler.', 'year': '2020'},
+              [('E F', '1/1')], None)
+    records = []
+    for i in range(2000):
+        tag, key, url, fields, authors, source = filler
+        records.append((tag, key.format(i), url.format(i), fields, authors, source))
+        if i % 500 == 0:
+            records.append(RECORDS[0])
+    path = str(tmp_path / "dblp.xml.gz")
+    write_dump(path, records)
+
+    papers = list(iter_dump_papers(path, ['icde']))
+    assert [paper['key'] for paper in papers] == ['conf/icde/MullerS20'] * 4
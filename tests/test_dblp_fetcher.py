@@ -0,0 +1,242 @@
+import os
+import re
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from dblp_fetcher import DblpFetcher, FetchManifest, Venue, FETCHED, UNCHANGED, FAILED, split_hits, count_hits, hits_attrs
+from synthetic_corpus import CONFERENCES, CorpusGenerator
+
+KEY_RE = re.compile(rb'<key>(.*?)</key>')
+
+
+class DblpStandIn:
+    """
+    本地的 dblp 检索接口替身：按 h/f 参数分页返回预先生成的条目，
+    每次响应的 <time> 和 <query id> 都不同（与真实接口一样）。
+    scripted 中的 (状态码, 响应头) 会依次用于之后的请求，用来模拟 429/5xx。
+    """
+
+    def __init__(self, total, etag='"v1"'):
+        generator = CorpusGenerator(total, seed=1)
+        self.hits = [generator.hit_xml(generator.paper(CONFERENCES[0], 2020, i)).encode() for i in range(total)]
+        self.etag = etag
+        self.scripted = []
+        self.requests = []
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/search/publ/api"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def page(self, first, size):
+        body = b''.join(self.hits[first:first + size])
+        sent = count_hits(body)
+        return (b'<?xml version="1.0" encoding="UTF-8"?>\n<result>\n'
+                b'<query id="%d">:facetid:toc:"db/conf/icde/icde2020.bht"</query>\n'
+                b'<status code="200">OK</status>\n<time unit="msecs">%d</time>\n'
+                b'<hits total="%d" computed="%d" sent="%d" first="%d">\n%s</hits>\n</result>\n'
+                % (len(self.requests), time.perf_counter_ns() % 1000, len(self.hits), len(self.hits), sent, first,
+                   body))
+
+    def handle(self, request):
+        params = {name: values[0] for name, values in parse_qs(urlparse(request.path).query).items()}
+        with self.lock:
+            self.requests.append((params, dict(request.headers)))
+            scripted = self.scripted.pop(0) if self.scripted else None
+        if scripted is not None:
+            status, headers = scripted
+            request.send_response(status)
+            for name, value in headers.items():
+                request.send_header(name, value)
+            request.send_header('Content-Length', '0')
+            request.end_headers()
+            return
+        if self.etag and request.headers.get('If-None-Match') == self.etag:
+            request.send_response(304)
+            request.end_headers()
+            return
+        content = self.page(int(params.get('f', 0)), int(params['h']))
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/xml')
+        request.send_header('Content-Length', str(len(content)))
+        if self.etag:
+            request.send_header('ETag', self.etag)
+        request.end_headers()
+        request.wfile.write(content)
+
+
+@pytest.fixture
+def venue(tmp_path):
+    return Venue(
+        name='TEST',
+        output_dir=str(tmp_path / "TEST_PAPER"),
+        build_query=lambda year: f"toc:db/conf/test/test{year}.bht:",
+        build_filename=lambda year: f"test_{year}.xml",
+        first_year=2000,
+    )
+
+
+def make_stand_in(request, total, **kwargs):
+    stand_in = DblpStandIn(total, **kwargs)
+    request.addfinalizer(stand_in.close)
+    return stand_in
+
+
+def make_fetcher(stand_in, tmp_path, **kwargs):
+    kwargs.setdefault('manifest', FetchManifest(str(tmp_path / "fetch_manifest.json")))
+    return DblpFetcher(stand_in.url, workers=4, rate=1000, burst=10, backoff=0.01, **kwargs)
+
+
+def read_hits(path):
+    with open(path, 'rb') as f:
+        _, tag, body, _ = split_hits(f.read())
+    return hits_attrs(tag), body
+
+
+def test_pagination_merges_all_pages(request, tmp_path, venue):
+    stand_in = make_stand_in(request, 2500)
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FETCHED
+
+    attrs, body = read_hits(venue.output_path(2020))
+    assert count_hits(body) == 2500
+    assert attrs['total'] == 2500 and attrs['sent'] == 2500 and attrs['first'] == 0
+    # 条目按原顺序完整拼接
+    assert KEY_RE.findall(body) == KEY_RE.findall(b''.join(stand_in.hits))
+    assert sorted(int(params.get('f', 0)) for params, _ in stand_in.requests) == [0, 1000, 2000]
+    assert not os.path.exists(venue.output_path(2020) + '.part')
+
+
+def test_retry_after_pauses_and_retries(request, tmp_path, venue):
+    stand_in = make_stand_in(request, 10)
+    stand_in.scripted = [(429, {'Retry-After': '1'}), (503, {})]
+    start = time.monotonic()
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FETCHED
+    # 429 要求等待 1 秒，503 没有 Retry-After 时按指数退避
+    assert time.monotonic() - start >= 0.9
+    assert len(stand_in.requests) == 3
+    assert count_hits(read_hits(venue.output_path(2020))[1]) == 10
+
+
+def test_retries_exhausted_fails_without_partial_file(request, tmp_path, venue):
+    stand_in = make_stand_in(request, 10)
+    stand_in.scripted = [(429, {'Retry-After': '0'})] * 3
+    with make_fetcher(stand_in, tmp_path, max_retries=2) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FAILED
+    assert len(stand_in.requests) == 3
+    assert not os.path.exists(venue.output_path(2020))
+    assert not os.path.exists(venue.output_path(2020) + '.part')
+
+
+def test_failed_page_keeps_old_file_and_resumes(request, tmp_path, venue):
+    stand_in = make_stand_in(request, 1500, etag=None)
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FETCHED
+    with open(venue.output_path(2020), 'rb') as f:
+        original = f.read()
+
+    # 第二页一直失败：不留下半个文件，已有的文件保持原样
+    stand_in.hits.append(stand_in.hits[0])
+
+    def fail_second_page(handler, original_handle=stand_in.handle):
+        if 'f=1000' in handler.path:
+            handler.send_response(500)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        original_handle(handler)
+
+    stand_in.handle = fail_second_page
+    with make_fetcher(stand_in, tmp_path, max_retries=1) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FAILED
+    with open(venue.output_path(2020), 'rb') as f:
+        assert f.read() == original
+    assert os.listdir(venue.output_dir) == ["test_2020.xml"]
+
+    # 恢复后重新运行，得到新的完整内容
+    del stand_in.handle
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FETCHED
+    assert count_hits(read_hits(venue.output_path(2020))[1]) == 1501
+
+
+def test_refresh_sends_conditional_request(request, tmp_path, venue):
+    stand_in = make_stand_in(request, 10)
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FETCHED
+        fetcher.manifest.save()
+    mtime = os.stat(venue.output_path(2020)).st_mtime_ns
+
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download_year(venue, 2020) == UNCHANGED
+    assert stand_in.requests[-1][1].get('If-None-Match') == '"v1"'
+    assert os.stat(venue.output_path(2020)).st_mtime_ns == mtime
+
+
+def test_volatile_elements_do_not_change_fingerprint(request, tmp_path, venue):
+    # 没有 ETag 时只能比较内容：<time> 和 <query id> 每次都变，条目不变时不改写文件
+    stand_in = make_stand_in(request, 10, etag=None)
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FETCHED
+    with open(venue.output_path(2020), 'rb') as f:
+        first = f.read()
+
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download_year(venue, 2020) == UNCHANGED
+    with open(venue.output_path(2020), 'rb') as f:
+        assert f.read() == first
+
+
+def test_single_year_download_saves_manifest(request, tmp_path, venue):
+    stand_in = make_stand_in(request, 10)
+    with make_fetcher(stand_in, tmp_path) as fetcher:
+        assert fetcher.download(venue, 2020)
+
+    # 单年下载同样保存清单，下一次运行发条件请求
+    manifest = FetchManifest(str(tmp_path / "fetch_manifest.json"))
+    assert manifest.get(venue.output_path(2020))['etag'] == '"v1"'
+    with make_fetcher(stand_in, tmp_path, manifest=manifest) as fetcher:
+        assert fetcher.download(venue, 2020)
+    assert stand_in.requests[-1][1].get('If-None-Match') == '"v1"'
+
+
+def test_failed_page_waits_for_other_pages(request, tmp_path, venue):
+    stand_in = make_stand_in(request, 5500, etag=None)
+    active = []
+
+    def slow_pages(handler, original_handle=stand_in.handle):
+        # 第二页立即失败，其余分页慢一些，失败时它们还在下载
+        if 'f=1000' in handler.path:
+            handler.send_response(500)
+            handler.send_header('Content-Length', '0')
+            handler.end_headers()
+            return
+        active.append(handler.path)
+        if 'f=' in handler.path:
+            time.sleep(0.3)
+        original_handle(handler)
+        active.remove(handler.path)
+
+    stand_in.handle = slow_pages
+    with make_fetcher(stand_in, tmp_path, max_retries=0) as fetcher:
+        assert fetcher.download_year(venue, 2020) == FAILED
+        # 返回时没有仍在进行的分页请求，临时目录已删除
+        assert active == []
+    assert os.listdir(venue.output_dir) == []
@@ -0,0 +1,57 @@
+import sys
+import json
+
+import numpy as np
+
+import embedding_cache
+import generate_embeddings
+from bench_pipeline import StubModel
+from embedding_cache import EmbeddingCache, text_hash
+from generate_embeddings import create_paper_text, load_papers, stream_embeddings, iter_paper_texts
+from pdf_text import load_fulltext
+
+MODEL = 'stub-model'
+
+
+def write_inputs(tmp_path, count=20):
+    papers_file = tmp_path / "papers.jsonl"
+    fulltext_file = tmp_path / "pdf_texts.jsonl"
+    with open(papers_file, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(json.dumps({'conference': 'ICDE', 'year': 2020, 'title': f"Paper {i}",
+                                'authors': [{'name': f"Author {i}", 'pid': str(i)}],
+                                'doi': f"10.1/{i}", 'url': f"https://dblp.org/rec/conf/icde/P{i}"}) + '\n')
+    # 一半的论文有PDF摘要
+    with open(fulltext_file, 'w', encoding='utf-8') as f:
+        for i in range(0, count, 2):
+            f.write(json.dumps({'embedding_key': f"10.1/{i}", 'abstract': f"Abstract of paper {i}."}) + '\n')
+    return str(papers_file), str(fulltext_file)
+
+
+def test_compact_keeps_fulltext_entries(tmp_path, monkeypatch):
+    papers_file, fulltext_file = write_inputs(tmp_path)
+    cache_dir = str(tmp_path / "cache")
+    monkeypatch.setattr(generate_embeddings, '_worker_model', StubModel(dim=16))
+
+    fulltext = load_fulltext(fulltext_file)
+    stream_embeddings(iter_paper_texts(papers_file), str(tmp_path / "plain.bin"), MODEL, cache_dir=cache_dir)
+    stream_embeddings(iter_paper_texts(papers_file, fulltext), str(tmp_path / "full.bin"), MODEL,
+                      cache_dir=cache_dir)
+
+    papers = load_papers(papers_file)
+    plain = [text_hash(create_paper_text(paper)) for paper in papers.values()]
+    full = [text_hash(create_paper_text(paper, fulltext.get(key))) for key, paper in papers.items()]
+    # 多出一条已不再引用的条目，compact 应当只删掉它
+    with EmbeddingCache(cache_dir, MODEL).appender(16) as writer:
+        writer.write(['stale'], np.zeros((1, 16), dtype=np.float32))
+
+    monkeypatch.setattr(sys, 'argv', ['embedding_cache.py', 'compact', '--input', papers_file,
+                                      '--cache-dir', cache_dir, '--model', MODEL, '--fulltext', fulltext_file])
+    embedding_cache.main()
+
+    cache = EmbeddingCache(cache_dir, MODEL)
+    assert len(cache) == len(set(plain) | set(full))
+    _, hit = cache.lookup(plain + full)
+    assert hit.all()
+    _, hit = cache.lookup(['stale'])
+    assert not hit.any()